@@ -1,5 +1,6 @@
 from compyl.__lexer.errors import LexerError, LexerSyntaxError, LexerBuildError, RegexpParsingError
-from compyl.lexer import Lexer, Token
+from compyl.lexer import Lexer, CompiledLexer, LexSession, Token, TokenArray, TokenCounts, LexerStats, \
+    set_artifact_directory
 
 from compyl.__parser.error import ParserError, ParserSyntaxError, ParserBuildError, GrammarError
 from compyl.parser import Parser
@@ -7,4 +8,5 @@ from compyl.parser import Parser
 __version__ = '0.3.0'
 
 __all__ = ['Parser', 'ParserError', 'ParserSyntaxError', 'ParserBuildError', 'GrammarError',
-           'Token', 'Lexer', 'LexerError', 'LexerSyntaxError', 'LexerBuildError', 'RegexpParsingError']
\ No newline at end of file
+           'Token', 'TokenArray', 'TokenCounts', 'LexerStats', 'Lexer', 'CompiledLexer', 'LexSession', 'LexerError',
+           'LexerSyntaxError', 'LexerBuildError', 'RegexpParsingError', 'set_artifact_directory']
\ No newline at end of file
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from compyl.__lexer.dfa_table import DFATable, BLOCK_COUNT, BLOCK_SIZE, NO_STATE, get_terminal_token_type
+from compyl.__lexer.errors import LexerArtifactError
+from compyl.__lexer.regexp import MAX_UNICODE
+
+# ======================================================================================================================
+# Binary artifact of a compiled DFA
+# ======================================================================================================================
+
+# An artifact stores the DFATable of a rule set, so that a Lexer can skip building the NFA and the DFA of its rules.
+# Its layout is:
+#
+#   header      magic, version and size of the metadata, see HEADER
+#   metadata    utf-8 JSON holding the scalars of the table, its token types, the rule-reference table and the offset of
+#               every array
+#   arrays      the raw integer arrays of the table in native byte order, each aligned on ALIGNMENT bytes
+#
+# Terminal tokens and special actions are functions which cannot be stored, the rule-reference table stores the index
+# of the rule they come from instead, and they are recovered from the rules of the Lexer when the artifact is loaded.
+
+MAGIC = b'COMPYLDF'
+
+# Bumped whenever the layout or the construction of the DFA changes, so that older artifacts are rebuilt
+ARTIFACT_VERSION = 2
+
+HEADER = struct.Struct('<8sII')
+
+ALIGNMENT = 8
+
+# Arrays of the DFATable stored in the artifact with their typecode
+STORED_ARRAYS = (
+    ('block_index', 'i'),
+    ('blocks', 'i'),
+    ('transitions', 'i'),
+    ('accepting', 'b'),
+    ('segment_bounds', 'i'),
+    ('segment_classes', 'i'),
+)
+
+
+def get_rules_key(rules):
+    """
+    Return a hex digest identifying the DFA of the rules, computed from their patterns, order and tags, the token types
+    of their terminals and which rules share a same terminal token. Functions are not part of the key, they are
+    recovered from the rules when the artifact is loaded.
+    """
+    terminals = [rule[1] for rule in rules]
+    description = []
+
+    for rule in rules:
+        terminal = rule[1]
+        token_type = get_terminal_token_type(terminal)
+        shared_with = next(other for other, candidate in enumerate(terminals) if candidate is terminal)
+
+        description.append((
+            rule[0],
+            rule[2] if len(rule) > 2 else None,
+            token_type if isinstance(token_type, str) or token_type is None else repr(type(token_type)),
+            callable(terminal),
+            shared_with
+        ))
+
+    digest = hashlib.sha256(repr((ARTIFACT_VERSION, description)).encode('utf-8', 'backslashreplace'))
+
+    return digest.hexdigest()
+
+
+def get_artifact_path(directory, rules):
+    return os.path.join(directory, 'compyl_dfa_%s.bin' % get_rules_key(rules)[:32])
+
+
+def dump_table(table, rules):
+    """
+    Return the artifact of the DFATable built from the rules as bytes. Raise LexerArtifactError if a terminal token or
+    special action of the table does not come from the rules or if a token type cannot be stored.
+    """
+    rule_indices = {}
+
+    for index, rule in enumerate(rules):
+        rule_indices.setdefault(id(rule[1]), index)
+
+    def get_rule_index(function):
+        if function is None:
+            return None
+
+        try:
+            return rule_indices[id(function)]
+        except KeyError:
+            raise LexerArtifactError("terminal token %r is not the token of a rule" % (function,))
+
+    if not all(isinstance(token_type, str) for token_type in table.token_types):
+        raise LexerArtifactError("token types must be strings to be stored")
+
+    chunks = []
+    offsets = []
+    position = 0
+
+    for name, typecode in STORED_ARRAYS:
+        data = getattr(table, name)
+
+        if data.typecode != typecode:
+            raise LexerArtifactError("array %s is expected to have typecode %s" % (name, typecode))
+
+        raw = data.tobytes()
+        padding = -len(raw) % ALIGNMENT
+
+        offsets.append([name, typecode, position, len(data)])
+        chunks.append(raw + b'\0' * padding)
+        position += len(raw) + padding
+
+    metadata = {
+        'byteorder': sys.byteorder,
+        'itemsizes': {typecode: array(typecode).itemsize for _, typecode in STORED_ARRAYS},
+        'rule_count': len(rules),
+        'start': table.start,
+        'class_count': table.class_count,
+        'token_types': list(table.token_types),
+        'terminals': [get_rule_index(terminal) for terminal in table.terminals],
+        'special_actions': [None if actions is None else [get_rule_index(action) for action in actions]
+                            for actions in table.special_actions],
+        'terminal_rules': list(table.terminal_rules),
+        'arrays': offsets,
+    }
+
+    encoded = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-(HEADER.size + len(encoded)) % ALIGNMENT)
+
+    return HEADER.pack(MAGIC, ARTIFACT_VERSION, len(encoded)) + encoded + b''.join(chunks)
+
+
+def load_table(data, rules):
+    """
+    Return the DFATable stored in the artifact data, a bytes-like object, the functions being recovered from the
+    rules. Raise LexerArtifactError if the artifact is invalid, of another version or platform, or was not built for
+    the rules.
+    """
+    view = memoryview(data)
+
+    try:
+        metadata, arrays = _read_arrays(view, rules)
+        _check_table(metadata, arrays, len(rules))
+        terminals = [_get_rule_function(rules, index) for index in metadata['terminals']]
+        special_actions = [None if indices is None else tuple(_get_rule_function(rules, index) for index in indices)
+                           for indices in metadata['special_actions']]
+
+        return DFATable.from_arrays(metadata['start'], metadata['class_count'], arrays, terminals, special_actions,
+                                    metadata['token_types'], metadata['terminal_rules'])
+
+    except (KeyError, IndexError, TypeError, ValueError, struct.error):
+        raise LexerArtifactError("artifact is corrupted")
+
+    finally:
+        view.release()
+
+
+def _get_rule_function(rules, index):
+    return None if index is None else rules[index][1]
+
+
+def _check_table(metadata, arrays, rule_count):
+    """
+    Raise LexerArtifactError if the arrays and metadata of the artifact do not form a consistent DFATable, so that a
+    corrupted or forged artifact cannot make the Lexer index out of its arrays or call a function of another rule
+    """
+    start, class_count, token_types = metadata['start'], metadata['class_count'], metadata['token_types']
+
+    if {name for name, _ in STORED_ARRAYS} != arrays.keys():
+        raise LexerArtifactError("artifact does not hold the arrays of a table")
+
+    block_index, blocks, transitions, accepting = (arrays[name] for name in ('block_index', 'blocks', 'transitions',
+                                                                              'accepting'))
+    segment_bounds, segment_classes = arrays['segment_bounds'], arrays['segment_classes']
+    state_count = len(accepting)
+
+    if type(class_count) is not int or class_count <= 0 or not _is_index(start, state_count):
+        raise LexerArtifactError("artifact has an invalid start state or class count")
+
+    if len(transitions) != state_count * class_count or any(flag not in (0, 1) for flag in accepting):
+        raise LexerArtifactError("artifact has invalid transitions")
+
+    if min(transitions, default=NO_STATE) < NO_STATE or max(transitions, default=NO_STATE) >= state_count:
+        raise LexerArtifactError("artifact has transitions to unknown states")
+
+    block_offsets_valid = all(0 <= offset < len(blocks) and not offset % BLOCK_SIZE for offset in block_index)
+
+    if len(block_index) != BLOCK_COUNT or not blocks or len(blocks) % BLOCK_SIZE or not block_offsets_valid:
+        raise LexerArtifactError("artifact has an invalid class map")
+
+    bounds_valid = len(segment_bounds) == len(segment_classes) + 1 and segment_bounds[0] == 0 and \
+        segment_bounds[-1] == MAX_UNICODE + 1 and all(map(int.__lt__, segment_bounds, segment_bounds[1:]))
+
+    if not bounds_valid:
+        raise LexerArtifactError("artifact has invalid segments")
+
+    if not all(0 <= cls < class_count for classes in (blocks, segment_classes) for cls in classes):
+        raise LexerArtifactError("artifact has classes out of range")
+
+    if any(len(metadata[name]) != state_count for name in ('terminals', 'special_actions', 'terminal_rules')):
+        raise LexerArtifactError("artifact does not have a terminal, special actions and rule for every state")
+
+    indices = [index for index in metadata['terminals'] + metadata['terminal_rules'] if index is not None]
+    indices += [index for actions in metadata['special_actions'] if actions is not None for index in actions]
+
+    if not all(_is_index(index, rule_count) for index in indices):
+        raise LexerArtifactError("artifact refers to unknown rules")
+
+    if not all(isinstance(token_type, str) for token_type in token_types) or len(set(token_types)) != len(token_types):
+        raise LexerArtifactError("artifact has invalid token types")
+
+
+def _is_index(value, length):
+    return type(value) is int and 0 <= value < length
+
+
+def _read_arrays(view, rules):
+    """
+    Return the metadata and the dict of the arrays of the artifact
+    """
+    if len(view) < HEADER.size:
+        raise LexerArtifactError("artifact is truncated")
+
+    magic, version, metadata_size = HEADER.unpack_from(view)
+
+    if magic != MAGIC or version != ARTIFACT_VERSION:
+        raise LexerArtifactError("artifact has an unknown format or version")
+
+    try:
+        metadata = json.loads(bytes(view[HEADER.size:HEADER.size + metadata_size]).decode('utf-8'))
+    except ValueError:
+        raise LexerArtifactError("artifact metadata is corrupted")
+
+    if metadata['byteorder'] != sys.byteorder or any(
+            array(typecode).itemsize != size for typecode, size in metadata['itemsizes'].items()):
+        raise LexerArtifactError("artifact was built on another platform")
+
+    if metadata['rule_count'] != len(rules):
+        raise LexerArtifactError("artifact was not built for these rules")
+
+    base = HEADER.size + metadata_size
+    arrays = {}
+
+    for name, typecode, offset, length in metadata['arrays']:
+        values = array(typecode)
+        end = base + offset + length * values.itemsize
+
+        if end > len(view):
+            raise LexerArtifactError("artifact is truncated")
+
+        values.frombytes(view[base + offset:end])
+        arrays[name] = values
+
+    return metadata, arrays
+
+
+def read_artifact(path, rules):
+    """
+    Return the DFATable stored in the artifact file at path, which is mapped in memory, None if there is no such file.
+    Raise LexerArtifactError if it cannot be loaded.
+    """
+    try:
+        file = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    with file:
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise LexerArtifactError("artifact is empty")
+
+        with mapped:
+            return load_table(mapped, rules)
+
+
+def write_artifact(path, table, rules):
+    """
+    Write the artifact of the table to path, aside then renamed so that a concurrent process never reads a partial one
+    """
+    data = dump_table(table, rules)
+    directory = os.path.dirname(path)
+
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+
+        os.replace(tmp_path, path)
+
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        raise
@@ -0,0 +1,56 @@
+import os
+import stat
+
+# ======================================================================================================================
+# Private cache directory
+# ======================================================================================================================
+
+# Generated modules are imported and artifacts are loaded from the cache directory, thus it must not be writable by
+# other users: it is created private to its owner and it is checked, as are the files it holds, before being read.
+
+DIRECTORY_MODE = 0o700
+
+
+def get_user_cache_dir():
+    """
+    Return the per-user cache directory of compyl, $XDG_CACHE_HOME/compyl or ~/.cache/compyl
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'compyl')
+
+
+DEFAULT_CACHE_DIR = get_user_cache_dir()
+
+
+def make_private_directory(path):
+    """
+    Create the directory at path with mode DIRECTORY_MODE if it does not exist and return True if it can be trusted,
+    see is_trusted_path. Return False if it cannot be created.
+    """
+    try:
+        os.makedirs(path, mode=DIRECTORY_MODE, exist_ok=True)
+    except OSError:
+        return False
+
+    return is_trusted_path(path, directory=True)
+
+
+def is_trusted_path(path, directory=False):
+    """
+    Return True if path is a regular file, or a directory if directory is True, which is owned by the current user and
+    is not writable by its group or by other users. Symbolic links are not followed. Ownership is not checked on
+    platforms without user ids.
+    """
+    try:
+        status = os.lstat(path)
+    except OSError:
+        return False
+
+    if not (stat.S_ISDIR(status.st_mode) if directory else stat.S_ISREG(status.st_mode)):
+        return False
+
+    if not hasattr(os, 'getuid'):
+        return True
+
+    return status.st_uid == os.getuid() and not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
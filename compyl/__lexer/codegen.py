@@ -0,0 +1,315 @@
+import hashlib
+import importlib.util
+import os
+import tempfile
+
+from compyl.__lexer.cache_directory import DEFAULT_CACHE_DIR, make_private_directory, is_trusted_path
+from compyl.__lexer.regexp import MAX_UNICODE
+
+# ======================================================================================================================
+# Generated scanner
+# ======================================================================================================================
+
+# Bumped whenever the generated source changes, so that modules written by a previous version are not imported
+CODEGEN_VERSION = 1
+
+# Above this number of characters, a set of intervals is tested with comparisons or bisect instead of a frozenset
+MAX_SET_SIZE = 256
+
+# Above this number of intervals, a set of intervals is tested with bisect on its bounds
+MAX_COMPARED_INTERVALS = 4
+
+# States with at least this many targets dispatch on a dict if all their transitions are small sets of characters
+MIN_DICT_TARGETS = 4
+
+
+def get_table_fingerprint(table):
+    """
+    Return a hex digest identifying the DFATable, the generated scanner of a table only depends on its fingerprint
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((CODEGEN_VERSION, table.start, table.state_count, table.class_count)).encode())
+
+    for array in (table.block_index, table.blocks, table.transitions, table.accepting):
+        digest.update(array.tobytes())
+
+    digest.update(bytes(actions is not None for actions in table.special_actions))
+
+    return digest.hexdigest()
+
+
+def load_generated_scanner(table, cache_dir=None):
+    """
+    Return the match function of the scanner generated for the DFA, see generate_scanner_source.
+    The module is written to cache_dir, by default the per-user cache directory, under the fingerprint of the table and
+    imported from there, thus it is only generated once per rule set. The directory is created private to the current
+    user, and neither it nor the module is imported from if it is owned or writable by another user, see
+    compyl.__lexer.cache_directory. In that case, or if the directory cannot be written, the source is executed without
+    being cached.
+    """
+    cache_dir = DEFAULT_CACHE_DIR if cache_dir is None else cache_dir
+    fingerprint = get_table_fingerprint(table)
+    module_name = 'compyl_scanner_%s' % fingerprint[:32]
+    path = os.path.join(cache_dir, module_name + '.py')
+
+    if not make_private_directory(cache_dir):
+        return _exec_scanner(generate_scanner_source(table, fingerprint), path)
+
+    if not os.path.lexists(path):
+        source = generate_scanner_source(table, fingerprint)
+
+        try:
+            # Written aside then renamed, so that a concurrent process never imports a partial module
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(source)
+            os.replace(tmp_path, path)
+
+        except OSError:
+            return _exec_scanner(source, path)
+
+    if not is_trusted_path(path):
+        return _exec_scanner(generate_scanner_source(table, fingerprint), path)
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module.match
+
+
+def _exec_scanner(source, path):
+    namespace = {}
+    exec(compile(source, path, 'exec'), namespace)
+
+    return namespace['match']
+
+
+def generate_scanner_source(table, fingerprint=None):
+    """
+    Return the source of a Python module which function match(buffer, pos, trigger, lineno) steps through the DFA from
+    its start state at pos and returns a tuple (state, pos) once no legal transition exists or the end of the buffer is
+    reached, as Lexer._advance does. States are numbered as in the DFATable.
+
+    Every state is specialized code: its transitions are tested with constant interval bounds, frozensets or a dict
+    from characters to states, and a transition of a state to itself is an inner loop. trigger(state, pos,
+    init_pos, lineno) is called when a state holding trigger_on_contain actions is attained and returns the new pos.
+    """
+    writer = _SourceWriter()
+
+    writer.line('# Scanner generated by compyl from the DFA of a lexer, do not edit')
+    writer.line('# fingerprint: %s' % (fingerprint or get_table_fingerprint(table)))
+    writer.line('from bisect import bisect_right')
+    writer.line('')
+    writer.mark_constants()
+    writer.line('')
+    writer.line('')
+    writer.line('def match(buffer, pos, trigger, lineno):')
+    writer.indent += 1
+    writer.line('init_pos = pos')
+    writer.line('length = len(buffer)')
+    writer.line('')
+
+    action_states = {state for state in range(table.state_count) if table.special_actions[state]}
+    class_intervals = table.get_class_intervals()
+    transitions = [table.get_state_transitions(state, class_intervals) for state in range(table.state_count)]
+
+    # The first step is always taken from the start state, thus it is written before the loop to skip the dispatch
+    _write_state(writer, table.start, transitions[table.start], action_states)
+
+    writer.line('')
+    writer.line('while True:')
+    writer.indent += 1
+
+    _write_dispatch(writer, 0, table.state_count, transitions, action_states)
+
+    return writer.get_source()
+
+
+def _write_dispatch(writer, low, high, transitions, action_states):
+    """
+    Write the code of the states from low to high excluded, dispatching on the state with a binary search
+    """
+    if high - low == 1:
+        _write_state(writer, low, transitions[low], action_states)
+        return
+
+    middle = (low + high) // 2
+
+    if middle - low == 1:
+        writer.line('if state == %d:' % low)
+    else:
+        writer.line('if state < %d:' % middle)
+
+    writer.indent += 1
+    _write_dispatch(writer, low, middle, transitions, action_states)
+    writer.indent -= 1
+
+    writer.line('else:')
+    writer.indent += 1
+    _write_dispatch(writer, middle, high, transitions, action_states)
+    writer.indent -= 1
+
+
+def _write_state(writer, state, transitions, action_states):
+    """
+    Write the code stepping from the given state, ending by a return or by moving to the next state and character
+    """
+    if not transitions:
+        writer.line('return %d, pos' % state)
+        return
+
+    writer.line('if pos >= length:')
+    writer.line('    return %d, pos' % state)
+    writer.line('c = buffer[pos]')
+
+    # A state looping on itself consumes characters in a tight loop, unless it must trigger actions on each of them
+    if state not in action_states:
+        for target, intervals in transitions:
+            if target == state:
+                writer.line('while %s:' % _get_condition(writer, intervals))
+                writer.line('    pos += 1')
+                writer.line('    if pos >= length:')
+                writer.line('        return %d, pos' % state)
+                writer.line('    c = buffer[pos]')
+
+                transitions = [transition for transition in transitions if transition[0] != state]
+                break
+
+        if not transitions:
+            writer.line('return %d, pos' % state)
+            return
+
+    size = sum(max_ascii - min_ascii + 1 for _, intervals in transitions for min_ascii, max_ascii in intervals)
+
+    if len(transitions) >= MIN_DICT_TARGETS and size <= MAX_SET_SIZE * len(transitions):
+        next_states = {
+            chr(code_point): target
+            for target, intervals in transitions
+            for min_ascii, max_ascii in intervals
+            for code_point in range(min_ascii, max_ascii + 1)
+        }
+
+        writer.line('state = %s.get(c, -1)' % writer.constant('NEXT', next_states))
+        writer.line('if state < 0:')
+        writer.line('    return %d, pos' % state)
+
+        targets_with_actions = sorted({target for target, _ in transitions} & action_states)
+
+        if targets_with_actions:
+            writer.line('if state in %s:' % writer.constant('ACTIONS', frozenset(targets_with_actions)))
+            writer.line('    pos = trigger(state, pos, init_pos, lineno)')
+
+    else:
+        for index, (target, intervals) in enumerate(transitions):
+            writer.line('%s %s:' % ('if' if index == 0 else 'elif', _get_condition(writer, intervals)))
+            writer.line('    state = %d' % target)
+
+            if target in action_states:
+                writer.line('    pos = trigger(%d, pos, init_pos, lineno)' % target)
+
+        writer.line('else:')
+        writer.line('    return %d, pos' % state)
+
+    writer.line('pos += 1')
+
+
+def _get_condition(writer, intervals):
+    """
+    Return the expression testing if the character c is in the intervals
+    """
+    size = sum(max_ascii - min_ascii + 1 for min_ascii, max_ascii in intervals)
+    complement = get_complement(intervals)
+    complement_size = sum(max_ascii - min_ascii + 1 for min_ascii, max_ascii in complement)
+
+    if complement_size == 1:
+        return 'c != %s' % ascii(chr(complement[0][0]))
+
+    if 0 < complement_size <= MAX_SET_SIZE and size > MAX_SET_SIZE:
+        characters = frozenset(chr(code_point) for min_ascii, max_ascii in complement
+                               for code_point in range(min_ascii, max_ascii + 1))
+        return 'c not in %s' % writer.constant('SET', characters)
+
+    if len(intervals) == 1:
+        min_ascii, max_ascii = intervals[0]
+
+        if min_ascii == max_ascii:
+            return 'c == %s' % ascii(chr(min_ascii))
+        elif max_ascii == MAX_UNICODE:
+            return '%s <= c' % ascii(chr(min_ascii))
+        elif min_ascii == 0:
+            return 'c <= %s' % ascii(chr(max_ascii))
+        else:
+            return '%s <= c <= %s' % (ascii(chr(min_ascii)), ascii(chr(max_ascii)))
+
+    if size <= MAX_SET_SIZE:
+        characters = frozenset(chr(code_point) for min_ascii, max_ascii in intervals
+                               for code_point in range(min_ascii, max_ascii + 1))
+        return 'c in %s' % writer.constant('SET', characters)
+
+    if len(intervals) <= MAX_COMPARED_INTERVALS:
+        return '(%s)' % ' or '.join(_get_condition(writer, [interval]) for interval in intervals)
+
+    # The character is in an interval if it is preceded by an odd number of bounds
+    bounds = []
+
+    for min_ascii, max_ascii in intervals:
+        bounds.append(chr(min_ascii))
+
+        if max_ascii < MAX_UNICODE:
+            bounds.append(chr(max_ascii + 1))
+
+    return 'bisect_right(%s, c) & 1' % writer.constant('BOUNDS', tuple(bounds))
+
+
+def get_complement(intervals):
+    """
+    Return the intervals of the code points which are not in the given sorted disjoint intervals
+    """
+    complement = []
+    lowest = 0
+
+    for min_ascii, max_ascii in intervals:
+        if min_ascii > lowest:
+            complement.append((lowest, min_ascii - 1))
+
+        lowest = max_ascii + 1
+
+    if lowest <= MAX_UNICODE:
+        complement.append((lowest, MAX_UNICODE))
+
+    return complement
+
+
+class _SourceWriter:
+    """
+    Accumulate the lines of the generated module, constants are declared at the marked position of the module
+    """
+    def __init__(self):
+        self.lines = []
+        self.constants = []
+        self.constants_position = None
+        self.indent = 0
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text if text else '')
+
+    def mark_constants(self):
+        self.constants_position = len(self.lines)
+
+    def constant(self, prefix, value):
+        name = '_%s_%d' % (prefix, len(self.constants))
+
+        if isinstance(value, frozenset):
+            value = 'frozenset(%s)' % ascii(''.join(sorted(value)) if prefix == 'SET' else sorted(value))
+        else:
+            value = ascii(value)
+
+        self.constants.append('%s = %s' % (name, value))
+
+        return name
+
+    def get_source(self):
+        lines = self.lines[:self.constants_position] + self.constants + self.lines[self.constants_position:]
+
+        return '\n'.join(lines) + '\n'
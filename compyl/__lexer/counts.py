@@ -0,0 +1,68 @@
+from collections import Counter
+
+# ======================================================================================================================
+# Token statistics
+# ======================================================================================================================
+
+
+class TokenCounts:
+    """
+    Statistics of the tokens found by Lexer.count, gathered without building the tokens
+
+    counts: dict mapping every token type to its number of tokens
+    lengths: dict mapping every token type to the total length of its tokens, in characters, or in bytes if bytes were
+        lexed
+    histograms: dict mapping every token type to a Counter of the lengths of its tokens, None if not requested
+    linebreaks: number of linebreaks counted by the lexer, through its linebreak or line_rule
+    """
+
+    def __init__(self, histograms=False):
+        self.counts = {}
+        self.lengths = {}
+        self.histograms = {} if histograms else None
+        self.linebreaks = 0
+
+    def __repr__(self):
+        return "<TokenCounts %d tokens of %d types>" % (self.total, len(self.counts))
+
+    @property
+    def total(self):
+        """
+        Total number of tokens
+        """
+        return sum(self.counts.values())
+
+    def add(self, token_type, length):
+        """
+        Count a token of the given type and length
+        """
+        counts = self.counts
+
+        if token_type in counts:
+            counts[token_type] += 1
+            self.lengths[token_type] += length
+        else:
+            counts[token_type] = 1
+            self.lengths[token_type] = length
+
+        if self.histograms is not None:
+            histogram = self.histograms.get(token_type)
+
+            if histogram is None:
+                histogram = self.histograms[token_type] = Counter()
+
+            histogram[length] += 1
+
+    def update(self, other):
+        """
+        Add the statistics of other, by example those of the next chunk of a text lexed in parallel
+        """
+        for token_type, count in other.counts.items():
+            self.counts[token_type] = self.counts.get(token_type, 0) + count
+            self.lengths[token_type] = self.lengths.get(token_type, 0) + other.lengths[token_type]
+
+        if self.histograms is not None and other.histograms is not None:
+            for token_type, histogram in other.histograms.items():
+                self.histograms.setdefault(token_type, Counter()).update(histogram)
+
+        self.linebreaks += other.linebreaks
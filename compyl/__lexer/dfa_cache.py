@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+
+from compyl.__lexer.finite_automaton import DFA
+from compyl.__lexer.artifact import get_artifact_path, read_artifact, write_artifact
+from compyl.__lexer.cache_directory import DEFAULT_CACHE_DIR, make_private_directory, is_trusted_path
+from compyl.__lexer.errors import LexerArtifactError
+
+# ======================================================================================================================
+# Compiled DFA cache
+# ======================================================================================================================
+
+# Number of distinct rule sets whose DFA is kept by the process-wide cache
+DEFAULT_MAX_SIZE = 64
+
+
+def get_rules_fingerprint(rules):
+    """
+    Return a hashable key identifying the DFA built from the rules. Two rule sets have the same key if they have the
+    same patterns and tags in the same order and if their terminal tokens behave the same: the functions built by the
+    MetaLexer are identified by their token type and instruction, any other terminal token by itself.
+    """
+    fingerprint = []
+
+    for rule in rules:
+        pattern, terminal = rule[0], rule[1]
+        tag = rule[2] if len(rule) > 2 else None
+
+        if hasattr(terminal, 'token_type') and hasattr(terminal, 'instruction'):
+            terminal = ('terminal', terminal.token_type, terminal.instruction)
+
+        fingerprint.append((pattern, terminal, tag))
+
+    return tuple(fingerprint)
+
+
+class DFACache:
+    """
+    Process-wide registry of the DFA built for every rule set, by fingerprint, which lets Lexer classes with identical
+    rules share a single DFA. Once the cache holds max_size rule sets, the least recently used one is evicted.
+    The DFA are shared read-only: nothing in the Lexer mutates a built DFA, the byte tables and generated scanners it
+    compiles on demand being caches themselves.
+
+    If directory is set, the tables of the DFA are also stored as artifacts in it, see compyl.__lexer.artifact, and a
+    rule set met for the first time in the process is loaded from its artifact instead of being built if it exists. The
+    process-wide dfa_cache stores them in the per-user cache directory, see set_artifact_directory. The directory is
+    created private to the current user and is not used if another user owns it or can write to it, nor is an artifact
+    another user can write, see compyl.__lexer.cache_directory.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, directory=None):
+        self.max_size = max_size
+        self.directory = directory
+        self._dfas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._dfas)
+
+    def get(self, rules):
+        """
+        Return the DFA of the rules, building it if no rule set with the same fingerprint is cached
+        """
+        try:
+            fingerprint = get_rules_fingerprint(rules)
+            hash(fingerprint)
+
+        except TypeError:
+            # A terminal token which is not hashable cannot be compared, the rules are not cached
+            return self.build(rules)
+
+        with self._lock:
+            dfa = self._dfas.get(fingerprint)
+
+            if dfa is not None:
+                self._dfas.move_to_end(fingerprint)
+                return dfa
+
+        # The DFA is built outside of the lock, two threads may then build the same DFA but only one is kept
+        dfa = self.build(rules)
+
+        with self._lock:
+            dfa = self._dfas.setdefault(fingerprint, dfa)
+            self._dfas.move_to_end(fingerprint)
+
+            while len(self._dfas) > max(self.max_size, 0):
+                self._dfas.popitem(last=False)
+
+        return dfa
+
+    def build(self, rules):
+        """
+        Return the DFA of the rules, made from their artifact if it exists and can be trusted, built and stored as
+        artifact otherwise
+        """
+        if self.directory is None or not make_private_directory(self.directory):
+            return DFA(rules=rules)
+
+        path = get_artifact_path(self.directory, rules)
+
+        try:
+            table = read_artifact(path, rules) if is_trusted_path(path) else None
+
+        except (LexerArtifactError, OSError):
+            # An invalid artifact is replaced
+            table = None
+
+        if table is not None:
+            return DFA.from_table(table, rules)
+
+        dfa = DFA(rules=rules)
+
+        try:
+            if dfa.table is not None:
+                write_artifact(path, dfa.table, rules)
+
+        except (LexerArtifactError, OSError):
+            pass
+
+        return dfa
+
+    def clear(self):
+        with self._lock:
+            self._dfas.clear()
+
+
+dfa_cache = DFACache(directory=DEFAULT_CACHE_DIR)
+
+
+def set_artifact_directory(directory):
+    """
+    Set the directory in which the artifacts of the DFA of the Lexer classes are stored and from which they are loaded,
+    by default the per-user cache directory $XDG_CACHE_HOME/compyl or ~/.cache/compyl. If directory is None, the DFA
+    are always built and never stored. The DFA already cached in the process are kept.
+    """
+    dfa_cache.directory = directory
@@ -0,0 +1,652 @@
+from array import array
+from bisect import bisect_right
+
+from compyl.__lexer.regexp import MAX_UNICODE
+from compyl.__lexer.errors import LexerBuildError
+
+
+# ======================================================================================================================
+# Table representation of a minimized DFA
+# ======================================================================================================================
+
+# The graph of NodeDFA objects is convenient to build and copy, but stepping through it requires a few Python calls and a
+# binary search over the transitions of a node for every character. The DFATable compiles that graph into flat integer
+# arrays so that a transition is reduced to index arithmetic:
+#
+#   code point --(class map)--> equivalence class --(next-state table)--> next state id
+#
+# Two code points are in the same equivalence class if every state of the DFA sends them to the same state. Class 0 is
+# reserved for code points that have no transition from any state.
+#
+# The class map is dense for Latin-1 (code points below 256) and two-level for the rest of Unicode: the code point is
+# split into a block number (cp >> 8) and an offset in the block (cp & 0xff). Blocks with identical content are shared,
+# in particular the many blocks that fall entirely inside a single class.
+
+BLOCK_BITS = 8
+BLOCK_SIZE = 1 << BLOCK_BITS
+BLOCK_MASK = BLOCK_SIZE - 1
+BLOCK_COUNT = (MAX_UNICODE >> BLOCK_BITS) + 1
+
+# Marks the absence of transition in the next-state table
+NO_STATE = -1
+
+# Type ids of states which do not return a token (ignored and non-accepting states) and of states which terminal token is
+# a function which type is only known once called
+IGNORED_TYPE_ID = -1
+DYNAMIC_TYPE_ID = -2
+
+# Kinds of terminal tokens: ignored without being called, returning a type known in advance without being called, or
+# to be called with a LexerController
+IGNORED_TERMINAL = 0
+STATIC_TERMINAL = 1
+CALLED_TERMINAL = 2
+
+# Selection of the states by a token type filter: their tokens are never selected, always selected, or selected
+# according to the type returned by their terminal, see DFATable.select_states
+UNSELECTED_STATE = 0
+SELECTED_STATE = 1
+UNRESOLVED_STATE = 2
+
+
+class DFATable:
+    """
+    Flat integer representation of a minimized DFA.
+
+    start: id of the starting state
+    state_count: number of states
+    class_count: number of equivalence classes of code points
+    latin1_classes: array mapping code points below 256 to their class
+    block_index, blocks: two-level map of code points to their class, blocks[block_index[cp >> 8] + (cp & 0xff)]
+    transitions: next-state table, the next state of 'state' on class 'cls' is transitions[state * class_count + cls],
+        NO_STATE if there is no legal transition
+    accepting: array of booleans stating if a state is an accepting state
+    terminals: terminal token of every state, None for ignored terminals and non-accepting states
+    token_types: tuple of the token types returned by the rules, a type id is an index in this tuple
+    terminal_ids: array of the type id returned by every state, IGNORED_TYPE_ID or DYNAMIC_TYPE_ID for states which
+        type is respectively absent or not known before calling the terminal
+    special_actions: tuple of trigger_on_contain actions of every state, None if the state has none
+    terminal_kinds: array of the kind of the terminal token of every state, IGNORED_TERMINAL, STATIC_TERMINAL or
+        CALLED_TERMINAL
+    static_terminals: resolved (token_type, None) tuple of every state which terminal is a STATIC_TERMINAL, else None
+    terminal_rules: index in the rules of the rule the terminal token of every accepting state comes from, None for
+        non-accepting states, see get_terminal_rules. Unlike terminals, it is valid for every Lexer sharing the table.
+    segment_bounds, segment_classes: the segments partitioning the code points from which the class map is built, the
+        segment i spans from segment_bounds[i] to segment_bounds[i + 1] excluded and is in the class segment_classes[i]
+    """
+
+    def __init__(self, start, token_types=(), rules=()):
+        states = recover_states_from_dfa(start)
+        state_ids = {state: index for index, state in enumerate(states)}
+
+        boundaries = get_transitions_boundaries(states)
+        class_of_segment, segment_signatures = get_segments_classes(states, state_ids, boundaries)
+
+        self.start = state_ids[start]
+        self.state_count = len(states)
+        self.class_count = len(segment_signatures)
+
+        self.segment_bounds = array('i', boundaries)
+        self.segment_classes = array('i', class_of_segment)
+
+        self.block_index, self.blocks = build_class_map(boundaries, class_of_segment)
+        self.latin1_classes = self.blocks[self.block_index[0]:self.block_index[0] + BLOCK_SIZE]
+
+        self.transitions = array('i', [NO_STATE]) * (self.state_count * self.class_count)
+
+        for cls, signature in enumerate(segment_signatures):
+            for state_id, target in enumerate(signature):
+                self.transitions[state_id * self.class_count + cls] = target
+
+        self.accepting = array('b', [state.terminal_exists() for state in states])
+
+        self.set_terminals(
+            [state.get_terminal_token() if state.terminal_exists() else None for state in states],
+            [tuple(action for _, action in state.get_special_actions()) or None for state in states],
+            token_types
+        )
+
+        self.terminal_rules = get_terminal_rules(self.accepting, self.terminals, rules)
+
+    @classmethod
+    def from_arrays(cls, start, class_count, arrays, terminals, special_actions, token_types, terminal_rules):
+        """
+        Return the DFATable made of the given arrays instead of building them from a graph, as stored by
+        compyl.__lexer.artifact. arrays is a dict holding block_index, blocks, transitions, accepting, segment_bounds
+        and segment_classes.
+        """
+        table = cls.__new__(cls)
+
+        table.start = start
+        table.state_count = len(arrays['accepting'])
+        table.class_count = class_count
+
+        for name in ('block_index', 'blocks', 'transitions', 'accepting', 'segment_bounds', 'segment_classes'):
+            setattr(table, name, arrays[name])
+
+        table.latin1_classes = table.blocks[table.block_index[0]:table.block_index[0] + BLOCK_SIZE]
+        table.set_terminals(terminals, special_actions, token_types)
+        table.terminal_rules = terminal_rules
+
+        return table
+
+    def set_terminals(self, terminals, special_actions, token_types):
+        """
+        Set the terminal tokens and special actions of the states, and the arrays derived from them
+        """
+        self.terminals = terminals
+        self.special_actions = special_actions
+
+        self.token_types = tuple(token_types)
+        self.token_type_ids = {token_type: type_id for type_id, token_type in enumerate(self.token_types)}
+        self.terminal_ids = array('i', [self._get_type_id_of_terminal(terminal) for terminal in self.terminals])
+
+        self.terminal_kinds = array('b', [get_terminal_kind(terminal) for terminal in self.terminals])
+        self.static_terminals = [(get_terminal_token_type(terminal), None) if kind == STATIC_TERMINAL else None
+                                 for terminal, kind in zip(self.terminals, self.terminal_kinds)]
+
+    def _get_type_id_of_terminal(self, terminal_token):
+        if terminal_token is None:
+            return IGNORED_TYPE_ID
+
+        if not isinstance(terminal_token, str) and not hasattr(terminal_token, 'token_type'):
+            return DYNAMIC_TYPE_ID
+
+        token_type = get_terminal_token_type(terminal_token)
+
+        if token_type is None:
+            return IGNORED_TYPE_ID
+
+        return self.token_type_ids.get(token_type, DYNAMIC_TYPE_ID)
+
+    def get_terminal_type_id(self, state, token_type):
+        """
+        Return the type id of the token returned by the state given its resolved type, None if the type is not one of
+        the token_types
+        """
+        type_id = self.terminal_ids[state]
+
+        if type_id >= 0:
+            return type_id
+
+        return self.token_type_ids.get(token_type)
+
+    def select_states(self, accepts):
+        """
+        Return a bytearray of the selection of every state by the predicate accepts, called with a token type: states
+        which never return a token or which type is refused are UNSELECTED_STATE, states which type is accepted are
+        SELECTED_STATE and states which type is only known once their terminal is called are UNRESOLVED_STATE
+        """
+        selection = bytearray(self.state_count)
+
+        for state in range(self.state_count):
+            type_id = self.terminal_ids[state]
+
+            if type_id == DYNAMIC_TYPE_ID:
+                selection[state] = UNRESOLVED_STATE
+
+            elif type_id >= 0 and self.accepting[state] and accepts(self.token_types[type_id]):
+                selection[state] = SELECTED_STATE
+
+        return selection
+
+    def get_class_intervals(self):
+        """
+        Return the list of the code point intervals (min, max) of every class, sorted and with adjacent intervals merged
+        """
+        class_intervals = [[] for _ in range(self.class_count)]
+        bounds = self.segment_bounds
+
+        for segment, cls in enumerate(self.segment_classes):
+            intervals = class_intervals[cls]
+
+            if intervals and intervals[-1][1] + 1 == bounds[segment]:
+                intervals[-1] = (intervals[-1][0], bounds[segment + 1] - 1)
+            else:
+                intervals.append((bounds[segment], bounds[segment + 1] - 1))
+
+        return class_intervals
+
+    def get_state_transitions(self, state, class_intervals=None):
+        """
+        Return the transitions of a state as a list of (target, intervals), ordered by lowest bound, where the intervals
+        leading to the same target are sorted and merged. class_intervals are those returned by get_class_intervals.
+        """
+        class_intervals = self.get_class_intervals() if class_intervals is None else class_intervals
+        intervals_by_target = {}
+        row = state * self.class_count
+
+        for cls in range(self.class_count):
+            target = self.transitions[row + cls]
+
+            if target != NO_STATE:
+                intervals_by_target.setdefault(target, []).extend(class_intervals[cls])
+
+        transitions = []
+
+        for target, intervals in intervals_by_target.items():
+            merged = []
+
+            for min_ascii, max_ascii in sorted(intervals):
+                if merged and merged[-1][1] + 1 == min_ascii:
+                    merged[-1] = (merged[-1][0], max_ascii)
+                else:
+                    merged.append((min_ascii, max_ascii))
+
+            transitions.append((target, merged))
+
+        return sorted(transitions, key=lambda item: item[1][0])
+
+    def get_class(self, codepoint):
+        """
+        Return the equivalence class of the given code point
+        """
+        if codepoint < BLOCK_SIZE:
+            return self.latin1_classes[codepoint]
+
+        return self.blocks[self.block_index[codepoint >> BLOCK_BITS] + (codepoint & BLOCK_MASK)]
+
+    def transition(self, state, codepoint):
+        """
+        Return the id of the state attained from 'state' with the given code point, NO_STATE if there is none
+        """
+        return self.transitions[state * self.class_count + self.get_class(codepoint)]
+
+
+# ======================================================================================================================
+# Byte-level table
+# ======================================================================================================================
+
+# A ByteDFATable steps through encoded bytes instead of code points. For latin-1, bytes are code points, thus the table is
+# the restriction of the DFATable to the first 256 code points. For UTF-8, the transitions on a multi-byte character are
+# replaced by chains of intermediate states, one per continuation byte. The alphabet is then capped at 256 symbols,
+# which allows a dense next-state table indexed by (state << 8 | byte) without class map.
+#
+# The intermediate states of the chains are built from the class map: the code points sharing their leading bytes form
+# an aligned range of 64, 4096 or 262144 code points. Such a range is represented by a node, which is the tuple of the
+# classes (for 64 code points) or of the sub-nodes (for larger ranges) attained by the next continuation byte. Nodes are
+# hash-consed, since most ranges fall entirely inside a single class. An intermediate state is then a node seen from
+# a given state of the DFA, and is shared between states which lead to the same targets from this node.
+
+BYTE_ENCODINGS = ('utf-8', 'latin-1')
+
+# Marks a continuation byte which would lead to an invalid UTF-8 sequence (overlong encoding or surrogate)
+INVALID_NODE = -1
+
+
+class ByteDFATable:
+    """
+    Byte-level representation of a DFATable for the given encoding, 'utf-8' or 'latin-1'.
+
+    The states of the DFATable keep their ids, the following ids are intermediate states reached in the middle of a
+    multi-byte character. Intermediate states are never accepting and have no special actions, thus a match which
+    ends in one must be rewound to the beginning of the character.
+
+    start: id of the starting state
+    state_count: number of states, including intermediate states
+    code_point_state_count: number of states of the DFATable, any greater id is an intermediate state
+    transitions: next-state table, the next state of 'state' on byte 'byte' is transitions[state << 8 | byte]
+    accepting, terminals, terminal_ids, special_actions, terminal_kinds, static_terminals, token_types: as in DFATable
+    """
+
+    def __init__(self, table, encoding='utf-8'):
+        if encoding not in BYTE_ENCODINGS:
+            raise LexerBuildError("byte tables can only be built for encodings %s" % ', '.join(BYTE_ENCODINGS))
+
+        self.table = table
+        self.encoding = encoding
+        self.start = table.start
+        self.code_point_state_count = table.state_count
+        self.token_types = table.token_types
+
+        # Hash-consed nodes by level, see the comment above
+        self._nodes = {1: {}, 2: {}, 3: {}}
+        self._node_children = {1: [], 2: [], 3: []}
+        self._node_classes = {1: [], 2: [], 3: []}
+        self._level_one_nodes = {}
+
+        self._rows = [None] * table.state_count
+        self._intermediate_states = {}
+        self._intermediate_signatures = {}
+
+        for state in range(table.state_count):
+            self._rows[state] = self._build_code_point_state_row(state)
+
+        self.state_count = len(self._rows)
+
+        self.transitions = array('i')
+        for row in self._rows:
+            self.transitions.extend(row)
+
+        intermediate_count = self.state_count - table.state_count
+
+        self.accepting = table.accepting + array('b', [False]) * intermediate_count
+        self.terminals = table.terminals + [None] * intermediate_count
+        self.terminal_ids = table.terminal_ids + array('i', [IGNORED_TYPE_ID]) * intermediate_count
+        self.terminal_kinds = table.terminal_kinds + array('b', [IGNORED_TERMINAL]) * intermediate_count
+        self.static_terminals = table.static_terminals + [None] * intermediate_count
+        self.special_actions = table.special_actions + [None] * intermediate_count
+
+        del self._nodes, self._node_children, self._node_classes, self._level_one_nodes
+        del self._rows, self._intermediate_states, self._intermediate_signatures
+
+    def get_terminal_type_id(self, state, token_type):
+        return self.table.get_terminal_type_id(state, token_type)
+
+    def _build_code_point_state_row(self, state):
+        table = self.table
+        row = [NO_STATE] * 256
+
+        if self.encoding == 'latin-1':
+            for byte in range(256):
+                row[byte] = table.transition(state, byte)
+
+            return row
+
+        for byte in range(0x80):
+            row[byte] = table.transition(state, byte)
+
+        # Two-byte sequences, C0 and C1 would be overlong encodings
+        for lead in range(0xc2, 0xe0):
+            row[lead] = self._get_intermediate_state(state, 1, self._get_level_one_node((lead & 0x1f) << 6))
+
+        # Three-byte sequences
+        for lead in range(0xe0, 0xf0):
+            row[lead] = self._get_intermediate_state(state, 2, self._get_level_two_node((lead & 0x0f) << 12, 0x800))
+
+        # Four-byte sequences, leads above F4 would exceed MAX_UNICODE
+        for lead in range(0xf0, 0xf5):
+            row[lead] = self._get_intermediate_state(state, 3, self._get_level_three_node((lead & 0x07) << 18))
+
+        return row
+
+    def _add_node(self, level, children, classes):
+        nodes = self._nodes[level]
+
+        if children not in nodes:
+            nodes[children] = len(nodes)
+            self._node_children[level].append(children)
+            self._node_classes[level].append(tuple(sorted(classes)))
+
+        return nodes[children]
+
+    def _get_level_one_node(self, base):
+        """
+        Return the node of the 64 code points starting at base, its children are the classes of the code points
+        """
+        table = self.table
+
+        # Identical blocks of the class map are shared, thus their offset is a good cache key
+        offset = table.block_index[base >> BLOCK_BITS] + (base & BLOCK_MASK)
+
+        if offset not in self._level_one_nodes:
+            children = tuple(table.blocks[offset:offset + 64])
+            self._level_one_nodes[offset] = self._add_node(1, children, set(children))
+
+        return self._level_one_nodes[offset]
+
+    def _get_level_two_node(self, base, minimum):
+        """
+        Return the node of the 4096 code points starting at base, code points below minimum and surrogates are invalid
+        """
+        children = []
+        classes = set()
+
+        for index in range(64):
+            sub_base = base + (index << 6)
+
+            if sub_base < minimum or 0xd800 <= sub_base < 0xe000:
+                children.append(INVALID_NODE)
+            else:
+                node = self._get_level_one_node(sub_base)
+                children.append(node)
+                classes.update(self._node_classes[1][node])
+
+        return self._add_node(2, tuple(children), classes)
+
+    def _get_level_three_node(self, base):
+        """
+        Return the node of the 262144 code points starting at base, code points outside the supplementary planes are
+        invalid
+        """
+        children = []
+        classes = set()
+
+        for index in range(64):
+            sub_base = base + (index << 12)
+
+            if sub_base < 0x10000 or sub_base > MAX_UNICODE:
+                children.append(INVALID_NODE)
+            else:
+                node = self._get_level_two_node(sub_base, 0)
+                children.append(node)
+                classes.update(self._node_classes[2][node])
+
+        return self._add_node(3, tuple(children), classes)
+
+    def _get_intermediate_state(self, state, level, node):
+        """
+        Return the intermediate state reached from state when entering the given node, NO_STATE if no code point of the
+        node has a transition from state
+        """
+        key = (state, level, node)
+
+        if key in self._intermediate_states:
+            return self._intermediate_states[key]
+
+        table = self.table
+        targets = tuple(table.transitions[state * table.class_count + cls] for cls in self._node_classes[level][node])
+
+        if all(target == NO_STATE for target in targets):
+            intermediate = NO_STATE
+
+        elif (level, node, targets) in self._intermediate_signatures:
+            intermediate = self._intermediate_signatures[(level, node, targets)]
+
+        else:
+            intermediate = len(self._rows)
+            self._intermediate_signatures[(level, node, targets)] = intermediate
+            self._rows.append(None)
+
+            row = [NO_STATE] * 256
+
+            for index, child in enumerate(self._node_children[level][node]):
+                if child == INVALID_NODE:
+                    continue
+
+                if level == 1:
+                    row[0x80 + index] = table.transitions[state * table.class_count + child]
+                else:
+                    row[0x80 + index] = self._get_intermediate_state(state, level - 1, child)
+
+            self._rows[intermediate] = row
+
+        self._intermediate_states[key] = intermediate
+
+        return intermediate
+
+
+# ======================================================================================================================
+# Table Building Helpers
+# ======================================================================================================================
+
+def get_terminal_token_type(terminal_token):
+    """
+    Return the token type returned by the terminal token if it can be known without calling it, that is if it is a
+    string or a function built by the MetaLexer, which stores the type as 'token_type'. Return None otherwise.
+    """
+    if isinstance(terminal_token, str):
+        return terminal_token
+
+    return getattr(terminal_token, 'token_type', None)
+
+
+def get_terminal_kind(terminal_token):
+    """
+    Return the kind of a terminal token. Functions built by the MetaLexer store their instruction, a function without
+    instruction returns its token_type and can be resolved without being called.
+    """
+    if terminal_token is None:
+        return IGNORED_TERMINAL
+
+    if isinstance(terminal_token, str):
+        return STATIC_TERMINAL
+
+    if not hasattr(terminal_token, 'token_type') or getattr(terminal_token, 'instruction', True) is not None:
+        return CALLED_TERMINAL
+
+    return IGNORED_TERMINAL if terminal_token.token_type is None else STATIC_TERMINAL
+
+
+def get_terminal_rules(accepting, terminals, rules):
+    """
+    Return the list mapping every accepting state to the index of the first rule which terminal token is its terminal,
+    None for non-accepting states and for terminals which do not come from the rules
+    """
+    rule_indices = {}
+
+    for index, rule in enumerate(rules):
+        rule_indices.setdefault(id(rule[1]), index)
+
+    return [rule_indices.get(id(terminal)) if accepting[state] else None for state, terminal in enumerate(terminals)]
+
+
+def get_rules_token_types(rules):
+    """
+    Return the tuple of token types returned by the rules in order of first appearance, ignoring trigger_on_contain
+    rules which never return a token
+    """
+    token_types = []
+
+    for rule in rules:
+        if len(rule) > 2 and rule[2] == 'trigger_on_contain':
+            continue
+
+        token_type = get_terminal_token_type(rule[1])
+
+        if token_type is not None and token_type not in token_types:
+            token_types.append(token_type)
+
+    return tuple(token_types)
+
+
+def recover_states_from_dfa(start):
+    """
+    Return the list of states of the DFA in breadth-first order, the starting state being first
+    """
+    states = [start]
+    seen = {start}
+    index = 0
+
+    while index < len(states):
+        for _, child in states[index].next_states:
+            if child not in seen:
+                seen.add(child)
+                states.append(child)
+
+        index += 1
+
+    return states
+
+
+def get_transitions_boundaries(states):
+    """
+    Return the sorted list of code points where the transitions of the DFA may change, that is the lower bound of every
+    lookout and the value following its upper bound. The list always starts at 0 and ends at MAX_UNICODE + 1, thus
+    consecutive boundaries delimit segments partitioning the whole Unicode range.
+    """
+    boundaries = {0, MAX_UNICODE + 1}
+
+    for state in states:
+        for (min_ascii, max_ascii), _ in state.next_states:
+            boundaries.add(min_ascii)
+            boundaries.add(max_ascii + 1)
+
+    return sorted(boundaries)
+
+
+def get_segments_classes(states, state_ids, boundaries):
+    """
+    Given the segments delimited by boundaries, compute for each segment the tuple of target states of every state of
+    the DFA (its signature) and group segments with the same signature in an equivalence class.
+    Return a list giving the class of each segment and the list of signatures indexed by class.
+    Class 0 is always the class of code points without any transition.
+    """
+    segment_count = len(boundaries) - 1
+    targets = [[NO_STATE] * len(states) for _ in range(segment_count)]
+
+    for state in states:
+        state_id = state_ids[state]
+
+        for (min_ascii, max_ascii), child in state.next_states:
+            first = bisect_right(boundaries, min_ascii) - 1
+            last = bisect_right(boundaries, max_ascii) - 1
+
+            for segment in range(first, last + 1):
+                if targets[segment][state_id] != NO_STATE:
+                    raise LexerBuildError("the DFA has overlapping transitions, it cannot be compiled to a table")
+
+                targets[segment][state_id] = state_ids[child]
+
+    empty_signature = tuple([NO_STATE] * len(states))
+    classes = {empty_signature: 0}
+    class_of_segment = []
+
+    for segment_targets in targets:
+        signature = tuple(segment_targets)
+        class_of_segment.append(classes.setdefault(signature, len(classes)))
+
+    signatures = sorted(classes, key=classes.get)
+
+    return class_of_segment, signatures
+
+
+def build_class_map(boundaries, class_of_segment):
+    """
+    Build the two-level code point to class map from the segments and their classes.
+    Return the arrays (block_index, blocks).
+    """
+    blocks = array('i')
+    block_index = array('i', [0]) * BLOCK_COUNT
+
+    # Blocks entirely contained in a segment only depend on the class of the segment, we share them
+    uniform_blocks = {}
+    # Other blocks are deduplicated by content
+    mixed_blocks = {}
+
+    segment = 0
+
+    for block in range(BLOCK_COUNT):
+        block_start = block << BLOCK_BITS
+        block_end = block_start + BLOCK_SIZE
+
+        while boundaries[segment + 1] <= block_start:
+            segment += 1
+
+        if boundaries[segment + 1] >= block_end:
+            cls = class_of_segment[segment]
+
+            if cls not in uniform_blocks:
+                uniform_blocks[cls] = len(blocks)
+                blocks.extend([cls] * BLOCK_SIZE)
+
+            block_index[block] = uniform_blocks[cls]
+
+        else:
+            content = []
+            current = segment
+
+            for codepoint in range(block_start, block_end):
+                if codepoint >= boundaries[current + 1]:
+                    current += 1
+
+                content.append(class_of_segment[current])
+
+            content = tuple(content)
+
+            if content not in mixed_blocks:
+                mixed_blocks[content] = len(blocks)
+                blocks.extend(content)
+
+            block_index[block] = mixed_blocks[content]
+
+    return block_index, blocks
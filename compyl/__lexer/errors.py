@@ -3,8 +3,11 @@ class LexerError(Exception):
 
 
 class LexerSyntaxError(LexerError):
-    def __init__(self, *args, lineno=None, pos=None):
+    def __init__(self, *args, lineno=None, pos=None, document=None):
         self.lineno, self.pos = lineno, pos
+
+        # Index of the document in which the error was met, see Lexer.tokenize_many
+        self.document = document
         super().__init__(*args)
 
 
@@ -14,3 +17,7 @@ class LexerBuildError(LexerError):
 
 class RegexpParsingError(LexerBuildError):
     pass
+
+
+class LexerArtifactError(LexerError):
+    pass
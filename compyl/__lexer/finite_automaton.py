@@ -1,10 +1,15 @@
 from itertools import count
 import copy
 from functools import cmp_to_key
+from time import perf_counter
 
 import compyl.__lexer.regexp as RegExp
 import compyl.__lexer.interval_operations as IntervalOp
-from compyl.__lexer.errors import LexerBuildError
+from compyl.__lexer.dfa_table import DFATable, ByteDFATable, get_rules_token_types
+from compyl.__lexer.regexp_engine import build_regexp_engine
+from compyl.__lexer.codegen import load_generated_scanner
+from compyl.__lexer.errors import LexerError, LexerBuildError
+from compyl.__lexer.introspection import DFAReport, table_to_dict, table_to_json, table_to_dot
 
 
 # ======================================================================================================================
@@ -332,9 +337,48 @@ class DFA:
         self.start = None
         self.current_state = None
 
+        # Flat integer representation of the graph starting at self.start, used by the Lexer to step quickly
+        self.table = None
+
+        # Token types returned by the rules, the terminals of the table are stored as indices in this tuple
+        self.token_types = ()
+
+        # Byte-level tables by encoding, compiled on demand by get_byte_table
+        self.byte_tables = {}
+
+        # Master regular expression of the rules, compiled on demand by get_regexp_engine
+        self.regexp_engine = None
+
+        # Rules and parsed patterns from which get_regexp_engine compiles the master regular expression, None once done
+        self._regexp_rules = None
+
+        # Match functions of the generated scanner by cache directory, loaded on demand by get_generated_scanner
+        self.generated_scanners = {}
+
+        # Rules of a DFA made from a stored table, from which its graph is only built on demand, see DFA.from_table
+        self._graph_rules = None
+
+        # Sizes and phase times recorded by DFA.build, None if the DFA was made from a table, see DFA.get_report
+        self.build_stats = None
+
         if rules:
             self.build(rules)
 
+    @classmethod
+    def from_table(cls, table, rules):
+        """
+        Return the DFA of the rules given their DFATable, by example loaded from an artifact. Building the graph of
+        NodeDFA, which the Lexer does not need, is deferred until a method stepping through it is called.
+        """
+        dfa = cls()
+
+        dfa.table = table
+        dfa.token_types = table.token_types
+        dfa._regexp_rules = (rules, None)
+        dfa._graph_rules = rules
+
+        return dfa
+
     def __copy__(self):
         """
         Identical as deepcopy as their is no point at returning a shallow copy
@@ -348,7 +392,17 @@ class DFA:
         dup = DFA()
 
         dup.start = copy.deepcopy(self.start)
-        dup.current_state = dup.get_dfa_state_by_id(self.current_state.id)
+        dup.current_state = dup.get_dfa_state_by_id(self.current_state.id) if self.current_state else None
+        dup._graph_rules = self._graph_rules
+
+        # The table is never mutated once built, thus it can be shared
+        dup.table = self.table
+        dup.token_types = self.token_types
+        dup.byte_tables = self.byte_tables
+        dup.regexp_engine = self.regexp_engine
+        dup._regexp_rules = self._regexp_rules
+        dup.generated_scanners = self.generated_scanners
+        dup.build_stats = self.build_stats
 
         return dup
 
@@ -357,6 +411,34 @@ class DFA:
         Build the DFA according to the given rules, save its starting node as self.start and initialize its
         current_state to the start
         """
+        build_stats = {'phase_times': {}}
+        phase_times = build_stats['phase_times']
+
+        formated_rules, dfa_start = self._build_graph(rules, build_stats)
+
+        self.start = self.current_state = dfa_start
+
+        started = perf_counter()
+        self.token_types = get_rules_token_types(rules)
+        self.table = DFATable(dfa_start, self.token_types, rules)
+        phase_times['table'] = perf_counter() - started
+
+        self.byte_tables = {}
+        self.regexp_engine = None
+        self._regexp_rules = (rules, [rule[0] for rule in formated_rules])
+        self.generated_scanners = {}
+
+        self.build_stats = build_stats
+
+    def _build_graph(self, rules, build_stats=None):
+        """
+        Build the graph of NodeDFA of the rules, return the list of (RegexpTree, token, special_action) tuples of the
+        rules and the starting node. If a build_stats dict is given, the sizes of the automatons and the time of every
+        phase are recorded in it, see DFA.get_report.
+        """
+        phase_times = {} if build_stats is None else build_stats['phase_times']
+        started = perf_counter()
+
         formated_rules = []
 
         for packed_rule in rules:
@@ -393,20 +475,102 @@ class DFA:
                 (rule, token, special_action)
             )
 
+        phase_times['parse'] = perf_counter() - started
+        started = perf_counter()
+
         nfa_start = self.build_nfa_from_rules(formated_rules)
 
-        dfa_start = self.build_dfa_from_nfa(nfa_start)
+        phase_times['nfa'] = perf_counter() - started
+
+        dfa_start = self.build_dfa_from_nfa(nfa_start, build_stats)
 
         # The states are currently labelled with Python built-in id function, for aestheticism we give a nice ordering
         DFA.relabel_states_of_dfa(dfa_start)
 
-        self.start = self.current_state = dfa_start
+        return formated_rules, dfa_start
+
+    def _ensure_graph(self):
+        """
+        Build the graph of a DFA made from a table, see DFA.from_table
+        """
+        if self.start is None and self._graph_rules is not None:
+            _, self.start = self._build_graph(self._graph_rules)
+            self.current_state = self.start
+
+    def get_byte_table(self, encoding='utf-8'):
+        """
+        Return the ByteDFATable of the DFA for the given encoding, 'utf-8' or 'latin-1', compiling it on first request
+        """
+        # Threads sharing the DFA may compile the same table concurrently, but they all get the first one stored
+        if encoding not in self.byte_tables:
+            self.byte_tables.setdefault(encoding, ByteDFATable(self.table, encoding))
+
+        return self.byte_tables[encoding]
+
+    def get_regexp_engine(self):
+        """
+        Return the RegexpEngine of the rules, compiling it on first request, None if they cannot be compiled to a
+        regular expression. Only the lexers with engine 'auto' or 'regexp' use it.
+        """
+        regexp_rules = self._regexp_rules
+
+        # Threads sharing the DFA may compile the engine concurrently, which is harmless as they compile the same one
+        if regexp_rules is not None:
+            started = perf_counter()
+            self.regexp_engine = build_regexp_engine(regexp_rules[0], self.table, regexp_rules[1])
+            self._regexp_rules = None
+
+            if self.build_stats is not None:
+                self.build_stats['phase_times']['regexp'] = perf_counter() - started
+
+        return self.regexp_engine
+
+    def get_generated_scanner(self, cache_dir=None):
+        """
+        Return the match function of the Python module generated for the DFA, loading it from cache_dir or generating it
+        on first request, see compyl.__lexer.codegen
+        """
+        if cache_dir not in self.generated_scanners:
+            self.generated_scanners.setdefault(cache_dir, load_generated_scanner(self.table, cache_dir))
+
+        return self.generated_scanners[cache_dir]
+
+    def get_report(self):
+        """
+        Return the DFAReport of the DFA: the size of its table and, if it was built in this process, the sizes of the
+        intermediate automatons and the time of every build phase
+        """
+        return DFAReport(self._get_built_table(), self.build_stats)
+
+    def to_dict(self):
+        """
+        Return the minimized automaton as a JSON serializable dict, see compyl.__lexer.introspection.table_to_dict
+        """
+        return table_to_dict(self._get_built_table())
+
+    def to_json(self, indent=None):
+        return table_to_json(self._get_built_table(), indent)
+
+    def to_dot(self):
+        """
+        Return the minimized automaton in the DOT language of Graphviz
+        """
+        return table_to_dot(self._get_built_table())
+
+    def _get_built_table(self):
+        if self.table is None:
+            raise LexerError("the DFA is not built")
+
+        return self.table
 
     def push(self, lookout):
         """
         Make the current_state transition with the given lookout, update it and return it. Return None if the lookout
         yields no legal transition.
+        The Lexer never steps through the graph, it only reads the DFATable, thus this cursor is not safe to use on a DFA
+        shared by lexers.
         """
+        self._ensure_graph()
         ascii = ord(lookout)
 
         transition_state = self.current_state.transition(ascii)
@@ -421,6 +585,7 @@ class DFA:
         """
         Set back the current state to start
         """
+        self._ensure_graph()
         self.current_state = self.start
 
     def get_current_state_terminal(self):
@@ -428,6 +593,7 @@ class DFA:
         Return the terminal of the current state. Return None if it is an ignored terminal.
         Will raise 'NodeIsNotTerminalState' if the node is not a terminal.
         """
+        self._ensure_graph()
         return self.current_state.get_terminal_token()
 
     def get_dfa_state_by_id(self, id):
@@ -435,6 +601,7 @@ class DFA:
         Return the first state found with given 'id' (should be unique), None if no such state exists
         This is used when copying to recover the copied current_state object
         """
+        self._ensure_graph()
         seen_states = set()
         todo_states = [self.start]
 
@@ -584,7 +751,7 @@ class DFA:
             return nfa_start, nfa_start
 
     @staticmethod
-    def build_dfa_from_nfa(nfa):
+    def build_dfa_from_nfa(nfa, build_stats=None):
         """
         Generate the Deterministic Finite Automaton corresponding to the given NFA following these steps:
         1) Recover all nodes from the NFA as well as the alphabet used by the language
@@ -595,7 +762,12 @@ class DFA:
         5) Optimize the lookouts by merging adjacent intervals
         6) Translate the table to a graph structure
         7) Return the starting node
+        If a build_stats dict is given, the sizes of the NFA, of the alphabet and of the DFA before and after
+        minimization are recorded in it, as well as the time of steps 1 to 3, 4 and 5 to 6 in its 'phase_times'.
         """
+        phase_times = {} if build_stats is None else build_stats['phase_times']
+        started = perf_counter()
+
         # ========================================================
         # Recover all nodes and possible lookouts found in the NFA
         # ========================================================
@@ -613,6 +785,10 @@ class DFA:
         alphabet = IntervalOp.get_minimal_covering_intervals(edges_lookouts)
         alphabet.remove(NodeNFA.EMPTY)
 
+        if build_stats is not None:
+            build_stats['nfa_nodes'] = len(nodes_as_dict)
+            build_stats['alphabet_size'] = len(alphabet)
+
         # ========================================================
         # Build the DFA table
         # ========================================================
@@ -779,8 +955,19 @@ class DFA:
         # We get the minimal DFA using Hopcroft's algorithm
         # In the process, the algorithm removes the error state
 
+        phase_times['subset'] = perf_counter() - started
+        started = perf_counter()
+
         minimum_dfa = hopcrofts_algorithm(dfa_nodes_table, alphabet)
 
+        phase_times['minimize'] = perf_counter() - started
+        started = perf_counter()
+
+        if build_stats is not None:
+            # The error node is part of the DFA given to Hopcroft's algorithm, which removes it
+            build_stats['dfa_states'] = len(dfa_nodes_table) - 1
+            build_stats['minimal_states'] = len(minimum_dfa)
+
         # ========================================================
         # Merge adjacent lookouts
         # ========================================================
@@ -797,6 +984,8 @@ class DFA:
 
         dfa_start = build_dfa_from_dict(minimum_dfa, initial_epsilon_group)
 
+        phase_times['graph'] = perf_counter() - started
+
         return dfa_start
 
 
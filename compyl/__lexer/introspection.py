@@ -0,0 +1,195 @@
+import json
+import struct
+
+from compyl.__lexer.dfa_table import NO_STATE, get_terminal_token_type
+
+# ======================================================================================================================
+# DFA introspection and export
+# ======================================================================================================================
+
+# Estimated size of a reference held by the lists of the table
+POINTER_SIZE = struct.calcsize('P')
+
+# Arrays of the DFATable counted in its memory estimate
+TABLE_ARRAYS = ('block_index', 'blocks', 'transitions', 'accepting', 'terminal_ids', 'terminal_kinds', 'segment_bounds',
+                'segment_classes')
+
+# Lists of the DFATable counted in its memory estimate
+TABLE_LISTS = ('terminals', 'special_actions', 'static_terminals', 'terminal_rules')
+
+
+class DFAReport:
+    """
+    Size report of a DFA, see DFA.get_report
+
+    state_count, class_count: number of states and of equivalence classes of code points of the minimized DFA
+    transitions_per_state: list of the number of classes with a legal transition from every state
+    transition_count: total number of legal transitions
+    accepting_count: number of accepting states
+    table_memory: estimated size in bytes of the DFATable, its arrays and the references held by its lists
+    nfa_nodes, alphabet_size: number of nodes of the NFA and of intervals in its minimal covering alphabet, see
+        compyl.__lexer.interval_operations.get_minimal_covering_intervals
+    dfa_states, minimal_states: number of states of the DFA before and after Hopcroft's algorithm
+    phase_times: dict of the time in seconds of every build phase, in order: parse, nfa, subset, minimize, graph, table
+        and regexp, the last one only once the regexp engine was compiled on demand, see DFA.get_regexp_engine
+    The build statistics are None if the DFA was not built in this process, by example if it was loaded from an
+    artifact.
+    """
+
+    def __init__(self, table, build_stats=None):
+        self.state_count = table.state_count
+        self.class_count = table.class_count
+        self.transitions_per_state = get_transitions_per_state(table)
+        self.transition_count = sum(self.transitions_per_state)
+        self.accepting_count = sum(table.accepting)
+        self.table_memory = get_table_memory(table)
+
+        build_stats = build_stats or {}
+
+        self.nfa_nodes = build_stats.get('nfa_nodes')
+        self.alphabet_size = build_stats.get('alphabet_size')
+        self.dfa_states = build_stats.get('dfa_states')
+        self.minimal_states = build_stats.get('minimal_states')
+        self.phase_times = dict(build_stats['phase_times']) if 'phase_times' in build_stats else None
+
+    def __str__(self):
+        lines = [
+            "states: %d (%d accepting)" % (self.state_count, self.accepting_count),
+            "classes: %d" % self.class_count,
+            "transitions: %d (max %d per state)" % (self.transition_count, max(self.transitions_per_state, default=0)),
+            "table memory: %d bytes" % self.table_memory,
+        ]
+
+        if self.nfa_nodes is not None:
+            lines += [
+                "nfa nodes: %d" % self.nfa_nodes,
+                "alphabet size: %d" % self.alphabet_size,
+                "dfa states: %d before minimization, %d after" % (self.dfa_states, self.minimal_states),
+            ]
+
+        if self.phase_times is not None:
+            lines += ["%s: %.3f ms" % (phase, time * 1000) for phase, time in self.phase_times.items()]
+
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def get_transitions_per_state(table):
+    """
+    Return the list of the number of classes with a legal transition from every state of the table
+    """
+    transitions = table.transitions
+    class_count = table.class_count
+
+    return [class_count - transitions[state * class_count:(state + 1) * class_count].count(NO_STATE)
+            for state in range(table.state_count)]
+
+
+def get_table_memory(table):
+    """
+    Return the estimated size in bytes of the arrays of the table and of the references held by its lists
+    """
+    size = sum(len(getattr(table, name)) * getattr(table, name).itemsize for name in TABLE_ARRAYS)
+    size += sum(len(getattr(table, name)) * POINTER_SIZE for name in TABLE_LISTS)
+
+    return size
+
+
+def get_terminal_label(terminal):
+    """
+    Return a printable description of a terminal token: its token type if it is known, the name of the function
+    otherwise, None if it is ignored
+    """
+    token_type = get_terminal_token_type(terminal)
+
+    if token_type is not None or terminal is None or hasattr(terminal, 'token_type'):
+        return token_type
+
+    return getattr(terminal, '__name__', repr(terminal))
+
+
+def format_interval(interval):
+    """
+    Return an interval of code points (min, max) as text, by example 'a-z'
+    """
+    min_ascii, max_ascii = interval
+
+    if min_ascii == max_ascii:
+        return format_code_point(min_ascii)
+
+    return '%s-%s' % (format_code_point(min_ascii), format_code_point(max_ascii))
+
+
+def format_code_point(code_point):
+    """
+    Return a code point as its character if it is printable, as an escape sequence otherwise. Dashes and backslashes
+    are escaped too, to keep intervals unambiguous.
+    """
+    char = chr(code_point)
+
+    if char.isprintable() and not char.isspace() and char not in '-\\':
+        return char
+
+    if code_point < 0x100:
+        return '\\x%02x' % code_point
+
+    return '\\u%04x' % code_point if code_point < 0x10000 else '\\U%08x' % code_point
+
+
+def table_to_dict(table):
+    """
+    Return the minimized DFA of the table as a JSON serializable dict: its start, its token types and the list of its
+    states with their terminal, their number of trigger_on_contain actions and their transitions, given as lists of
+    code point intervals [min, max] by target state
+    """
+    class_intervals = table.get_class_intervals()
+    states = []
+
+    for state in range(table.state_count):
+        states.append({
+            'id': state,
+            'accepting': bool(table.accepting[state]),
+            'terminal': get_terminal_label(table.terminals[state]),
+            'special_actions': len(table.special_actions[state] or ()),
+            'transitions': [{'target': target, 'intervals': [list(interval) for interval in intervals]}
+                            for target, intervals in table.get_state_transitions(state, class_intervals)],
+        })
+
+    return {'start': table.start, 'token_types': list(table.token_types), 'states': states}
+
+
+def table_to_json(table, indent=None):
+    return json.dumps(table_to_dict(table), indent=indent)
+
+
+def table_to_dot(table):
+    """
+    Return the minimized DFA of the table in the DOT language of Graphviz. Accepting states are double circles labelled
+    with their terminal and edges are labelled with their code point intervals.
+    """
+    class_intervals = table.get_class_intervals()
+    lines = ['digraph DFA {', '    rankdir=LR;', '    node [shape=circle];', '    start [shape=point];',
+             '    start -> %d;' % table.start]
+
+    for state in range(table.state_count):
+        if table.accepting[state]:
+            label = escape_dot(str(get_terminal_label(table.terminals[state]) or '_'))
+            lines.append('    %d [shape=doublecircle, label="%d\\n%s"];' % (state, state, label))
+
+    for state in range(table.state_count):
+        for target, intervals in table.get_state_transitions(state, class_intervals):
+            label = ' '.join(format_interval(interval) for interval in intervals)
+            lines.append('    %d -> %d [label="%s"];' % (state, target, escape_dot(label)))
+
+    lines.append('}')
+
+    return '\n'.join(lines)
+
+
+def escape_dot(label):
+    """
+    Escape the backslashes and double quotes of a DOT label
+    """
+    return label.replace('\\', '\\\\').replace('"', '\\"')
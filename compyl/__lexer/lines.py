@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_left
+
+
+# ======================================================================================================================
+# Line Index
+# ======================================================================================================================
+
+
+class LineIndex:
+    """
+    Index of the linebreaks of a buffer, used to recover the line and column of a position by bisection instead of
+    counting lines while lexing.
+
+    The line numbers are relative to a reference position of known line number, since the buffer of the Lexer might not
+    start at the first line. The offsets of the linebreaks are only searched once a line or a column is requested.
+    """
+
+    def __init__(self, buffer, reference_pos=0, reference_lineno=1, linebreak='\n'):
+        self.buffer = buffer
+        self.reference_pos = reference_pos
+        self.reference_lineno = reference_lineno
+        self.linebreak = linebreak
+
+        self._linebreaks = None
+        self._reference_index = None
+
+    @property
+    def linebreaks(self):
+        """
+        Sorted array of the offsets of the linebreaks in the buffer
+        """
+        if self._linebreaks is None:
+            self._linebreaks = find_linebreaks(self.buffer, self.linebreak)
+            self._reference_index = bisect_left(self._linebreaks, self.reference_pos)
+
+        return self._linebreaks
+
+    def get_lineno(self, pos):
+        """
+        Return the line number of the character at pos
+        """
+        linebreaks = self.linebreaks
+
+        return self.reference_lineno + bisect_left(linebreaks, pos) - self._reference_index
+
+    def get_column(self, pos):
+        """
+        Return the column of the character at pos, starting at 1
+        """
+        linebreaks = self.linebreaks
+        index = bisect_left(linebreaks, pos)
+
+        return pos - linebreaks[index - 1] - len(self.linebreak) + 1 if index else pos + 1
+
+
+def find_linebreaks(buffer, linebreak='\n'):
+    """
+    Return an array of the offsets of all linebreaks in the buffer
+    """
+    offsets = array('q')
+    find = buffer.find
+    pos = find(linebreak)
+
+    while pos >= 0:
+        offsets.append(pos)
+        pos = find(linebreak, pos + 1)
+
+    return offsets
+
+
+def count_linebreaks(buffer, linebreak, start, end):
+    """
+    Return the number of linebreaks in buffer[start:end], the buffer being a string or bytes-like data
+    """
+    count = getattr(buffer, 'count', None)
+
+    if count is not None:
+        return count(linebreak, start, end)
+
+    # memoryview and mmap objects have no count method
+    return bytes(buffer[start:end]).count(linebreak)
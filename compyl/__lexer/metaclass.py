@@ -1,5 +1,7 @@
 import re
-from compyl.__lexer.errors import LexerSyntaxError
+from compyl.__lexer.errors import LexerError, LexerSyntaxError
+from compyl.__lexer.dfa_table import get_rules_token_types
+from compyl.__lexer.regexp import escape
 
 # _Terminal is a bride between the old API which received either a string or a function as token
 # Since the role of the new token of type function has changed, it no longer returns the token, both can
@@ -9,14 +11,22 @@ from compyl.__lexer.errors import LexerSyntaxError
 def get_callable_terminal_token(token, instruction):
 
     if instruction is None:
-        return lambda *args: token
+        terminal = lambda *args: token
 
     else:
-        def _call_instruction(*args):
+        def terminal(*args):
             return token, instruction(*args)
 
-        return _call_instruction
+    # The returned type is stored so the DFA can identify the token type of a state without calling the terminal, which
+    # the Lexer can skip altogether if there is no instruction
+    terminal.token_type = token
+    terminal.instruction = instruction
 
+    return terminal
+
+
+def line_incrementer(t):
+    t.increment_line()
 
 
 class RuleHarvester():
@@ -25,9 +35,23 @@ class RuleHarvester():
     It then returns special keys __rules__, __terminal_tokens__ and __params__
     Used in __prepare__ method of MetaLexer to gather rules and bunch them in a single parsed list
     """
-    def __init__(self, *args, terminal_actions=None, params=None, line_rule=None, **kwargs):
+    def __init__(self, *args, terminal_actions=None, params=None, line_rule=None, linebreak=None, **kwargs):
+        if line_rule is not None and linebreak is not None:
+            raise LexerError("line_rule and linebreak cannot be both given")
+
+        if linebreak is not None and not (isinstance(linebreak, str) and linebreak):
+            raise LexerError("linebreak must be a non-empty string")
+
         self.dict = {}
-        self.lexer_rules = [] if line_rule is None else self._get_line_rule_item(line_rule)
+        self.linebreak = linebreak
+
+        if line_rule is not None:
+            self.lexer_rules = self._get_line_rule_item(line_rule)
+        elif linebreak is not None:
+            self.lexer_rules = self._get_linebreak_item(linebreak)
+        else:
+            self.lexer_rules = []
+
         self.terminal_actions = [] if terminal_actions is None else terminal_actions
         self.params = {} if params is None else params
 
@@ -57,7 +81,8 @@ class RuleHarvester():
             self.dict,
             __rules__=self.lexer_rules,
             __terminal_actions__=self.terminal_actions,
-            __params__=self.params
+            __params__=self.params,
+            __linebreak__=self.linebreak
         )
 
     def _add_rule_item(self, token, params):
@@ -102,13 +127,16 @@ class RuleHarvester():
 
     @staticmethod
     def _get_line_rule_item(pattern):
-        def line_incrementer(t): t.increment_line()
-
         return [
             (pattern, get_callable_terminal_token(None, None), None),
             (pattern, get_callable_terminal_token(None, line_incrementer), 'trigger_on_contain')
         ]
 
+    @staticmethod
+    def _get_linebreak_item(linebreak):
+        # Linebreaks are ignored, the Lexer counts them in every match instead of triggering a rule on each of them
+        return [(escape(linebreak), get_callable_terminal_token(None, None), None)]
+
 
 class MetaLexer(type):
     def __prepare__(name, bases, **kwargs):
@@ -134,6 +162,10 @@ class MetaLexer(type):
             # __terminal_actions__ parsed already. This is fine, but we need to make sure that the cast from
             # RuleHarvester to to dict will always be idempotent, i.e. dict(dict(name_space)) == dict(name_space)
             lexer_cls = super().__new__(cls, name, bases, dict(name_space))
+
+            # Token types are indexed by order of appearance of their rule, Token.type_id is an index in that tuple
+            lexer_cls.token_types = get_rules_token_types(lexer_cls.__rules__)
+
             return lexer_cls
 
         else:
@@ -0,0 +1,301 @@
+import copy
+import re
+from itertools import islice
+
+import dill
+
+from compyl.__lexer.errors import LexerSyntaxError
+from compyl.__lexer.dfa_table import NO_STATE
+
+# ======================================================================================================================
+# Parallel lexing helpers
+# ======================================================================================================================
+
+# Number of chunks given to every worker, more chunks balance the load better at the cost of more messages
+CHUNKS_PER_WORKER = 4
+
+# Number of documents sent at once to a worker by Lexer.tokenize_many
+DOCUMENTS_PER_BATCH = 1024
+
+# Marks a run of the DFA which meets a syntax error, see get_chunk_state_mapping
+ERROR = -1
+
+# Lexer unpickled once by every worker process of the pool, see init_worker
+_worker_lexer = None
+
+
+def split_at_sync_points(text, sync, chunk_count):
+    """
+    Return the list of (start, end) offsets of at most chunk_count chunks of similar size covering text. Chunks are only
+    cut right after a match of sync, a regular expression of the re module given as string or compiled pattern.
+    """
+    pattern = re.compile(sync) if isinstance(sync, str) else sync
+    size = len(text)
+    target = max(1, -(-size // max(1, chunk_count)))
+
+    bounds = [0]
+
+    while True:
+        match = pattern.search(text, bounds[-1] + target)
+
+        if match is None or match.end() >= size:
+            break
+
+        bounds.append(match.end())
+
+    bounds.append(size)
+
+    return list(zip(bounds, bounds[1:]))
+
+
+def lex_chunk(template, text, return_params):
+    """
+    Lex text from the start state and line 1 with a copy of the template lexer which params are deep copied.
+    Return a tuple (tokens, lineno, params, error) where tokens is a TokenArray without buffer, lineno is the line number
+    reached at the end of the chunk, params are the params of the copy if return_params is True and error is None or a
+    tuple (lineno, pos) of the syntax error met in the chunk.
+    """
+    lexer = copy.copy(template)
+    lexer.params = copy.deepcopy(template.params)
+    lexer.buffer, lexer.pos, lexer.lineno = '', 0, 1
+
+    try:
+        tokens = lexer.tokenize_columnar(text)
+
+    except LexerSyntaxError as error:
+        return None, lexer.lineno, None, (error.lineno, error.pos)
+
+    # The buffer is the chunk, it is not sent back
+    tokens.buffer = ''
+
+    return tokens, lexer.lineno, lexer.params if return_params else None, None
+
+
+def count_chunk(template, text, histograms):
+    """
+    Count the tokens of text with Lexer.count on a copy of the template lexer, as lex_chunk does. Return a tuple
+    (counts, lineno, error) where counts is the TokenCounts of the chunk and lineno and error are as in lex_chunk.
+    """
+    lexer = copy.copy(template)
+    lexer.params = copy.deepcopy(template.params)
+    lexer.buffer, lexer.pos, lexer.lineno = '', 0, 1
+
+    try:
+        counts = lexer.count(text, histograms)
+
+    except LexerSyntaxError as error:
+        return None, lexer.lineno, (error.lineno, error.pos)
+
+    return counts, lexer.lineno, None
+
+
+def init_worker(payload):
+    """
+    Initializer of the worker processes, the lexer is received once as a dill payload instead of with every chunk
+    """
+    global _worker_lexer
+    _worker_lexer = dill.loads(payload)
+
+
+def lex_chunk_in_worker(text, return_params):
+    return lex_chunk(_worker_lexer, text, return_params)
+
+
+def count_chunk_in_worker(text, histograms):
+    return count_chunk(_worker_lexer, text, histograms)
+
+
+def lex_documents_in_worker(documents):
+    """
+    Lex a batch of documents with Lexer.tokenize_many. Return a tuple (results, error) where results is the list of the
+    TokenArray of every document and error None or a tuple (document, lineno, pos) of the syntax error met in the batch.
+    """
+    try:
+        return _worker_lexer.tokenize_many(documents, columnar=True), None
+
+    except LexerSyntaxError as error:
+        return None, (error.document, error.lineno, error.pos)
+
+
+def iter_batches(iterable, batch_size):
+    """
+    Yield the items of iterable in lists of at most batch_size items
+    """
+    iterator = iter(iterable)
+
+    while True:
+        batch = list(islice(iterator, batch_size))
+
+        if not batch:
+            return
+
+        yield batch
+
+
+def map_chunk_states_in_worker(piece, has_previous, need_end_state):
+    return get_chunk_state_mapping(_worker_lexer.dfa.table, piece, 1 if has_previous else 0, need_end_state)
+
+
+# ======================================================================================================================
+# Speculative lexing by state mapping
+# ======================================================================================================================
+
+# A chunk of text is lexed speculatively by simulating the DFA from every state it may be in at the start of the chunk.
+# The state of the DFA at a position is the state reached on the characters of the current token read so far, thus the
+# lexer restarts from the start state at a token boundary when the next character has no legal transition. The state at
+# the end of a chunk is then a function of the state at its start, and composing these functions chunk after chunk gives
+# the actual state at every chunk boundary, as in parallel-prefix lexing.
+
+
+def get_speculative_bounds(table, text, chunk_count, executor=None):
+    """
+    Return the list of (start, end) offsets of pieces covering text which all start at a token boundary, found without
+    sync points: the text is cut in chunk_count chunks of equal size which states are mapped by get_chunk_state_mapping,
+    in the processes of the executor if one is given. The mappings are then composed from the first chunk to recover
+    the actual state at the start of every chunk and thus its first token boundary.
+    """
+    size = len(text)
+    chunk_count = max(1, min(chunk_count, size))
+    offsets = sorted({index * size // chunk_count for index in range(chunk_count)})
+    bounds = list(zip(offsets, offsets[1:] + [size]))
+
+    # Every chunk but the first is sent with its preceding character, from which the possible states are deduced
+    pieces = [text[max(0, start - 1):end] for start, end in bounds]
+    has_previous = [start > 0 for start, _ in bounds]
+    need_end_state = [index < len(bounds) - 1 for index in range(len(bounds))]
+
+    if executor is None:
+        mappings = [get_chunk_state_mapping(table, piece, 1 if previous else 0, need)
+                    for piece, previous, need in zip(pieces, has_previous, need_end_state)]
+    else:
+        mappings = list(executor.map(map_chunk_states_in_worker, pieces, has_previous, need_end_state))
+
+    cuts = [0]
+    state = table.start
+
+    for index, ((start, _), mapping) in enumerate(zip(bounds, mappings)):
+        boundary, end_state = mapping.get(state, (ERROR, ERROR))
+
+        # On syntax error, the remaining text is left in the last piece, where the error is raised by the lexer
+        if boundary == ERROR or end_state == ERROR:
+            break
+
+        if index > 0 and boundary is not None:
+            cuts.append(boundary + start - 1)
+
+        state = end_state
+
+    return list(zip(cuts, cuts[1:] + [size]))
+
+
+def get_chunk_state_mapping(table, text, start, need_end_state=True):
+    """
+    Simulate the DFA on text[start:] from every state it may be in at start and return a dict mapping each of those
+    states to a tuple (first_boundary, end_state). first_boundary is the first position at which a token starts, None
+    if the whole chunk is inside a single token, and end_state the state at the end of the text. Runs meeting a syntax
+    error are mapped to (ERROR, ERROR).
+
+    The states at start are the states attained by the character preceding start, or the start state if start is 0.
+    Runs from different states mostly converge at their first token boundary, thus the boundaries are first found with
+    short runs and the chunk is then stepped through once for all runs restarting from the same boundaries.
+    If need_end_state is False, only the first boundaries are computed.
+    """
+    if start == 0:
+        domain = [table.start]
+
+    else:
+        cls = table.get_class(ord(text[start - 1]))
+        targets = (table.transitions[state * table.class_count + cls] for state in range(table.state_count))
+        domain = sorted(set(targets) - {NO_STATE})
+
+    first_runs = {state: _run_to_first_boundary(table, text, state, start) for state in domain}
+
+    if not need_end_state:
+        return {state: (boundary, None) for state, (boundary, _) in first_runs.items()}
+
+    boundaries = {boundary for boundary, _ in first_runs.values() if boundary is not None and boundary != ERROR}
+    end_states = {}
+
+    for boundary in sorted(boundaries):
+        if boundary not in end_states:
+            hits = []
+            end_state = _run_from_boundary(table, text, boundary, boundaries, hits)
+
+            for hit in hits:
+                end_states[hit] = end_state
+
+    return {
+        state: (boundary, end_states[boundary] if boundary not in (None, ERROR) else end_state)
+        for state, (boundary, end_state) in first_runs.items()
+    }
+
+
+def _step(table, text, state, pos):
+    """
+    Step through the DFA from state at pos until no legal transition exists or the end of the text, return the reached
+    (state, pos). trigger_on_contain actions are not called.
+    """
+    latin1_classes = table.latin1_classes
+    block_index = table.block_index
+    blocks = table.blocks
+    transitions = table.transitions
+    class_count = table.class_count
+    length = len(text)
+
+    while pos < length:
+        codepoint = ord(text[pos])
+
+        if codepoint < 256:
+            cls = latin1_classes[codepoint]
+        else:
+            cls = blocks[block_index[codepoint >> 8] + (codepoint & 0xff)]
+
+        next_state = transitions[state * class_count + cls]
+
+        if next_state < 0:
+            break
+
+        state = next_state
+        pos += 1
+
+    return state, pos
+
+
+def _run_to_first_boundary(table, text, state, pos):
+    """
+    Return (boundary, None) for the first token boundary from state at pos, (None, end_state) if the text ends before any
+    boundary and (ERROR, ERROR) on syntax error
+    """
+    state, pos = _step(table, text, state, pos)
+
+    if pos >= len(text):
+        return None, state
+
+    if not table.accepting[state]:
+        return ERROR, ERROR
+
+    return pos, None
+
+
+def _run_from_boundary(table, text, pos, watched, hits):
+    """
+    Lex text from the start state at the token boundary pos and return the state at the end of the text, ERROR on syntax
+    error. The boundaries met which are in watched are appended to hits, the runs from those boundaries being the same.
+    """
+    length = len(text)
+    start = table.start
+    accepting = table.accepting
+
+    while True:
+        if pos in watched:
+            hits.append(pos)
+
+        state, end = _step(table, text, start, pos)
+
+        if end >= length:
+            return state
+
+        if end == pos or not accepting[state]:
+            return ERROR
+
+        pos = end
@@ -0,0 +1,67 @@
+import re
+
+from compyl.__lexer.errors import LexerError
+
+# ======================================================================================================================
+# Syntax error recovery
+# ======================================================================================================================
+
+# Type of the tokens holding the text skipped after a syntax error, see Lexer.tokenize
+ERROR_TOKEN_TYPE = 'ERROR'
+
+
+def get_resync_function(table, recover):
+    """
+    Return the function resync(buffer, pos) giving the position at which lexing resumes after a syntax error in the
+    match starting at pos, which is always after pos. recover is one of
+        'char': the first character of the match is skipped
+        'start': the text is skipped up to the next character which can start a token, that is which has a transition
+            from the start state of the DFA table
+        a regular expression of the re module, as string or compiled pattern: the text is skipped up to the end of the
+            next match of the pattern, by example a linebreak or a statement terminator
+    The text is skipped up to the end of the buffer if no resync point is found.
+    """
+    if recover == 'char':
+        return _skip_char
+
+    elif recover == 'start':
+        return _get_start_skipper(table)
+
+    elif isinstance(recover, (str, re.Pattern)):
+        return _get_sync_skipper(re.compile(recover) if isinstance(recover, str) else recover)
+
+    raise LexerError("recover must be 'char', 'start' or a regular expression")
+
+
+def _skip_char(buffer, pos):
+    return pos + 1
+
+
+def _get_start_skipper(table):
+    start_row = table.start * table.class_count
+    transitions = table.transitions
+
+    # Classes of the characters which have a transition from the start state
+    starting = bytearray(transitions[start_row + cls] >= 0 for cls in range(table.class_count))
+    get_class = table.get_class
+
+    def skip_to_start(buffer, pos):
+        for index in range(pos + 1, len(buffer)):
+            if starting[get_class(ord(buffer[index]))]:
+                return index
+
+        return len(buffer)
+
+    return skip_to_start
+
+
+def _get_sync_skipper(pattern):
+    def skip_to_sync(buffer, pos):
+        match = pattern.search(buffer, pos)
+
+        if match is None:
+            return len(buffer)
+
+        return max(match.end(), pos + 1)
+
+    return skip_to_sync
@@ -214,6 +214,13 @@ def format_regexp(regexp):
     return Parser.parse(regexp)
 
 
+def escape(text):
+    """
+    Return a regular expression matching the literal text, every character which is not alphanumeric is escaped
+    """
+    return ''.join(char if char.isalnum() else '\\' + char for char in text)
+
+
 # ======================================================================================================================
 # RegExp Dummy Parser
 # ======================================================================================================================
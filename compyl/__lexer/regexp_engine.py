@@ -0,0 +1,187 @@
+import re
+
+from compyl.__lexer.errors import LexerBuildError
+from compyl.__lexer.regexp import format_regexp
+
+# ======================================================================================================================
+# Regular expression engine
+# ======================================================================================================================
+
+# Rule tags which semantics cannot be reproduced by a regular expression of the re module
+INCOMPATIBLE_TAGS = ('trigger_on_contain', 'non_greedy')
+
+
+class RegexpEngine:
+    r"""
+    Compiled form of a rule set as a single regular expression of the re module, which lets the lexer find matches
+    with the C matcher of re instead of stepping through the DFA table in Python.
+
+    The master pattern is the alternation of the rules in priority order, each rule being a group. re returns the match
+    of the first rule matching at the current position, while the DFA returns the longest match and does not step back
+    to its last accepting state, thus on '1.x' with the rule '[0-9]+(\.[0-9]+)?' it raises a syntax error where re
+    would match '1'. Both are reconciled with the follow set of every rule, the characters on which the DFA can leave
+    the accepting states returning the rule:
+    since no rule of higher priority matches at all, the DFA reaches an accepting state of the rule at the end of the
+    match, and stops there if the next character is not in the follow set of the rule. Otherwise the match is not
+    trusted and the lexer falls back on the DFA, by example for a keyword followed by a letter.
+
+    pattern: the compiled master pattern, the group i + 1 holds the match of the rule i
+    rule_states: accepting state of the DFA table returning the terminal of each group, None at index 0 and for rules
+        shadowed by others in the DFA
+    follows: match method of a pattern of the follow set of each group, None if the follow set is empty
+    """
+
+    def __init__(self, trees, terminals, table):
+        self.pattern = re.compile('|'.join('(%s)' % tree_to_pattern(tree) for tree in trees), re.DOTALL)
+
+        class_intervals = table.get_class_intervals()
+        states_by_terminal = {}
+        follows_by_terminal = {}
+
+        for state in range(table.state_count - 1, -1, -1):
+            if table.accepting[state]:
+                terminal = id(table.terminals[state])
+                states_by_terminal[terminal] = state
+                follows_by_terminal.setdefault(terminal, []).extend(
+                    interval for _, intervals in table.get_state_transitions(state, class_intervals)
+                    for interval in intervals
+                )
+
+        self.rule_states = (None,) + tuple(states_by_terminal.get(id(terminal)) for terminal in terminals)
+
+        follows = [follows_by_terminal.get(id(terminal)) for terminal in terminals]
+        self.follows = (None,) + tuple(re.compile(intervals_to_pattern(follow), re.DOTALL).match if follow else None
+                                       for follow in follows)
+
+    def match(self, buffer, pos):
+        """
+        Return the accepting state and the end of the match at pos, or None if the DFA must be used instead, that is if
+        no rule matches, if the match is followed by a character of the follow set of its rule or if it was found for a
+        rule the DFA never returns.
+        """
+        match = self.pattern.match(buffer, pos)
+
+        if match is None:
+            return None
+
+        group = match.lastindex
+        end = match.end()
+        state = self.rule_states[group]
+        follow = self.follows[group]
+
+        if state is None or (follow is not None and follow(buffer, end)):
+            return None
+
+        return state, end
+
+
+def build_regexp_engine(rules, table, trees=None):
+    """
+    Return the RegexpEngine of the rules given the DFATable built from them, or None if a rule is tagged
+    'trigger_on_contain' or 'non_greedy'. trees are the RegexpTree of the rules, parsed from their patterns if not given.
+    """
+    for rule in rules:
+        if len(rule) > 2 and rule[2] in INCOMPATIBLE_TAGS:
+            return None
+
+    try:
+        if trees is None:
+            trees = [format_regexp(rule[0]) for rule in rules]
+
+        return RegexpEngine(trees, [rule[1] for rule in rules], table)
+
+    except (re.error, RecursionError):
+        # The rules are still handled by the DFA, but a pattern too large for re cannot be used
+        return None
+
+
+def tree_to_pattern(tree):
+    """
+    Translate a RegexpTree to the syntax of the re module, intervals are written as character sets and the unions and
+    kleene stars as non-capturing groups
+    """
+    pattern = []
+
+    while tree is not None:
+        intervals = get_tree_intervals(tree)
+
+        if intervals is not None:
+            pattern.append(intervals_to_pattern(intervals))
+
+        elif tree.type == 'union':
+            if tree.fst is None or tree.snd is None:
+                optional = tree.snd if tree.fst is None else tree.fst
+                pattern.append('(?:%s)?' % tree_to_pattern(optional))
+
+            else:
+                pattern.append('(?:%s|%s)' % (tree_to_pattern(tree.fst), tree_to_pattern(tree.snd)))
+
+        elif tree.type == 'kleene':
+            repeated = get_tree_intervals(tree.pattern) if tree.pattern.next is None else None
+
+            if repeated is not None:
+                pattern.append(intervals_to_pattern(repeated) + '*')
+
+            else:
+                pattern.append('(?:%s)*' % tree_to_pattern(tree.pattern))
+
+        else:
+            raise LexerBuildError("RegexpTree type found does not match 'single', 'union' or 'kleene'")
+
+        tree = tree.next
+
+    return ''.join(pattern)
+
+
+def get_tree_intervals(tree):
+    """
+    Return the list of intervals matched by the head of the tree if it is a single character or a union of single
+    characters (as parsed from a set), None otherwise. The rest of the chain after the head is not considered.
+    """
+    if tree is None:
+        return None
+
+    if tree.type == 'single':
+        return [(tree.min_ascii, tree.max_ascii)]
+
+    if tree.type == 'union' and tree.fst is not None and tree.snd is not None:
+        if tree.fst.next is not None or tree.snd.next is not None:
+            return None
+
+        fst = get_tree_intervals(tree.fst)
+        snd = get_tree_intervals(tree.snd)
+
+        if fst is not None and snd is not None:
+            return fst + snd
+
+    return None
+
+
+def intervals_to_pattern(intervals):
+    """
+    Return the re syntax matching a character in one of the intervals
+    """
+    if len(intervals) == 1 and intervals[0][0] == intervals[0][1]:
+        return escape_code_point(intervals[0][0])
+
+    return '[%s]' % ''.join(
+        escape_code_point(min_ascii) if min_ascii == max_ascii else
+        '%s-%s' % (escape_code_point(min_ascii), escape_code_point(max_ascii))
+        for min_ascii, max_ascii in sorted(intervals)
+    )
+
+
+def escape_code_point(code_point):
+    """
+    Return a code point as it can be written in a re pattern, inside or outside of a character set
+    """
+    if code_point < 0x80 and chr(code_point).isalnum():
+        return chr(code_point)
+
+    elif code_point <= 0xff:
+        return '\\x%02x' % code_point
+
+    elif code_point <= 0xffff:
+        return '\\u%04x' % code_point
+
+    return '\\U%08x' % code_point
@@ -0,0 +1,75 @@
+# ======================================================================================================================
+# Lexer instrumentation
+# ======================================================================================================================
+
+
+class LexerStats:
+    """
+    Statistics recorded by an instrumented Lexer, see Lexer.enable_stats. Times are in seconds.
+
+    matches, tokens, chars: number of matches, of matches returning a token and of matched characters
+    transitions: number of DFA transitions taken, which differs from chars when trigger_on_contain actions move pos
+    rule_matches, rule_chars: number of matches and of matched characters of every rule, by index in the rules. Matches
+        are attributed to rules through the terminal_rules of the DFA table, which all Lexer sharing the table can use.
+    callback_calls, callback_time: number of calls and time spent in the rules which are functions
+    action_calls, action_time: number of calls and time spent in terminal actions
+    contain_firings, contain_time: number of calls and time spent in trigger_on_contain actions
+    elapsed: time spent lexing, from the first to the last match of every scan, including the time the consumer of
+        the matches takes to build the tokens
+    """
+
+    def __init__(self, patterns, state_rules):
+        self.patterns = patterns
+        self.state_rules = state_rules
+        self.reset()
+
+    def __repr__(self):
+        return "<LexerStats %d matches, %d tokens, %.0f chars/s>" % (self.matches, self.tokens,
+                                                                     self.chars_per_second)
+
+    def reset(self):
+        """
+        Reset all statistics to zero
+        """
+        self.matches = 0
+        self.tokens = 0
+        self.chars = 0
+        self.transitions = 0
+        self.rule_matches = [0] * len(self.patterns)
+        self.rule_chars = [0] * len(self.patterns)
+        self.callback_calls = 0
+        self.callback_time = 0.0
+        self.action_calls = 0
+        self.action_time = 0.0
+        self.contain_firings = 0
+        self.contain_time = 0.0
+        self.elapsed = 0.0
+
+    def record_match(self, state, length, steps):
+        rule = self.state_rules[state]
+
+        self.matches += 1
+        self.chars += length
+        self.transitions += steps
+
+        if rule is not None:
+            self.rule_matches[rule] += 1
+            self.rule_chars[rule] += length
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chars_per_second(self):
+        return self.chars / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def transitions_per_match(self):
+        return self.transitions / self.matches if self.matches else 0.0
+
+    def get_rule_stats(self):
+        """
+        Return the list of tuples (pattern, matches, chars) of every rule, in order of declaration
+        """
+        return list(zip(self.patterns, self.rule_matches, self.rule_chars))
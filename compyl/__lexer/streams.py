@@ -0,0 +1,167 @@
+import codecs
+import mmap
+import os
+import re
+
+from compyl.__lexer.errors import LexerError
+
+
+# ======================================================================================================================
+# Stream helpers
+# ======================================================================================================================
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Yielded by a stream scanner when it needs the next chunk, see Lexer._scan_stream
+NEED_CHUNK = object()
+
+NON_ASCII_BYTE = re.compile(b'[\x80-\xff]')
+
+
+def iter_text_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+    """
+    Given a file object (anything with a read method) or an iterable of chunks, yield its content as non-empty strings.
+    File objects are read chunk_size at a time. Chunks of bytes are decoded incrementally with the given encoding, thus a
+    multi-byte character may be split between two chunks.
+    """
+    if hasattr(source, 'read'):
+        chunks = iter_file_chunks(source, chunk_size)
+    else:
+        chunks = iter(source)
+
+    decoder = ChunkDecoder(encoding)
+
+    for chunk in chunks:
+        chunk = decoder.decode(chunk)
+
+        if chunk:
+            yield chunk
+
+    chunk = decoder.flush()
+
+    if chunk:
+        yield chunk
+
+
+async def aiter_text_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+    """
+    Asynchronous counterpart of iter_text_chunks. Given an object with a read coroutine, such as an asyncio.StreamReader,
+    or an asynchronous iterable of chunks, yield its content as non-empty strings.
+    """
+    decoder = ChunkDecoder(encoding)
+
+    if hasattr(source, 'read'):
+        while True:
+            chunk = await source.read(chunk_size)
+
+            if not chunk:
+                break
+
+            chunk = decoder.decode(chunk)
+
+            if chunk:
+                yield chunk
+
+    else:
+        async for chunk in source:
+            chunk = decoder.decode(chunk)
+
+            if chunk:
+                yield chunk
+
+    chunk = decoder.flush()
+
+    if chunk:
+        yield chunk
+
+
+class ChunkDecoder:
+    """
+    Decode chunks of a stream which are either strings, returned as is, or bytes decoded incrementally with encoding
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.decoder = None
+
+    def decode(self, chunk):
+        if isinstance(chunk, (bytes, bytearray, memoryview)):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder(self.encoding)()
+
+            return self.decoder.decode(chunk)
+
+        elif not isinstance(chunk, str):
+            raise LexerError("stream chunks must be strings or bytes")
+
+        return chunk
+
+    def flush(self):
+        """
+        Return the end of the decoded stream, raise a UnicodeDecodeError if it ends with an incomplete character
+        """
+        return '' if self.decoder is None else self.decoder.decode(b'', final=True)
+
+
+def iter_file_chunks(file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the content of a file object chunk_size at a time until it is exhausted
+    """
+    while True:
+        chunk = file.read(chunk_size)
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def map_file(path):
+    """
+    Map the file at path in memory for reading and return the mmap object, or empty bytes if the file is empty since
+    empty files cannot be mapped. The file itself is closed, the mapping stays valid as long as it is referenced.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def unmap_file(mapped):
+    """
+    Close a mapping returned by map_file
+    """
+    if isinstance(mapped, mmap.mmap):
+        mapped.close()
+
+
+def check_ascii(data):
+    """
+    Raise a LexerError if the bytes-like data holds a byte which is not ASCII, above 127
+    """
+    match = NON_ASCII_BYTE.search(data)
+
+    if match is not None:
+        raise LexerError("byte 0x%02x at offset %d is not ascii" % (data[match.start()], match.start()))
+
+
+def is_ascii_encoding(encoding):
+    return codecs.lookup(encoding).name == 'ascii'
+
+
+def is_utf8_encoding(encoding):
+    """
+    Return True if the encoding is UTF-8 and False if it is Latin-1 or ASCII, in which case bytes are code points.
+    Raise a LexerError for any other encoding as they cannot be decoded on the fly.
+    """
+    name = codecs.lookup(encoding).name
+
+    if name == 'utf-8':
+        return True
+
+    elif name in ('iso8859-1', 'ascii'):
+        return False
+
+    else:
+        raise LexerError("bytes can only be lexed as utf-8, latin-1 or ascii, not '%s'" % encoding)
@@ -0,0 +1,266 @@
+from array import array
+
+
+# ======================================================================================================================
+# Tokens returned by the Lexer
+# ======================================================================================================================
+
+
+class Token:
+    """
+    Basic token built by the lexer
+    type_id is the index of the token type in the token_types of the Lexer, None if the type is not declared by a rule
+    start_params is a copy of the params of the Lexer at the start of the token, only recorded if the token was built
+    by Lexer.tokenize with snapshots=True, see Lexer.relex
+    """
+
+    start_params = None
+
+    def __init__(self, type, value, pos, end_pos, params=None, lineno=None, type_id=None):
+        self.type = type
+        self.type_id = type_id
+        self.value = value
+        self.pos = pos
+        self.end_pos = end_pos
+        self.lineno = lineno
+        self.params = params
+
+    def __str__(self):
+        return "<Lexer Token %s line %s>" % (self.type, str(self.lineno))
+
+    def __eq__(self, other):
+        if isinstance(other, Token):
+            return self.type == other.type
+
+        else:
+            return NotImplemented
+
+
+class LazyToken(Token):
+    """
+    Token built by a lazy Lexer, it only stores its type and offsets in the buffer. Its value is sliced from the buffer,
+    and its lineno and column computed from the LineIndex of the buffer, when first accessed.
+    Lazy line numbers count the linebreak of the Lexer, '\n' by default, in the buffer, they do not depend on its
+    line_rule.
+    """
+
+    def __init__(self, type, line_index, pos, end_pos, params=None, type_id=None):
+        self.type = type
+        self.type_id = type_id
+        self.pos = pos
+        self.end_pos = end_pos
+        self.params = params
+        self.line_index = line_index
+
+        self._value = self._lineno = self._column = None
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = self.line_index.buffer[self.pos:self.end_pos]
+
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    @property
+    def lineno(self):
+        if self._lineno is None:
+            self._lineno = self.line_index.get_lineno(self.pos)
+
+        return self._lineno
+
+    @lineno.setter
+    def lineno(self, lineno):
+        self._lineno = lineno
+
+    @property
+    def column(self):
+        if self._column is None:
+            self._column = self.line_index.get_column(self.pos)
+
+        return self._column
+
+    @column.setter
+    def column(self, column):
+        self._column = column
+
+
+class MappedToken(Token):
+    """
+    Token built by Lexer.lex_file, its pos and end_pos are byte offsets in the mapped file and its value is only
+    decoded from the mapped bytes when accessed
+    """
+
+    def __init__(self, type, mapped, encoding, pos, end_pos, params=None, lineno=None, type_id=None):
+        self.mapped = mapped
+        self.encoding = encoding
+        self._value = None
+
+        super().__init__(type, None, pos, end_pos, params=params, lineno=lineno, type_id=type_id)
+
+    @property
+    def value(self):
+        if self._value is None:
+            self._value = str(self.mapped[self.pos:self.end_pos], self.encoding)
+
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+
+    def detach(self):
+        """
+        Decode the value and drop the reference to the mapped file, which can then be closed
+        """
+        self._value = self.value
+        self.mapped = None
+
+
+class TokenArray:
+    """
+    Columnar storage of tokens built by the lexer when tokenizing with columnar=True. Instead of a Token object per
+    match, the tokens are stored as parallel arrays:
+
+    type_ids: id of the token type, the type itself is type_names[type_id]. The type names start with the token_types
+        of the Lexer, thus ids are the same as Token.type_id. Types returned dynamically by rules are registered after
+        them, their ids are only valid within the array and the tokens it builds have None as type_id, as Token does.
+    declared_count: number of type names declared by the Lexer, the ids below it are those of Token.type_id
+    pos, end_pos: offsets of the token in the buffer
+    lineno: line number at the start of the token
+
+    Token params are rare, they are stored in the params dict keyed by index of the token and values are sliced from the
+    buffer only when requested. The arrays support the buffer protocol, thus they can be wrapped without copy with
+    numpy.frombuffer for analytics.
+
+    Indexing a TokenArray returns a Token, slicing returns a new TokenArray and iterating yields Token objects built on
+    the fly.
+    """
+
+    def __init__(self, buffer='', type_names=None):
+        self.buffer = buffer
+        self.type_names = [] if type_names is None else list(type_names)
+        self._type_ids = {type: type_id for type_id, type in enumerate(self.type_names)}
+        self.declared_count = len(self.type_names)
+
+        self.type_ids = array('i')
+        self.pos = array('q')
+        self.end_pos = array('q')
+        self.lineno = array('q')
+        self.params = {}
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_token(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._get_slice(index)
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("TokenArray index out of range")
+
+        return self.get_token(index)
+
+    def _get_slice(self, index):
+        dup = TokenArray(self.buffer)
+        dup.type_names = self.type_names
+        dup._type_ids = self._type_ids
+        dup.declared_count = self.declared_count
+
+        dup.type_ids = self.type_ids[index]
+        dup.pos = self.pos[index]
+        dup.end_pos = self.end_pos[index]
+        dup.lineno = self.lineno[index]
+
+        for new_index, old_index in enumerate(range(*index.indices(len(self)))):
+            if old_index in self.params:
+                dup.params[new_index] = self.params[old_index]
+
+        return dup
+
+    def get_type_id(self, type):
+        """
+        Return the id of the given token type, registering it if it was never seen
+        """
+        try:
+            return self._type_ids[type]
+        except KeyError:
+            type_id = self._type_ids[type] = len(self.type_names)
+            self.type_names.append(type)
+            return type_id
+
+    def append(self, type_id, pos, end_pos, lineno, params=None):
+        """
+        Append a token to the columns, see get_type_id to recover the id of a type
+        """
+        if params is not None:
+            self.params[len(self)] = params
+
+        self.type_ids.append(type_id)
+        self.pos.append(pos)
+        self.end_pos.append(end_pos)
+        self.lineno.append(lineno)
+
+    def extend(self, other, pos_offset=0, lineno_offset=0):
+        """
+        Append the tokens of another TokenArray, shifting their pos and end_pos by pos_offset and their lineno by
+        lineno_offset. The type ids of other are remapped if its types were registered in a different order.
+        """
+        count = len(self)
+        type_ids = [self.get_type_id(type) for type in other.type_names]
+
+        if type_ids == list(range(len(type_ids))):
+            self.type_ids.extend(other.type_ids)
+        else:
+            self.type_ids.extend(array('i', [type_ids[type_id] for type_id in other.type_ids]))
+
+        if pos_offset:
+            self.pos.extend(array('q', [pos + pos_offset for pos in other.pos]))
+            self.end_pos.extend(array('q', [end_pos + pos_offset for end_pos in other.end_pos]))
+        else:
+            self.pos.extend(other.pos)
+            self.end_pos.extend(other.end_pos)
+
+        if lineno_offset:
+            self.lineno.extend(array('q', [lineno + lineno_offset for lineno in other.lineno]))
+        else:
+            self.lineno.extend(other.lineno)
+
+        for index, params in other.params.items():
+            self.params[count + index] = params
+
+    def get_type(self, index):
+        return self.type_names[self.type_ids[index]]
+
+    def get_value(self, index):
+        return self.buffer[self.pos[index]:self.end_pos[index]]
+
+    def get_token(self, index):
+        """
+        Build the Token object stored at index
+        """
+        type_id = self.type_ids[index]
+
+        return Token(self.type_names[type_id],
+                     self.get_value(index),
+                     self.pos[index],
+                     self.end_pos[index],
+                     params=self.params.get(index),
+                     lineno=self.lineno[index],
+                     type_id=type_id if type_id < self.declared_count else None)
+
+    def to_tokens(self):
+        """
+        Return the list of Token objects stored in the array
+        """
+        return list(self)
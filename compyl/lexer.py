@@ -1,12 +1,31 @@
 import copy
+import os
+import weakref
+from time import perf_counter
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import dill
 
-from compyl.__lexer.finite_automaton import DFA, NodeIsNotTerminalState
+from compyl.__lexer.dfa_table import CALLED_TERMINAL, STATIC_TERMINAL, NO_STATE, SELECTED_STATE, UNRESOLVED_STATE
+from compyl.__lexer.dfa_cache import dfa_cache, set_artifact_directory
 from compyl.__lexer.errors import LexerError, LexerSyntaxError, LexerBuildError, RegexpParsingError
 from compyl.__lexer.metaclass import MetaLexer
+from compyl.__lexer.streams import iter_text_chunks, aiter_text_chunks, map_file, unmap_file, check_ascii, \
+    is_utf8_encoding, is_ascii_encoding, DEFAULT_CHUNK_SIZE, NEED_CHUNK
+from compyl.__lexer.tokens import Token, LazyToken, MappedToken, TokenArray
+from compyl.__lexer.lines import LineIndex, count_linebreaks
+from compyl.__lexer.counts import TokenCounts
+from compyl.__lexer.recovery import get_resync_function, ERROR_TOKEN_TYPE
+from compyl.__lexer.stats import LexerStats
+from compyl.__lexer.parallel import split_at_sync_points, get_speculative_bounds, lex_chunk, init_worker, \
+    lex_chunk_in_worker, lex_documents_in_worker, iter_batches, count_chunk, count_chunk_in_worker, CHUNKS_PER_WORKER, \
+    DOCUMENTS_PER_BATCH
 
 
-__all__ = ['Token', 'Lexer', 'LexerError', 'LexerSyntaxError', 'LexerBuildError', 'RegexpParsingError']
+__all__ = ['Token', 'LazyToken', 'TokenArray', 'TokenCounts', 'LexerStats', 'Lexer', 'CompiledLexer', 'LexSession',
+           'LexerError', 'LexerSyntaxError', 'LexerBuildError', 'RegexpParsingError', 'set_artifact_directory']
 
 
 # ======================================================================================================================
@@ -14,30 +33,6 @@ __all__ = ['Token', 'Lexer', 'LexerError', 'LexerSyntaxError', 'LexerBuildError'
 # ======================================================================================================================
 
 
-class Token:
-    """
-    Basic token built by the lexer
-    """
-
-    def __init__(self, type, value, pos, end_pos, params=None, lineno=None):
-        self.type = type
-        self.value = value
-        self.pos = pos
-        self.end_pos = end_pos
-        self.lineno = lineno
-        self.params = params
-
-    def __str__(self):
-        return "<Lexer Token %s line %s>" % (self.type, str(self.lineno))
-
-    def __eq__(self, other):
-        if isinstance(other, Token):
-            return self.type == other.type
-
-        else:
-            return NotImplemented
-
-
 class Lexer(metaclass=MetaLexer):
     """
     Tokenize a string given a set of rules by building a Deterministic Finite Automaton.
@@ -58,6 +53,11 @@ class Lexer(metaclass=MetaLexer):
     even if the pattern is encountered inside another pattern (a multi-line comments for say). Lexer.set_line_rule,
     takes a tuple (regex, rule) as argument.
 
+    If linebreaks are a fixed string, the linebreak class keyword replaces line_rule, by example
+    class MyLexer(Lexer, linebreak='\n'). Linebreaks are then ignored when they match no other rule and the Lexer
+    counts them in every match with str.count, instead of compiling the 'trigger_on_contain' rule of line_rule into the
+    DFA and calling it on each linebreak. Lexer.get_column returns the column of a position in the buffer.
+
     Rules can also be passed with a third parameter, (regexp, rule, action). Action is a string that can take the
     following values:
 
@@ -81,6 +81,42 @@ class Lexer(metaclass=MetaLexer):
     Lexer.drop_old_buffer drops the part of the buffer before 'pos'
 
     Lexer.lex reads the Lexer.buffer and returns a Token or None if it reached the end of the buffer
+
+    Lexer.tokenize and Lexer.tokenize_all respectively yield and return all tokens up to the end of the buffer in a
+    single loop, Lexer.tokenize_columnar stores them in a TokenArray instead
+    With recover, they skip untokenizable text as ERROR tokens instead of raising LexerSyntaxError
+
+    Lexer.lex_stream yields the tokens of a file object or iterable of chunks, reading it incrementally, and Lexer.alex
+    is its asynchronous counterpart for an asyncio.StreamReader or asynchronous iterable of chunks
+
+    Lexer.relex updates the tokens of the buffer after an edit, only lexing again the tokens the edit may change
+
+    Lexer.tokenize_many lexes each string of a batch of small documents independently, reusing a single lexer
+
+    Lexer.count counts the tokens of a string, bytes or stream by type without building them
+
+    Lexer.enable_stats instruments the lexer to record per-rule matches and the time spent in rules and actions
+
+    Lexer.tokenize_parallel lexes a large text in a pool of processes, splitting it at user-declared sync points
+
+    Lexer.lex_file yields the tokens of a file mapped in memory, Lexer.tokenize_bytes those of bytes-like data
+
+    The DFA of a Lexer class is built at its first instantiation and shared by all its instances, and by the classes
+    with identical rules, through the process-wide cache compyl.__lexer.dfa_cache. Its tables are also stored in a
+    binary artifact in the per-user cache directory, from which later processes load it instead of building it again.
+    compyl.set_artifact_directory moves or disables the artifacts.
+    Lexer.dfa.get_report describes the size of the DFA and the time of its build phases, Lexer.dfa.to_dot and
+    Lexer.dfa.to_json export the minimized automaton.
+
+    Lexer.compile returns a CompiledLexer, a frozen handle on the DFA of the class from which any number of threads can
+    lex concurrently, each in its own LexSession
+
+    A Lexer created with lazy=True returns LazyToken, which value, lineno and column are only computed when accessed
+
+    With engine='regexp' or 'auto', rules without 'trigger_on_contain' and 'non_greedy' tags are compiled to a master
+    regular expression matched by the re module, the DFA remaining the fallback, see the engine parameter of
+    Lexer.__init__. The DFA can also be compiled to a specialized Python module cached on disk with engine='generated'.
+    Lexer.verify_engines cross-checks an engine against the DFA table on sample inputs
     """
 
     class LexerController:
@@ -92,9 +128,20 @@ class Lexer(metaclass=MetaLexer):
         A word on the fact that params is entirely accessible and actually points to the Lexer: we allow this instead of
         providing functions for reading/updating the params because it doesn't play a role in the inner logic of the
         lexer, thus it is ok to directly mutate it.
+
+        A Lexer creates a single controller which is bound again to the current match before every call, thus a
+        function must not keep the controller it is given once it returns.
         """
 
         def __init__(self, master, init_lineno, init_pos, forced_pos=None):
+            self._master = master
+            self.bind(init_lineno, init_pos, forced_pos)
+
+        def bind(self, init_lineno, init_pos, forced_pos=None):
+            """
+            Update the controller to the current state of the Lexer and return it
+            """
+            master = self._master
             self.lineno = master.lineno
 
             # On trigger_on_contain actions, sub-patterns trigger actions lazily, thus the end pos is at the last
@@ -106,26 +153,53 @@ class Lexer(metaclass=MetaLexer):
             self.init_lineno = init_lineno
             self.init_pos = init_pos
 
-            def increment_line(*args):
-                increment = args[0] if args else 1
-                master.lineno += increment
-                self.lineno += increment
+            return self
+
+        def increment_line(self, increment=1):
+            self._master.lineno += increment
+            self.lineno += increment
 
-            def increment_pos(*args):
-                increment = args[0] if args else 1
-                master.pos += increment
-                self.pos += increment
+        def increment_pos(self, increment=1):
+            self._master.pos += increment
+            self.pos += increment
 
-            self.increment_line = increment_line
-            self.increment_pos = increment_pos
+    # Tuple of the token types returned by the rules, generated by the metaclass. Token.type_id is an index in it.
+    token_types = ()
 
-    def __init__(self, _dfa=None):
+    # Linebreak counted natively by the lexer, given as class keyword
+    __linebreak__ = None
+
+    def __init__(self, _dfa=None, lazy=False, engine='dfa', cache_dir=None):
         """
 
         :param _dfa: A dfa can be passed by the __copy__ or __deepcopy__ methods to avoid the costly operation of
         building another DFA.
+        :param lazy: If True, tokens built from the buffer are LazyToken which only store their type and offsets. Their
+        value, lineno and column are computed when accessed.
+        :param engine: How matches are found in a string buffer. With 'regexp', the rules are compiled to a master
+        regular expression matched by the re module, which requires that no rule is tagged 'trigger_on_contain' or
+        'non_greedy' (line_rule included, unlike the linebreak class keyword). With 'dfa', the default, the DFA table is
+        always stepped through, in time linear in the length of the buffer. 'auto' uses the regular expression if the
+        rules allow it and the DFA otherwise. Since re backtracks, a rule with nested or overlapping quantifiers, such
+        as '(a+)+b', can take exponential time with 'regexp' or 'auto' on a buffer which does not match it, thus they
+        should only be used with rules known to be safe. With 'generated', the DFA is compiled to a Python module in
+        which every state is specialized code, see compyl.__lexer.codegen. Bytes, files and streams are always lexed
+        with the DFA table.
+        :param cache_dir: Directory where the modules generated with engine='generated' are written and imported from,
+        by default the per-user cache directory $XDG_CACHE_HOME/compyl or ~/.cache/compyl. It is created private to the
+        current user and nothing is imported from it if another user can write to it.
         """
 
+        if engine not in ('auto', 'regexp', 'dfa', 'generated'):
+            raise LexerError("engine must be 'auto', 'regexp', 'dfa' or 'generated'")
+
+        self.lazy = lazy
+        self.engine = engine
+        self.cache_dir = cache_dir
+
+        # Index of the linebreaks of the buffer shared by lazy tokens, see Lexer._get_line_index
+        self._line_index = None
+
         # Line number of the pointer
         self.lineno = 1
 
@@ -135,25 +209,73 @@ class Lexer(metaclass=MetaLexer):
         # Code/string to be tokenized by the lexer
         self.buffer = ""
 
-        # The following are class attributes generated by the metaclass
-        self.rules = copy.deepcopy(self.__rules__)
+        # The following are class attributes generated by the metaclass, rules are tuples which are never mutated
+        self.rules = list(self.__rules__)
         self.params = copy.deepcopy(self.__params__)
+        self.linebreak = self.__linebreak__
 
         self.terminal_actions = []
+
+        # Terminal actions triggered on ignored matches and on tokens, in order of declaration
+        self._ignored_actions = []
+        self._token_actions = []
+
         self._parse_terminal_actions(self.__terminal_actions__)
 
-        # Build the dfa
+        # Controller passed to all rules and actions, see LexerController.bind
+        self._controller = self.LexerController(self, self.lineno, self.pos)
+
+        # LexerStats recorded since Lexer.enable_stats, None if the lexer is not instrumented
+        self.stats = None
+
+        # Params at the start of the buffer when it was last lexed from its start with snapshots, see Lexer.relex
+        self._initial_params = None
+
+        # The dfa is built once per class and shared by its instances
         if _dfa is not None:
             self.dfa = _dfa
         else:
-            self.dfa = DFA(rules=self.rules)
+            self.dfa = self._get_compiled_dfa()
+
+        # RegexpEngine used to find matches in string buffers, None if the DFA is used
+        self._regexp_engine = self.dfa.get_regexp_engine() if engine in ('auto', 'regexp') else None
+
+        # Match function of the generated scanner, None if it is not used
+        self._generated_scanner = self.dfa.get_generated_scanner(cache_dir) if engine == 'generated' else None
+
+        if engine == 'regexp' and self._regexp_engine is None:
+            raise LexerBuildError(
+                "rules cannot be compiled to a regular expression, they must not be tagged 'trigger_on_contain' or "
+                "'non_greedy'"
+            )
+
+    @classmethod
+    def _get_compiled_dfa(cls):
+        """
+        Return the DFA of the rules of the class, built at its first instantiation. Classes with identical rules, by
+        example generated dynamically, share the same DFA through the process-wide cache compyl.__lexer.dfa_cache.
+        """
+        dfa = cls.__dict__.get('_compiled_dfa')
+
+        if dfa is None:
+            dfa = dfa_cache.get(cls.__rules__)
+            cls._compiled_dfa = dfa
+
+        return dfa
+
+    @classmethod
+    def compile(cls, engine='dfa', cache_dir=None, lazy=False):
+        """
+        Return the CompiledLexer of the class, see Lexer.__init__ for the parameters
+        """
+        return CompiledLexer(cls, engine=engine, cache_dir=cache_dir, lazy=lazy)
 
     def __copy__(self):
         """
         Copy the lexer, but reuse the same DFA
         """
 
-        dup = type(self)(_dfa=self.dfa)
+        dup = type(self)(_dfa=self.dfa, lazy=self.lazy, engine=self.engine, cache_dir=self.cache_dir)
         dup.params = self.params
 
         dup.lineno = self.lineno
@@ -166,7 +288,8 @@ class Lexer(metaclass=MetaLexer):
         """
         Copy the lexer with its rules and DFA
         """
-        dup = type(self)(_dfa=copy.deepcopy(self.dfa))
+        dup = type(self)(_dfa=copy.deepcopy(self.dfa), lazy=self.lazy, engine=self.engine,
+                         cache_dir=self.cache_dir)
         dup.params = copy.deepcopy(self.params)
 
         dup.lineno = self.lineno
@@ -222,6 +345,12 @@ class Lexer(metaclass=MetaLexer):
             if callable(action_fn):
                 self.terminal_actions.append((action_fn, trigger_code))
 
+                if trigger_code <= 0:
+                    self._ignored_actions.append(action_fn)
+
+                if trigger_code >= 0:
+                    self._token_actions.append(action_fn)
+
             else:
                 raise LexerError("""terminal action must be of type (function, string) tuple,
                     the string can take values 'always', 'only_ignored' or 'only_tokens'""")
@@ -241,148 +370,1547 @@ class Lexer(metaclass=MetaLexer):
         else:
             raise LexerError("The unpickled object from " + path + " is not a Lexer")
 
-    def lex(self):
-        if self.pos >= len(self.buffer):
-            return None
+    def _advance(self, state, init_pos, init_lineno):
+        """
+        Step through the DFA table from the given state at the current position until no legal transition exists or
+        the end of the buffer is reached, and update pos accordingly.
+        trigger_on_contain actions are called as the states holding them are attained.
+        Return a tuple (state, blocked) where blocked is True if a character without legal transition was found and
+        False if the end of the buffer was reached, in which case stepping can be resumed from the returned state once
+        the buffer is extended.
+        """
+        table = self.dfa.table
+        latin1_classes = table.latin1_classes
+        block_index = table.block_index
+        blocks = table.blocks
+        transitions = table.transitions
+        class_count = table.class_count
+        special_actions = table.special_actions
+
+        buffer = self.buffer
+        length = len(buffer)
+        pos = self.pos
+
+        while pos < length:
+            codepoint = ord(buffer[pos])
+
+            if codepoint < 256:
+                cls = latin1_classes[codepoint]
+            else:
+                cls = blocks[block_index[codepoint >> 8] + (codepoint & 0xff)]
 
-        # Start at empty state of DFA
-        self.dfa.reset_current_state()
+            next_state = transitions[state * class_count + cls]
 
-        init_lineno = self.lineno
+            if next_state < 0:
+                self.pos = pos
+                return state, True
+
+            state = next_state
+
+            if special_actions[state]:
+                # Actions may move the position of the lexer through their controller
+                self.pos = pos
+
+                for action in special_actions[state]:
+                    action(self._controller.bind(init_lineno, init_pos, pos + 1))
+
+                pos = self.pos
+
+            pos += 1
+
+        self.pos = pos
+        return state, False
+
+    def _advance_bytes(self, table, state, init_pos, init_lineno):
+        """
+        Same as Lexer._advance, but the buffer is made of bytes stepped through with the given ByteDFATable. Positions
+        are byte offsets. If the DFA stops in the middle of a multi-byte character, the match is rewound to the start of
+        that character.
+        """
+        transitions = table.transitions
+        special_actions = table.special_actions
+        code_point_state_count = table.code_point_state_count
+
+        buffer = self.buffer
+        length = len(buffer)
+        pos = self.pos
+
+        # State and position at the start of the current multi-byte character
+        char_state = char_pos = None
+
+        while pos < length:
+            next_state = transitions[state << 8 | buffer[pos]]
+
+            if next_state < 0:
+                if state >= code_point_state_count:
+                    state, pos = char_state, char_pos
+
+                self.pos = pos
+                return state, True
+
+            if next_state >= code_point_state_count and state < code_point_state_count:
+                char_state, char_pos = state, pos
+
+            state = next_state
+
+            if special_actions[state]:
+                self.pos = pos
+
+                for action in special_actions[state]:
+                    action(self._controller.bind(init_lineno, init_pos, pos + 1))
+
+                pos = self.pos
+
+            pos += 1
+
+        if state >= code_point_state_count:
+            state, pos = char_state, char_pos
+
+        self.pos = pos
+        return state, False
+
+    def _match(self):
+        """
+        Step through the DFA table from the current position until no legal transition exists, update pos to the end
+        of the longest match and return the reached state.
+        If the lexer uses a RegexpEngine, the match is found by it instead and the DFA is only used if it cannot be
+        trusted, see RegexpEngine.match. If the lexer uses a generated scanner, it is stepped through instead of the
+        table.
+        """
         init_pos = self.pos
-        terminal_token = None
 
-        # Step through the Finite State Automaton
-        while True:
-            end_of_buffer = False
-            try:
-                lookout = self.buffer[self.pos]
-            except IndexError:
-                # End of buffer
-                end_of_buffer = True
+        if self._generated_scanner is not None:
+            init_lineno = self.lineno
+            state, self.pos = self._generated_scanner(self.buffer, self.pos, self._trigger_special_actions, init_lineno)
 
-            lookout_state = None if end_of_buffer else self.dfa.push(lookout)
+            if self.linebreak is not None:
+                self.lineno += self.buffer.count(self.linebreak, init_pos, self.pos)
 
-            if lookout_state and lookout_state.has_special_action():
-                special_actions = lookout_state.get_special_actions()
+            if not self.dfa.table.accepting[state]:
+                raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=self.pos)
 
-                for action_type, action in special_actions:
+            return state
 
-                    if action_type == DFA.TRIGGER_ON_CONTAIN:
-                        controller = self.LexerController(
-                            self,
-                            init_lineno,
-                            init_pos,
-                            forced_pos=self.pos + 1
-                        )
-                        action(controller)
+        if self._regexp_engine is not None:
+            match = self._regexp_engine.match(self.buffer, self.pos)
 
-            if lookout_state is None:
-                try:
-                    terminal_token = self.dfa.get_current_state_terminal()
-                except NodeIsNotTerminalState:
-                    raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=self.pos)
+            if match is not None:
+                state, self.pos = match
+
+                if self.linebreak is not None:
+                    self.lineno += self.buffer.count(self.linebreak, init_pos, self.pos)
+
+                return state
+
+        return self._match_dfa()
+
+    def _match_dfa(self):
+        """
+        Same as Lexer._match, but the DFA table is always stepped through
+        """
+        table = self.dfa.table
+        init_pos = self.pos
+
+        state, _ = self._advance(table.start, init_pos, self.lineno)
+
+        if self.linebreak is not None:
+            self.lineno += self.buffer.count(self.linebreak, init_pos, self.pos)
+
+        if not table.accepting[state]:
+            raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=self.pos)
 
-                break
+        return state
 
-            self.pos += 1
+    def _trigger_special_actions(self, state, pos, init_pos, init_lineno):
+        """
+        Call the trigger_on_contain actions of the state attained on the character at pos, as Lexer._advance does, and
+        return the position from which stepping resumes. Used as trigger by the generated scanner.
+        """
+        self.pos = pos
 
-        # Exited the FSA, a terminal instruction was given
+        for action in self.dfa.table.special_actions[state]:
+            action(self._controller.bind(init_lineno, init_pos, pos + 1))
 
-        # value is later used to increment line number if a line_rule was set, also returned in the Token
-        value = self.buffer[init_pos:self.pos]
-        ignore = False
+        return self.pos
 
+    def _call_terminal(self, terminal_token, init_pos, init_lineno):
+        """
+        Resolve the terminal token of the match from init_pos to pos, calling it if it is a function.
+        Return a tuple (token_type, token_params), or None if the match is to be ignored.
+        """
         # OBSOLETE WARNING: terminal_token should now only be a callable
         # Although, to go around the class syntax we might still allow that for the future
 
         # A None terminal token represents an ignored state (usually spaces and linebreaks)
         if terminal_token is None:
-            ignore = True
+            return None
 
-        elif isinstance(terminal_token, str):
+        if isinstance(terminal_token, str):
             # Case where the terminal token is a string
-            token = Token(
-                terminal_token,
-                value,
-                init_pos,
-                self.pos,
-                lineno=init_lineno)
+            return terminal_token, None
+
+        # Case where the terminal token is a function to be called
+        # We expect rule to be a function LexerController -> string -> string/None
+        # if a string is returned, it is taken as the Token type
+        # if None is returned, it is interpreted as an ignored sequence
+
+        controller = self._controller.bind(init_lineno, init_pos)
 
+        try:
+            token_return = terminal_token(controller)
+        except TypeError:
+            raise LexerError("Lexer rules must be string or function LexerController -> (string/None, *)")
+
+        if isinstance(token_return, str):
+            return token_return, None
+        elif token_return is None:
+            return None
+        elif isinstance(token_return, tuple) and isinstance(token_return[0], str):
+            return token_return[0], token_return[1]
         else:
-            # Case where the terminal token is a function to be called
-            # We expect rule to be a function LexerController -> string -> string/None
-            # if a string is returned, it is taken as the Token type
-            # if None is returned, it is interpreted as an ignored sequence
-
-            controller = self.LexerController(
-                self,
-                init_lineno,
-                init_pos
+            raise LexerError(
+                """Lexer rules as functions must return string or None as first return value. An optional second
+                value can be returned to be stored in the token 'params' attribute."""
             )
 
+    def _resolve_terminal(self, table, state, init_pos, init_lineno):
+        """
+        Same as Lexer._call_terminal for the terminal token of an accepting state of the table, ignored and static
+        terminals are resolved from the table without being called, see DFATable.terminal_kinds
+        """
+        kind = table.terminal_kinds[state]
+
+        if kind == CALLED_TERMINAL:
+            return self._call_terminal(table.terminals[state], init_pos, init_lineno)
+
+        return table.static_terminals[state]
+
+    def _build_token(self, state, init_pos, init_lineno):
+        """
+        Build the Token of the match from init_pos to pos given the accepting state reached by the DFA, a LazyToken if
+        the lexer is lazy. Return None if the match is to be ignored.
+        """
+        if self.lazy:
+            return self._build_lazy_token(state, init_pos, init_lineno)
+
+        return self._build_eager_token(state, init_pos, init_lineno)
+
+    def _select_states(self, table, only, exclude):
+        """
+        Return a tuple (selection, accepts) where accepts is the predicate telling if a token type is selected by the
+        only and exclude collections of token types and selection the selection of every state of the table, see
+        DFATable.select_states. Return (None, None) if both are None.
+        """
+        if only is None and exclude is None:
+            return None, None
+
+        if isinstance(only, str) or isinstance(exclude, str):
+            raise LexerError("only and exclude must be collections of token types")
+
+        only = None if only is None else frozenset(only)
+        exclude = frozenset(() if exclude is None else exclude)
+
+        def accepts(token_type):
+            return (only is None or token_type in only) and token_type not in exclude
+
+        return table.select_states(accepts), accepts
+
+    def _get_line_index(self, pos, lineno):
+        """
+        Return the LineIndex of the current buffer, creating it if the buffer changed. The given pos and lineno are
+        used as reference if a new index is created.
+        """
+        if self._line_index is None or self._line_index.buffer is not self.buffer:
+            self._line_index = LineIndex(self.buffer, pos, lineno, self.linebreak or '\n')
+
+        return self._line_index
+
+    def get_column(self, pos):
+        """
+        Return the column of the character at pos in the buffer, starting at 1. Columns are found by bisection on the
+        offsets of the linebreaks of the buffer, see LineIndex.
+        """
+        return self._get_line_index(self.pos, self.lineno).get_column(pos)
+
+    def _build_lazy_token(self, state, init_pos, init_lineno):
+        """
+        Build the LazyToken of the match from init_pos to pos, see Lexer._build_token
+        """
+        table = self.dfa.table
+        resolved = self._resolve_terminal(table, state, init_pos, init_lineno)
+
+        if resolved is None:
+            return None
+
+        return self._make_lazy_token(table, state, resolved, init_pos, init_lineno)
+
+    def _build_eager_token(self, state, init_pos, init_lineno):
+        """
+        Build the Token of the match from init_pos to pos, see Lexer._build_token
+        """
+        table = self.dfa.table
+        resolved = self._resolve_terminal(table, state, init_pos, init_lineno)
+
+        if resolved is None:
+            return None
+
+        return self._make_eager_token(table, state, resolved, init_pos, init_lineno)
+
+    def _make_token(self, table, state, resolved, init_pos, init_lineno):
+        """
+        Make the Token of the match from init_pos to pos which terminal is resolved to (token_type, token_params), a
+        LazyToken if the lexer is lazy
+        """
+        if self.lazy:
+            return self._make_lazy_token(table, state, resolved, init_pos, init_lineno)
+
+        return self._make_eager_token(table, state, resolved, init_pos, init_lineno)
+
+    def _make_lazy_token(self, table, state, resolved, init_pos, init_lineno):
+        token_type, token_params = resolved
+
+        return LazyToken(token_type,
+                         self._get_line_index(init_pos, init_lineno),
+                         init_pos,
+                         self.pos,
+                         params=token_params,
+                         type_id=table.get_terminal_type_id(state, token_type))
+
+    def _make_eager_token(self, table, state, resolved, init_pos, init_lineno):
+        token_type, token_params = resolved
+
+        return Token(token_type,
+                     self.buffer[init_pos:self.pos],
+                     init_pos,
+                     self.pos,
+                     params=token_params,
+                     lineno=init_lineno,
+                     type_id=table.get_terminal_type_id(state, token_type))
+
+    def _trigger_terminal_actions(self, init_lineno, init_pos, ignore):
+        """
+        Trigger the terminal actions once a match is found
+        Recall that the trigger code of the terminal action has the following meaning:
+        -1 -> trigger only on ignored match
+         1 -> trigger only on match returning token
+         0 -> always trigger the action the there is a match
+        The actions of each case are split when the Lexer is created, see Lexer._parse_terminal_actions
+        """
+        bind_controller = self._controller.bind
+
+        for action in self._ignored_actions if ignore else self._token_actions:
+            action(bind_controller(init_lineno, init_pos))
+
+    def lex(self):
+        # Ignored patterns are skipped in a loop until a token is found or the end of the buffer is reached
+        while self.pos < len(self.buffer):
+            init_lineno = self.lineno
+            init_pos = self.pos
+
+            state = self._match()
+
+            token = self._build_token(state, init_pos, init_lineno)
+
+            # Before returning a token, we trigger all terminal actions
+            if self.terminal_actions:
+                self._trigger_terminal_actions(init_lineno, init_pos, token is None)
+
+            if token is not None:
+                return token
+
+        return None
+
+    def _scan(self):
+        """
+        Generator of the matches found up to the end of the buffer. The whole buffer is stepped through in a single loop
+        and every match is yielded as a tuple (state, init_pos, init_lineno) where state is the accepting state reached,
+        pos being at the end of the match. Resolving the terminal and triggering terminal actions is left to the
+        consumer, which must do so before resuming the generator.
+        """
+        if self._generated_scanner is not None:
+            yield from self._scan_generated()
+            return
+
+        if self._regexp_engine is not None:
+            yield from self._scan_regexp()
+            return
+
+        table = self.dfa.table
+        latin1_classes = table.latin1_classes
+        block_index = table.block_index
+        blocks = table.blocks
+        transitions = table.transitions
+        class_count = table.class_count
+        special_actions = table.special_actions
+        accepting = table.accepting
+        start = table.start
+        linebreak = self.linebreak
+
+        bind_controller = self._controller.bind
+
+        while True:
+            # The buffer is recovered at every match since Lexer.read may be called between two tokens
+            buffer = self.buffer
+            length = len(buffer)
+            pos = self.pos
+
+            if pos >= length:
+                return
+
+            init_lineno = self.lineno
+            init_pos = pos
+            state = start
+
+            while pos < length:
+                codepoint = ord(buffer[pos])
+
+                if codepoint < 256:
+                    cls = latin1_classes[codepoint]
+                else:
+                    cls = blocks[block_index[codepoint >> 8] + (codepoint & 0xff)]
+
+                next_state = transitions[state * class_count + cls]
+
+                if next_state < 0:
+                    break
+
+                state = next_state
+
+                if special_actions[state]:
+                    self.pos = pos
+
+                    for action in special_actions[state]:
+                        action(bind_controller(init_lineno, init_pos, pos + 1))
+
+                    pos = self.pos
+
+                pos += 1
+
+            self.pos = pos
+
+            if linebreak is not None:
+                self.lineno += buffer.count(linebreak, init_pos, pos)
+
+            if not accepting[state]:
+                raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=pos)
+
+            yield state, init_pos, init_lineno
+
+    def _scan_regexp(self):
+        """
+        Same as Lexer._scan, but the matches are found by the RegexpEngine of the lexer
+        """
+        engine = self._regexp_engine
+        match = engine.pattern.match
+        rule_states = engine.rule_states
+        follows = engine.follows
+        linebreak = self.linebreak
+
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+
+            if pos >= len(buffer):
+                return
+
+            init_lineno = self.lineno
+            found = match(buffer, pos)
+
+            if found is not None:
+                group = found.lastindex
+                end = found.end()
+                state = rule_states[group]
+                follow = follows[group]
+
+                if state is not None and (follow is None or not follow(buffer, end)):
+                    self.pos = end
+
+                    if linebreak is not None:
+                        self.lineno += buffer.count(linebreak, pos, end)
+
+                    yield state, pos, init_lineno
+                    continue
+
+            # Fallback on the DFA, which raises the syntax error if there is no match
+            yield self._match_dfa(), pos, init_lineno
+
+    def _scan_generated(self):
+        """
+        Same as Lexer._scan, but the matches are found by the generated scanner of the lexer
+        """
+        scanner = self._generated_scanner
+        trigger = self._trigger_special_actions
+        accepting = self.dfa.table.accepting
+        linebreak = self.linebreak
+
+        while True:
+            buffer = self.buffer
+            pos = self.pos
+
+            if pos >= len(buffer):
+                return
+
+            init_lineno = self.lineno
+            state, self.pos = scanner(buffer, pos, trigger, init_lineno)
+
+            if linebreak is not None:
+                self.lineno += buffer.count(linebreak, pos, self.pos)
+
+            if not accepting[state]:
+                raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=self.pos)
+
+            yield state, pos, init_lineno
+
+    def enable_stats(self):
+        """
+        Start recording the LexerStats of the lexer in Lexer.stats and return them, see compyl.__lexer.stats.
+        The instrumented counterparts of Lexer._scan, Lexer._call_terminal and Lexer._trigger_terminal_actions are then
+        set on the instance, thus a lexer which is not instrumented pays no overhead. Matches are recorded by
+        Lexer.tokenize and every method built on it, which always step through the DFA table while instrumented, while
+        Lexer.lex, bytes and streams only record the time spent in rules and terminal actions.
+        """
+        self.stats = LexerStats([rule[0] for rule in self.rules], self.dfa.table.terminal_rules)
+
+        self._scan = self._scan_instrumented
+        self._call_terminal = self._call_terminal_instrumented
+        self._trigger_terminal_actions = self._trigger_terminal_actions_instrumented
+
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stop recording statistics and restore the methods of the class, return the LexerStats recorded so far
+        """
+        stats = self.stats
+
+        for name in ('_scan', '_call_terminal', '_trigger_terminal_actions'):
+            self.__dict__.pop(name, None)
+
+        self.stats = None
+
+        return stats
+
+    def _scan_instrumented(self):
+        """
+        Same as Lexer._scan stepping through the DFA table, but every match, transition and trigger_on_contain action
+        is recorded in Lexer.stats
+        """
+        stats = self.stats
+        record_match = stats.record_match
+
+        table = self.dfa.table
+        latin1_classes = table.latin1_classes
+        block_index = table.block_index
+        blocks = table.blocks
+        transitions = table.transitions
+        class_count = table.class_count
+        special_actions = table.special_actions
+        accepting = table.accepting
+        terminal_kinds = table.terminal_kinds
+        start = table.start
+        linebreak = self.linebreak
+
+        bind_controller = self._controller.bind
+        started = perf_counter()
+
+        try:
+            while True:
+                buffer = self.buffer
+                length = len(buffer)
+                pos = self.pos
+
+                if pos >= length:
+                    return
+
+                init_lineno = self.lineno
+                init_pos = pos
+                state = start
+                steps = 0
+
+                while pos < length:
+                    codepoint = ord(buffer[pos])
+
+                    if codepoint < 256:
+                        cls = latin1_classes[codepoint]
+                    else:
+                        cls = blocks[block_index[codepoint >> 8] + (codepoint & 0xff)]
+
+                    next_state = transitions[state * class_count + cls]
+
+                    if next_state < 0:
+                        break
+
+                    state = next_state
+                    steps += 1
+
+                    if special_actions[state]:
+                        self.pos = pos
+                        action_start = perf_counter()
+
+                        for action in special_actions[state]:
+                            action(bind_controller(init_lineno, init_pos, pos + 1))
+
+                        stats.contain_time += perf_counter() - action_start
+                        stats.contain_firings += len(special_actions[state])
+                        pos = self.pos
+
+                    pos += 1
+
+                self.pos = pos
+
+                if linebreak is not None:
+                    self.lineno += buffer.count(linebreak, init_pos, pos)
+
+                if not accepting[state]:
+                    raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=pos)
+
+                record_match(state, pos - init_pos, steps)
+
+                if terminal_kinds[state] == STATIC_TERMINAL:
+                    stats.tokens += 1
+
+                yield state, init_pos, init_lineno
+
+        finally:
+            stats.elapsed += perf_counter() - started
+
+    def _call_terminal_instrumented(self, terminal_token, init_pos, init_lineno):
+        """
+        Same as Lexer._call_terminal, but the call is timed and counted in Lexer.stats
+        """
+        stats = self.stats
+        started = perf_counter()
+
+        try:
+            resolved = Lexer._call_terminal(self, terminal_token, init_pos, init_lineno)
+
+        finally:
+            stats.callback_time += perf_counter() - started
+            stats.callback_calls += 1
+
+        if resolved is not None:
+            stats.tokens += 1
+
+        return resolved
+
+    def _trigger_terminal_actions_instrumented(self, init_lineno, init_pos, ignore):
+        """
+        Same as Lexer._trigger_terminal_actions, but the actions are timed and counted in Lexer.stats
+        """
+        stats = self.stats
+        started = perf_counter()
+
+        try:
+            Lexer._trigger_terminal_actions(self, init_lineno, init_pos, ignore)
+
+        finally:
+            stats.action_time += perf_counter() - started
+            stats.action_calls += len(self._ignored_actions if ignore else self._token_actions)
+
+    def verify_engines(self, samples, engine='regexp'):
+        """
+        Cross-check an engine, 'regexp' or 'generated', against the DFA table by lexing every sample string with both, on
+        lexers sharing the DFA of self. Return the number of compared tokens, raise a LexerError describing the first
+        difference found. Syntax errors are part of the comparison, both engines must raise them at the same position.
+        """
+        def run(sample, engine):
+            lexer = type(self)(_dfa=self.dfa, engine=engine, cache_dir=self.cache_dir)
+            lexer.params = copy.deepcopy(self.params)
+            result = []
+
             try:
-                token_return = terminal_token(controller)
-            except TypeError:
-                raise LexerError("Lexer rules must be string or function LexerController -> (string/None, *)")
-
-            token_type = None
-            token_params = None
-
-            if isinstance(token_return, str):
-                token_type = token_return
-            elif token_return is None:
-                ignore = True
-            elif isinstance(token_return, tuple) and isinstance(token_return[0], str):
-                token_type = token_return[0]
-                token_params = token_return[1]
-            else:
-                raise LexerError(
-                    """Lexer rules as functions must return string or None as first return value. An optional second
-                    value can be returned to be stored in the token 'params' attribute."""
-                )
-
-            if not ignore:
-                token = Token(token_type,
-                              value,
-                              init_pos,
-                              self.pos,
-                              params=token_params,
-                              lineno=init_lineno)
-
-        # Before returning a token, we trigger all terminal actions
-        # Recall that the trigger code of the terminal action has the following meaning:
-        # -1 -> trigger only on ignored match
-        #  1 -> trigger only on match returning token
-        #  0 -> always trigger the action the there is a match
-        for action, trigger_code in self.terminal_actions:
-            if trigger_code == 0:
-                controller = self.LexerController(
-                    self,
-                    init_lineno,
-                    init_pos
-                )
-                action(controller)
-
-            elif trigger_code == -1 and ignore:
-                controller = self.LexerController(
-                    self,
-                    init_lineno,
-                    init_pos
-                )
-                action(controller)
-
-            elif trigger_code == 1 and not ignore:
-                controller = self.LexerController(
-                    self,
-                    init_lineno,
-                    init_pos
-                )
-                action(controller)
-
-        # Return if a non-ignored pattern was found, else continue lexing until a token is found
-        if ignore:
-            return self.lex()
+                for token in lexer.tokenize(sample):
+                    result.append((token.type, token.value, token.pos, token.end_pos, token.lineno, token.params))
 
-        else:
-            return token
+            except LexerSyntaxError as error:
+                result.append(('syntax error', error.lineno, error.pos))
+
+            return result
+
+        count = 0
+
+        for sample_index, sample in enumerate(samples):
+            expected = run(sample, 'dfa')
+            found = run(sample, engine)
+
+            for index, (expected_token, found_token) in enumerate(zip(expected, found)):
+                if expected_token != found_token:
+                    raise LexerError("engines differ on sample %d at token %d: dfa gives %r, %s gives %r"
+                                     % (sample_index, index, expected_token, engine, found_token))
+
+            if len(expected) != len(found):
+                raise LexerError("engines differ on sample %d: dfa gives %d tokens, %s gives %d"
+                                 % (sample_index, len(expected), engine, len(found)))
+
+            count += len(expected)
+
+        return count
+
+    def tokenize(self, buffer=None, snapshots=False, only=None, exclude=None, recover=None, max_errors=None,
+                 errors=None):
+        """
+        Generator of the tokens found up to the end of the buffer. If a buffer is given, it is first appended to the
+        current buffer as with Lexer.read.
+        This is equivalent to iterating over the Lexer, but the whole buffer is stepped through in a single loop, thus
+        it avoids the overhead of calling Lexer.lex for every token and never recurses on ignored matches.
+        If snapshots is True, every token records in Token.start_params a deep copy of the params as they were at its
+        start, which Lexer.relex needs to restart lexing from it.
+        If only or exclude is given as a collection of token types, only the tokens which type is in only and not in
+        exclude are yielded. The types are resolved against the DFA table beforehand: the matches of other types only
+        advance pos, no Token is built for them and their rule is not called unless it is a function which may have
+        side effects. Terminal actions are triggered on every match, as if no token was filtered.
+
+        By default, a LexerSyntaxError is raised on the first match which fails. If recover is given, lexing resumes
+        after the failed match instead, at a resync point found by recover, see compyl.__lexer.recovery:
+        'char' skips one character, 'start' skips to the next character which can start a token and a regular
+        expression skips past its next match. The skipped text becomes a token of type 'ERROR', which is yielded, or
+        appended to errors if a list is given. Only max_errors errors are tolerated if it is given, the next syntax
+        error is raised. Linebreaks of the skipped text are only counted if the lexer has a linebreak, other changes made
+        by trigger_on_contain actions during the failed match, as to params, are kept.
+        """
+        if buffer is not None:
+            self.read(buffer)
+
+        if only is not None or exclude is not None or recover is not None:
+            yield from self._tokenize_filtered(snapshots, only, exclude, recover, max_errors, errors)
+            return
+
+        build_token = self._build_token
+
+        # Params at the start of the current match, that is after the previous match and its terminal actions
+        snapshot = self._take_initial_snapshot() if snapshots else None
+
+        for state, init_pos, init_lineno in self._scan():
+            token = build_token(state, init_pos, init_lineno)
+
+            if self.terminal_actions:
+                self._trigger_terminal_actions(init_lineno, init_pos, token is None)
+
+            if token is not None:
+                token.start_params = snapshot
+                yield token
+
+            if snapshots:
+                snapshot = copy.deepcopy(self.params)
+
+    def _tokenize_filtered(self, snapshots, only, exclude, recover, max_errors, errors):
+        """
+        Same as Lexer.tokenize, but only the tokens selected by only and exclude are built and yielded, and syntax
+        errors are recovered from if recover is given
+        """
+        table = self.dfa.table
+        selection, accepts = self._select_states(table, only, exclude)
+        terminal_kinds = table.terminal_kinds
+        terminals = table.terminals
+        static_terminals = table.static_terminals
+        call_terminal = self._call_terminal
+        make_token = self._make_token
+
+        snapshot = self._take_initial_snapshot() if snapshots else None
+
+        for state, init_pos, init_lineno in self._get_matches(recover, max_errors):
+            if state == NO_STATE:
+                token = self._make_error_token(table, init_pos, init_lineno)
+
+                if errors is not None:
+                    errors.append(token)
+
+                elif accepts is None or accepts(ERROR_TOKEN_TYPE):
+                    token.start_params = snapshot
+                    yield token
+
+            else:
+                if terminal_kinds[state] == CALLED_TERMINAL:
+                    resolved = call_terminal(terminals[state], init_pos, init_lineno)
+                else:
+                    resolved = static_terminals[state]
+
+                if self.terminal_actions:
+                    self._trigger_terminal_actions(init_lineno, init_pos, resolved is None)
+
+                if selection is None:
+                    selected = resolved is not None
+                else:
+                    selected = selection[state] == SELECTED_STATE or selection[state] == UNRESOLVED_STATE \
+                        and resolved is not None and accepts(resolved[0])
+
+                if selected:
+                    token = make_token(table, state, resolved, init_pos, init_lineno)
+                    token.start_params = snapshot
+                    yield token
+
+            if snapshots:
+                snapshot = copy.deepcopy(self.params)
+
+    def _take_initial_snapshot(self):
+        """
+        Return a deep copy of the params, which are also kept as initial params if lexing starts at the buffer start
+        """
+        snapshot = copy.deepcopy(self.params)
+
+        if self.pos == 0:
+            self._initial_params = snapshot
+
+        return snapshot
+
+    def _get_matches(self, recover, max_errors):
+        """
+        Return the generator of the matches of the buffer, see Lexer._scan, which recovers from syntax errors if
+        recover is given, see Lexer._scan_recovering
+        """
+        if recover is None:
+            return self._scan()
+
+        return self._scan_recovering(get_resync_function(self.dfa.table, recover), max_errors)
+
+    def _scan_recovering(self, resync, max_errors):
+        """
+        Same as Lexer._scan, but on syntax error the failed match is skipped up to resync(buffer, init_pos) and yielded
+        as (NO_STATE, init_pos, init_lineno), pos being at the end of the skipped text, then scanning restarts.
+        The syntax error is raised once more than max_errors errors are met, if max_errors is not None.
+        """
+        linebreak = self.linebreak
+        error_count = 0
+
+        while True:
+            # Start of the next match, the consumer leaves pos and lineno there before resuming the generator
+            init_pos, init_lineno = self.pos, self.lineno
+
+            try:
+                for match in self._scan():
+                    yield match
+                    init_pos, init_lineno = self.pos, self.lineno
+
+                return
+
+            except LexerSyntaxError:
+                error_count += 1
+
+                if max_errors is not None and error_count > max_errors:
+                    raise
+
+            end = min(resync(self.buffer, init_pos), len(self.buffer))
+
+            self.pos = end
+            self.lineno = init_lineno
+
+            if linebreak is not None:
+                self.lineno += self.buffer.count(linebreak, init_pos, end)
+
+            yield NO_STATE, init_pos, init_lineno
+
+    def _make_error_token(self, table, init_pos, init_lineno):
+        """
+        Make the token of the text skipped from init_pos to pos after a syntax error
+        """
+        return Token(ERROR_TOKEN_TYPE, self.buffer[init_pos:self.pos], init_pos, self.pos, lineno=init_lineno,
+                     type_id=table.token_type_ids.get(ERROR_TOKEN_TYPE))
+
+    def tokenize_columnar(self, buffer=None, only=None, exclude=None, recover=None, max_errors=None, errors=None):
+        """
+        Same as Lexer.tokenize_all, but the tokens are stored in a TokenArray instead of creating a Token object for
+        each match. Tokens can be filtered by type with only and exclude and syntax errors recovered from with recover,
+        see Lexer.tokenize.
+        """
+        if buffer is not None:
+            self.read(buffer)
+
+        table = self.dfa.table
+        terminal_ids = table.terminal_ids
+        resolve_terminal = self._resolve_terminal
+        selection, accepts = self._select_states(table, only, exclude)
+
+        tokens = TokenArray(type_names=table.token_types)
+        append = tokens.append
+
+        for state, init_pos, init_lineno in self._get_matches(recover, max_errors):
+            if state == NO_STATE:
+                if errors is not None:
+                    errors.append(self._make_error_token(table, init_pos, init_lineno))
+
+                elif accepts is None or accepts(ERROR_TOKEN_TYPE):
+                    append(tokens.get_type_id(ERROR_TOKEN_TYPE), init_pos, self.pos, init_lineno, None)
+
+                continue
+
+            resolved = resolve_terminal(table, state, init_pos, init_lineno)
+
+            if self.terminal_actions:
+                self._trigger_terminal_actions(init_lineno, init_pos, resolved is None)
+
+            if resolved is not None:
+                if selection is not None and selection[state] != SELECTED_STATE and (
+                        selection[state] != UNRESOLVED_STATE or not accepts(resolved[0])):
+                    continue
+
+                type_id = terminal_ids[state]
+
+                if type_id < 0:
+                    type_id = tokens.get_type_id(resolved[0])
+
+                append(type_id, init_pos, self.pos, init_lineno, resolved[1])
+
+        # Lexer.read only appends to the buffer, thus the latest buffer holds the values of all tokens
+        tokens.buffer = self.buffer
+
+        return tokens
+
+    def tokenize_all(self, buffer=None, columnar=False, snapshots=False, only=None, exclude=None, recover=None,
+                     max_errors=None, errors=None):
+        """
+        Return the list of all tokens found up to the end of the buffer, see Lexer.tokenize
+        If columnar is True, a TokenArray is returned instead, see Lexer.tokenize_columnar
+        """
+        if columnar:
+            return self.tokenize_columnar(buffer, only, exclude, recover, max_errors, errors)
+
+        return list(self.tokenize(buffer, snapshots, only, exclude, recover, max_errors, errors))
+
+    def relex(self, tokens, edit_start, edit_end, new_text):
+        """
+        Update the list of tokens of the buffer after buffer[edit_start:edit_end] is replaced by new_text, relexing
+        only the tokens the edit may change. The tokens must have been built from the whole buffer by Lexer.tokenize_all
+        with snapshots=True, starting at line 1, and the params they started with are those the lexer had then.
+
+        The DFA reads one character past a match to find its end, thus the tokens ending before edit_start are kept.
+        Lexing restarts at the start of the last of them, with the lineno and params it had, and stops as soon as a new
+        token starts where an old token after the edit started, shifted by the length difference of the edit, with the
+        same params: the next tokens are then the same and only their pos, end_pos and lineno are shifted.
+        The list is updated in place and the buffer of the lexer is replaced by the edited buffer. If the edited buffer
+        raises a LexerSyntaxError, the tokens are left unchanged and the previous buffer is restored.
+
+        Return a tuple (start, old_stop, new_stop) where tokens[start:old_stop] of the old list were replaced by
+        tokens[start:new_stop] of the updated list.
+        """
+        if self.lazy:
+            raise LexerError("relex does not support lazy tokens")
+
+        if not 0 <= edit_start <= edit_end <= len(self.buffer):
+            raise LexerError("edit must be inside the buffer")
+
+        delta = len(new_text) - (edit_end - edit_start)
+
+        # Index of the first token which may change, tokens are ordered by end_pos
+        first = bisect_left([token.end_pos for token in tokens], edit_start)
+
+        if first == 0:
+            if self._initial_params is None:
+                raise LexerError("relex requires tokens built with snapshots=True")
+
+            pos, lineno, params = 0, 1, self._initial_params
+
+        else:
+            restart = tokens[first - 1]
+
+            if restart.start_params is None:
+                raise LexerError("relex requires tokens built with snapshots=True")
+
+            pos, lineno, params = restart.pos, restart.lineno, restart.start_params
+
+        final_lineno, final_params = self.lineno, self.params
+        old_text = self.buffer[edit_start:edit_end]
+
+        self.buffer = self.buffer[:edit_start] + new_text + self.buffer[edit_end:]
+        self.pos, self.lineno, self.params = pos, lineno, copy.deepcopy(params)
+
+        new_tokens = []
+        stop = first
+
+        line_delta = None
+
+        try:
+            for token in self.tokenize(snapshots=True):
+                # The token at the restart position is the kept token first - 1
+                if token.pos == pos and first > 0:
+                    continue
+
+                old_pos = token.pos - delta
+
+                while stop < len(tokens) and tokens[stop].pos < old_pos:
+                    stop += 1
+
+                if old_pos >= edit_end and stop < len(tokens) and tokens[stop].pos == old_pos:
+                    if tokens[stop].start_params is None:
+                        raise LexerError("relex requires tokens built with snapshots=True")
+
+                    # Synchronized with the old tokens, which are shifted instead of being lexed again
+                    if tokens[stop].start_params == token.start_params:
+                        line_delta = token.lineno - tokens[stop].lineno
+                        break
+
+                new_tokens.append(token)
+
+            else:
+                stop = len(tokens)
+
+        except LexerError:
+            # The tokens still describe the previous buffer, which is restored
+            self.buffer = self.buffer[:edit_start] + old_text + self.buffer[edit_start + len(new_text):]
+            self.pos, self.lineno, self.params = len(self.buffer), final_lineno, final_params
+            raise
+
+        if line_delta is not None:
+            for kept in tokens[stop:]:
+                kept.pos += delta
+                kept.end_pos += delta
+                kept.lineno += line_delta
+
+            self.pos = len(self.buffer)
+            self.lineno, self.params = final_lineno + line_delta, final_params
+
+        tokens[first:stop] = new_tokens
+
+        return first, stop, first + len(new_tokens)
+
+    def tokenize_parallel(self, text, workers=None, sync='\n', columnar=False, merge_params=None):
+        """
+        Return the list of all tokens of text, lexing chunks of it in a pool of worker processes. The text is lexed
+        independently of the current buffer, starting at the current lineno which is then updated.
+
+        :param workers: number of worker processes, by default the number of CPUs. With a single worker, the chunks are
+        lexed in the current process.
+        :param sync: regular expression of the re module, as string or compiled pattern, after which the DFA is
+        guaranteed to be at its start state. The text is only cut after its matches, by default after linebreaks,
+        which is correct as long as no token spans over a linebreak. It is up to the caller to declare a sync pattern
+        that no token can contain, otherwise the tokens differ from Lexer.tokenize_all.
+        If sync is None, the text is cut at token boundaries found speculatively: chunks of equal size are simulated in
+        the workers from every state the DFA may be in at their start, then the per-chunk state mappings are composed to
+        find the actual state at every cut, see compyl.__lexer.parallel.get_speculative_bounds. This is correct for any
+        rules, block comments included, as long as no rule moves pos through its LexerController.
+        :param columnar: if True, a TokenArray is returned, see Lexer.tokenize_columnar
+        :param merge_params: every chunk is lexed with a copy of the params of the lexer as they are at the call, thus
+        changes made to params by rules and terminal actions are lost by default. If a function is given, it is called
+        in the order of the chunks as merge_params(params, chunk_params) to fold the params of every chunk into the
+        params of the lexer. Token params are always kept.
+
+        The DFA is sent once to every worker, which returns the tokens of its chunks as a TokenArray. Their pos, end_pos
+        and lineno are then shifted by the offset and the line of their chunk, the line of a chunk being the line
+        reached by the lexer at the end of the previous one.
+        """
+        return_params = merge_params is not None
+        bounds, results = self._map_chunks(text, workers, sync, lex_chunk, lex_chunk_in_worker, return_params)
+
+        tokens = TokenArray(type_names=self.dfa.table.token_types)
+
+        for (start, _), (chunk_tokens, lineno, params, error) in zip(bounds, results):
+            if error is not None:
+                error_lineno = self.lineno + error[0] - 1
+                self.lineno += lineno - 1
+
+                raise LexerSyntaxError("Syntax error at line %s" % error_lineno, lineno=error_lineno,
+                                       pos=start + error[1])
+
+            tokens.extend(chunk_tokens, pos_offset=start, lineno_offset=self.lineno - 1)
+
+            if merge_params is not None:
+                merge_params(self.params, params)
+
+            self.lineno += lineno - 1
+
+        tokens.buffer = text
+
+        return tokens if columnar else tokens.to_tokens()
+
+    def _map_chunks(self, text, workers, sync, function, worker_function, *args):
+        """
+        Cut text in chunks as described in Lexer.tokenize_parallel and return a tuple (bounds, results) where bounds are
+        the (start, end) offsets of the chunks and results hold function(template, chunk, *args) for every chunk,
+        template being a copy of the lexer at line 1 with an empty buffer. With more than one worker, the results are
+        computed by worker_function(chunk, *args) in a pool of worker processes which receive the template once.
+        """
+        workers = workers or os.cpu_count() or 1
+
+        template = copy.copy(self)
+        template.buffer, template.pos, template.lineno = '', 0, 1
+
+        # Worker processes are only started once a task is submitted
+        executor = None
+
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                           initargs=(dill.dumps(template),))
+
+        try:
+            if sync is None:
+                bounds = get_speculative_bounds(self.dfa.table, text, workers * CHUNKS_PER_WORKER, executor)
+            else:
+                bounds = split_at_sync_points(text, sync, workers * CHUNKS_PER_WORKER)
+
+            chunks = [text[start:end] for start, end in bounds]
+
+            if executor is None or len(chunks) == 1:
+                results = [function(template, chunk, *args) for chunk in chunks]
+            else:
+                results = list(executor.map(worker_function, chunks, *(repeat(arg) for arg in args)))
+
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        return bounds, results
+
+    def count(self, source, histograms=False, workers=None, sync='\n', chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        """
+        Return the TokenCounts of the tokens of source, counted by type without building them: the DFA steps through
+        the source as when tokenizing and rules which are functions and terminal actions are called as usual, but only
+        the type and length of every token are recorded, see compyl.__lexer.counts.TokenCounts.
+
+        A string source is appended to the buffer and lexed as by Lexer.tokenize, bytes-like data is lexed as by
+        Lexer.tokenize_bytes and any other source is a file object or iterable of chunks lexed as by Lexer.lex_stream.
+
+        :param histograms: if True, the histogram of the lengths of the tokens of every type is also recorded
+        :param workers: if more than one, a string source is lexed independently of the buffer in a pool of worker
+        processes, cut at sync as by Lexer.tokenize_parallel, and the statistics of the chunks are merged. The changes
+        made to params by rules and terminal actions are then lost.
+        """
+        if workers is not None and workers > 1 and isinstance(source, str):
+            return self._count_parallel(source, histograms, workers, sync)
+
+        counts = TokenCounts(histograms)
+        count_match = self._get_match_counter(counts)
+        init_lineno = self.lineno
+
+        if isinstance(source, str):
+            self.read(source)
+
+            for state, init_pos, match_lineno in self._scan():
+                count_match(state, init_pos, match_lineno)
+
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            byte_encoding = 'utf-8' if is_utf8_encoding(encoding) else 'latin-1'
+
+            for state, init_pos, match_lineno in self._scan_bytes(source, byte_encoding):
+                count_match(state, init_pos, match_lineno)
+
+        else:
+            chunks = iter_text_chunks(source, chunk_size, encoding)
+            scanner = self._scan_stream(count_match)
+            item = next(scanner, None)
+
+            # Matches are counted by count_match, the scanner only yields to ask for chunks
+            while item is not None:
+                item = self._send_chunk(scanner, next(chunks, None))
+
+        counts.linebreaks = self.lineno - init_lineno
+
+        return counts
+
+    def _get_match_counter(self, counts):
+        """
+        Return the function count_match(state, init_pos, init_lineno, offset=0) which resolves the terminal of a match,
+        triggers the terminal actions and adds the token, if any, to counts
+        """
+        table = self.dfa.table
+        resolve_terminal = self._resolve_terminal
+        add = counts.add
+
+        def count_match(state, init_pos, init_lineno, offset=0):
+            resolved = resolve_terminal(table, state, init_pos, init_lineno)
+
+            if self.terminal_actions:
+                self._trigger_terminal_actions(init_lineno, init_pos, resolved is None)
+
+            if resolved is not None:
+                add(resolved[0], self.pos - init_pos)
+
+        return count_match
+
+    def _count_parallel(self, text, histograms, workers, sync):
+        """
+        Lexer.count of text in a pool of worker processes
+        """
+        bounds, results = self._map_chunks(text, workers, sync, count_chunk, count_chunk_in_worker, histograms)
+        counts = TokenCounts(histograms)
+
+        for (start, _), (chunk_counts, lineno, error) in zip(bounds, results):
+            if error is not None:
+                error_lineno = self.lineno + error[0] - 1
+                self.lineno += lineno - 1
+
+                raise LexerSyntaxError("Syntax error at line %s" % error_lineno, lineno=error_lineno,
+                                       pos=start + error[1])
+
+            counts.update(chunk_counts)
+            self.lineno += lineno - 1
+
+        return counts
+
+    def tokenize_many(self, documents, columnar=False, workers=None, batch_size=DOCUMENTS_PER_BATCH):
+        """
+        Return the list of the tokens of every document of an iterable of strings, each document being lexed as by a
+        new Lexer: from pos 0 and line 1, with a deep copy of the params of the lexer as they are at the call.
+        The lexer itself is reused, only its buffer, pos, lineno and params are reset between documents, and they are
+        restored once all documents are lexed. A LexerSyntaxError records the index of the document it was met in as
+        its document attribute.
+
+        :param columnar: if True, the tokens of every document are stored in a TokenArray, see Lexer.tokenize_columnar
+        :param workers: if more than one, the documents are lexed in a pool of worker processes by batches of
+        batch_size documents, the lexer being sent once to every worker as with Lexer.tokenize_parallel
+        """
+        if workers is not None and workers > 1:
+            return self._tokenize_many_in_pool(documents, columnar, workers, batch_size)
+
+        saved = self.buffer, self.pos, self.lineno, self.params
+        params = saved[3]
+        results = []
+
+        try:
+            for index, document in enumerate(documents):
+                if not isinstance(document, str):
+                    raise LexerError("documents must be strings")
+
+                self.buffer, self.pos, self.lineno = document, 0, 1
+
+                # Shallow copies of empty params are as good as deep copies and much cheaper
+                self.params = copy.deepcopy(params) if params else copy.copy(params)
+
+                try:
+                    if columnar:
+                        results.append(self.tokenize_columnar())
+                    else:
+                        results.append(list(self.tokenize()))
+
+                except LexerSyntaxError as error:
+                    raise LexerSyntaxError("Syntax error at line %s of document %d" % (error.lineno, index),
+                                           lineno=error.lineno, pos=error.pos, document=index) from error
+
+        finally:
+            self.buffer, self.pos, self.lineno, self.params = saved
+
+        return results
+
+    def _tokenize_many_in_pool(self, documents, columnar, workers, batch_size):
+        """
+        Lexer.tokenize_many in a pool of workers processes, which return a TokenArray for every document
+        """
+        template = copy.copy(self)
+        template.buffer, template.pos, template.lineno = '', 0, 1
+
+        results = []
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(dill.dumps(template),)) as executor:
+            batches = executor.map(lex_documents_in_worker, iter_batches(documents, max(1, batch_size)))
+
+            for batch_results, error in batches:
+                if error is not None:
+                    document, lineno, pos = error
+                    document += len(results)
+
+                    raise LexerSyntaxError("Syntax error at line %s of document %d" % (lineno, document),
+                                           lineno=lineno, pos=pos, document=document)
+
+                results.extend(batch_results)
+
+        return results if columnar else [tokens.to_tokens() for tokens in results]
+
+    def _scan_bytes(self, data, encoding):
+        """
+        Generator of the matches found in the bytes-like data, see Lexer._scan. The DFA is compiled to a byte-level
+        table for the encoding, 'utf-8' or 'latin-1', and steps directly over the bytes.
+        While the data is being lexed, it is the buffer of the Lexer and positions are byte offsets. The previous buffer
+        and pos are restored once the data is exhausted.
+        """
+        table = self.dfa.get_byte_table(encoding)
+        accepting = table.accepting
+        start = table.start
+        linebreak = None if self.linebreak is None else self.linebreak.encode(encoding)
+
+        previous_buffer, previous_pos = self.buffer, self.pos
+        self.buffer, self.pos = data, 0
+
+        try:
+            while self.pos < len(data):
+                init_lineno = self.lineno
+                init_pos = self.pos
+
+                state, _ = self._advance_bytes(table, start, init_pos, init_lineno)
+
+                if linebreak is not None:
+                    self.lineno += count_linebreaks(data, linebreak, init_pos, self.pos)
+
+                if not accepting[state]:
+                    raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno, pos=self.pos)
+
+                yield state, init_pos, init_lineno
+
+        finally:
+            self.buffer, self.pos = previous_buffer, previous_pos
+
+    def tokenize_bytes(self, data, encoding='utf-8'):
+        """
+        Generator of the tokens found in bytes, bytearray or memoryview data, without decoding it. Supported encodings
+        are utf-8, latin-1 and ascii.
+        The rules are compiled to a byte-level DFA in which multi-byte UTF-8 characters are chains of transitions. The
+        yielded tokens have bytes values and their pos and end_pos are byte offsets in the data.
+        """
+        encoding = 'utf-8' if is_utf8_encoding(encoding) else 'latin-1'
+        table = self.dfa.table
+
+        for state, init_pos, init_lineno in self._scan_bytes(data, encoding):
+            resolved = self._resolve_terminal(table, state, init_pos, init_lineno)
+
+            if self.terminal_actions:
+                self._trigger_terminal_actions(init_lineno, init_pos, resolved is None)
+
+            if resolved is not None:
+                token_type, token_params = resolved
+                yield Token(token_type, bytes(data[init_pos:self.pos]), init_pos, self.pos, params=token_params,
+                            lineno=init_lineno, type_id=table.get_terminal_type_id(state, token_type))
+
+    def lex_file(self, path, encoding='utf-8'):
+        """
+        Generator of the tokens of the file at path. The file is mapped in memory and the byte-level DFA steps directly
+        over the mapped bytes, thus the file is never read as a whole in a string. Supported encodings are utf-8,
+        latin-1 and ascii.
+
+        The yielded tokens are MappedToken, their pos and end_pos are byte offsets in the file and their value is only
+        decoded when accessed. While the file is being lexed, the buffer of the Lexer is the mapped file and positions
+        seen by the LexerController passed to rules are byte offsets. Once the generator is exhausted or closed, the
+        values of the tokens still referenced are decoded and the mapping is closed.
+        With ascii, a LexerError is raised before lexing if the file holds a byte above 127.
+        """
+        byte_encoding = 'utf-8' if is_utf8_encoding(encoding) else 'latin-1'
+        mapped = map_file(path)
+
+        # Tokens which may not have decoded their value yet, by pos, detached from the mapping before it is closed
+        pending = weakref.WeakValueDictionary()
+        table = self.dfa.table
+
+        try:
+            if is_ascii_encoding(encoding):
+                check_ascii(mapped)
+
+            for state, init_pos, init_lineno in self._scan_bytes(mapped, byte_encoding):
+                resolved = self._resolve_terminal(table, state, init_pos, init_lineno)
+
+                if self.terminal_actions:
+                    self._trigger_terminal_actions(init_lineno, init_pos, resolved is None)
+
+                if resolved is not None:
+                    token_type, token_params = resolved
+                    token = MappedToken(token_type, mapped, encoding, init_pos, self.pos, params=token_params,
+                                        lineno=init_lineno, type_id=table.get_terminal_type_id(state, token_type))
+                    pending[init_pos] = token
+                    yield token
+
+        finally:
+            for token in list(pending.values()):
+                token.detach()
+
+            unmap_file(mapped)
+
+    def lex_stream(self, source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        """
+        Generator of the tokens read from a file object or an iterable of chunks. Chunks can be strings or bytes, in
+        which case they are decoded incrementally with the given encoding.
+
+        The buffer only holds the part of the stream that was not consumed yet: a chunk is read whenever the DFA reaches
+        the end of the buffer, and the consumed part of the buffer is then released. A token spanning multiple chunks is
+        resumed from the state of the DFA where it was suspended, thus memory is proportional to the longest token and
+        not to the size of the stream.
+
+        Any unconsumed part of the current buffer is lexed first. Since the buffer is released, tokens are never lazy.
+        The pos and end_pos of the yielded tokens are offsets in the stream, while the pos of the Lexer and of the
+        LexerController passed to rules are relative to the current buffer.
+        """
+        chunks = iter_text_chunks(source, chunk_size, encoding)
+        scanner = self._scan_stream(self._emit_stream_token)
+        item = next(scanner, None)
+
+        while item is not None:
+            if item is NEED_CHUNK:
+                item = self._send_chunk(scanner, next(chunks, None))
+            else:
+                yield item
+                item = next(scanner, None)
+
+    async def alex(self, source, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+        """
+        Asynchronous generator of the tokens read from an asyncio.StreamReader, or any object with a read coroutine, or
+        from an asynchronous iterable of chunks, as in
+
+            async for token in lexer.alex(reader):
+                ...
+
+        It behaves as lex_stream: a token is yielded as soon as it is complete and a token spanning multiple chunks is
+        resumed from the state of the DFA where it was suspended, the event loop being free while the next chunk is
+        awaited.
+        """
+        chunks = aiter_text_chunks(source, chunk_size, encoding)
+        scanner = self._scan_stream(self._emit_stream_token)
+        item = next(scanner, None)
+
+        try:
+            while item is not None:
+                if item is NEED_CHUNK:
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        chunk = None
+
+                    item = self._send_chunk(scanner, chunk)
+                else:
+                    yield item
+                    item = next(scanner, None)
+
+        finally:
+            await chunks.aclose()
+
+    @staticmethod
+    def _send_chunk(scanner, chunk):
+        """
+        Send the next chunk, None at the end of the stream, to a _scan_stream generator and return what it yields next
+        """
+        try:
+            return scanner.send(chunk)
+        except StopIteration:
+            return None
+
+    def _scan_stream(self, emit):
+        """
+        Generator lexing a stream whose chunks are sent to it, used by lex_stream, alex and count. It yields NEED_CHUNK
+        whenever it needs the next chunk, to which the caller answers by sending the chunk, or None once the stream is
+        exhausted. Every match is passed to emit(state, init_pos, init_lineno, offset), offset being the offset of the
+        buffer in the stream, and what emit returns is yielded unless it is None.
+        """
+        table = self.dfa.table
+        accepting = table.accepting
+
+        self.drop_old_buffer()
+
+        # Offset of the current buffer in the stream
+        offset = 0
+        exhausted = False
+
+        while True:
+            if self.pos >= len(self.buffer):
+                chunk = None if exhausted else (yield NEED_CHUNK)
+
+                if chunk is None:
+                    return
+
+                offset += self.pos
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+
+                continue
+
+            init_lineno = self.lineno
+            init_pos = self.pos
+            state = table.start
+
+            while True:
+                state, blocked = self._advance(state, init_pos, init_lineno)
+
+                if blocked or exhausted:
+                    break
+
+                chunk = yield NEED_CHUNK
+
+                if chunk is None:
+                    exhausted = True
+                    break
+
+                # Release the consumed part of the buffer, keeping the suspended token
+                offset += init_pos
+                self.buffer = self.buffer[init_pos:] + chunk
+                self.pos -= init_pos
+                init_pos = 0
+
+            if self.linebreak is not None:
+                self.lineno += self.buffer.count(self.linebreak, init_pos, self.pos)
+
+            if not accepting[state]:
+                raise LexerSyntaxError("Syntax error at line %s" % self.lineno, lineno=self.lineno,
+                                       pos=offset + self.pos)
+
+            item = emit(state, init_pos, init_lineno, offset)
+
+            if item is not None:
+                yield item
+
+    def _emit_stream_token(self, state, init_pos, init_lineno, offset):
+        """
+        Build the token of a match of Lexer._scan_stream and trigger the terminal actions, the pos and end_pos of the
+        token are offsets in the stream
+        """
+        token = self._build_eager_token(state, init_pos, init_lineno)
+
+        if self.terminal_actions:
+            self._trigger_terminal_actions(init_lineno, init_pos, token is None)
+
+        if token is not None:
+            token.pos += offset
+            token.end_pos += offset
+
+        return token
+
+
+class CompiledLexer:
+    """
+    Frozen compiled form of a Lexer class: its DFA, with its tables and the rules their terminals come from, and the
+    options of the lexers lexing with it. It holds no lexing state, the buffer, pos, lineno and params being held by
+    the LexSession objects created by CompiledLexer.session. Since nothing mutates the DFA once the CompiledLexer is
+    created, any number of threads can lex concurrently against it, each with its own sessions.
+    """
+
+    __slots__ = ('lexer_cls', 'dfa', 'engine', 'cache_dir', 'lazy')
+
+    def __init__(self, lexer_cls, engine='dfa', cache_dir=None, lazy=False):
+        dfa = lexer_cls._get_compiled_dfa()
+
+        for name, value in (('lexer_cls', lexer_cls), ('dfa', dfa), ('engine', engine), ('cache_dir', cache_dir),
+                            ('lazy', lazy)):
+            object.__setattr__(self, name, value)
+
+        # Engines are checked and generated scanners loaded once, sessions then only read them from the DFA
+        self.session()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledLexer is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("CompiledLexer is immutable")
+
+    @property
+    def token_types(self):
+        return self.lexer_cls.token_types
+
+    def session(self, buffer=None, params=None):
+        """
+        Return a new LexSession, its params are a deep copy of the given params or of the params of the Lexer class
+        """
+        return LexSession(self, buffer, params)
+
+
+class LexSession:
+    """
+    Lexing state of a CompiledLexer: buffer, pos, lineno and params. A session is a lightweight Lexer instance sharing
+    the DFA of its CompiledLexer, every attribute and method of the Lexer is available on the session. A session must
+    only be used by one thread at a time.
+    """
+
+    __slots__ = ('compiled', '_lexer')
+
+    def __init__(self, compiled, buffer=None, params=None):
+        lexer = compiled.lexer_cls(_dfa=compiled.dfa, lazy=compiled.lazy, engine=compiled.engine,
+                                   cache_dir=compiled.cache_dir)
+
+        if params is not None:
+            lexer.params = copy.deepcopy(params)
+
+        if buffer is not None:
+            lexer.read(buffer)
+
+        object.__setattr__(self, 'compiled', compiled)
+        object.__setattr__(self, '_lexer', lexer)
+
+    def __getattr__(self, name):
+        return getattr(self._lexer, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lexer, name, value)
+
+    def __iter__(self):
+        return iter(self._lexer)
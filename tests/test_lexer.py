@@ -1,12 +1,40 @@
 import unittest
 
+import asyncio
 import copy
-from compyl import Lexer, LexerError
+import io
+import json
+import os
+import struct
+import tempfile
+from compyl import Lexer, TokenArray, LexerError, LexerSyntaxError, set_artifact_directory
+from compyl.lexer import LazyToken
 from compyl.__lexer.metaclass import MetaLexer
+from compyl.__lexer.finite_automaton import DFA
+from compyl.__lexer.dfa_cache import DFACache, dfa_cache
+from compyl.__lexer.artifact import ALIGNMENT, HEADER, get_rules_key, read_artifact, dump_table, load_table
+from compyl.__lexer.errors import LexerArtifactError
+from compyl.__lexer import codegen
 
 FAIL = False
 
 
+def setUpModule():
+    # Generated scanners and artifacts are written to a temporary directory, not to the cache directory of the user
+    cache = tempfile.TemporaryDirectory()
+    unittest.addModuleCleanup(cache.cleanup)
+
+    default_cache_dir, dfa_cache_directory = codegen.DEFAULT_CACHE_DIR, dfa_cache.directory
+    codegen.DEFAULT_CACHE_DIR = os.path.join(cache.name, 'generated')
+    set_artifact_directory(None)
+
+    def restore():
+        codegen.DEFAULT_CACHE_DIR = default_cache_dir
+        set_artifact_directory(dfa_cache_directory)
+
+    unittest.addModuleCleanup(restore)
+
+
 def get_token_stream(lexer, buffer):
     lexer.read(buffer)
     return [token for token in lexer]
@@ -186,6 +214,63 @@ class LexerTestLineRule(unittest.TestCase):
         self.assertEqual(self.lexer.lineno, 3)
 
 
+class LexerTestLinebreak(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class Native(Lexer, linebreak='\n'):
+            WORD = r'\w+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' |\t'
+
+        class Rule(Lexer, line_rule='\n'):
+            WORD = r'\w+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' |\t'
+
+        cls.native_cls = Native
+        cls.rule_cls = Rule
+        cls.buffer = 'some code\n/* a\n\n comment */ code\n\n  more\n'
+
+    def test_same_lines_as_line_rule(self):
+        expected_lexer = self.rule_cls()
+        expected = [(t.type, t.pos, t.lineno) for t in expected_lexer.tokenize_all(self.buffer)]
+
+        for engine in ('auto', 'dfa', 'generated'):
+            lexer = self.native_cls(engine=engine)
+            tokens = [(t.type, t.pos, t.lineno) for t in lexer.tokenize_all(self.buffer)]
+
+            self.assertEqual(tokens, expected)
+            self.assertEqual(lexer.lineno, expected_lexer.lineno)
+
+        lexer = self.native_cls()
+        self.assertEqual([(t.type, t.lineno) for t in lexer.tokenize_bytes(self.buffer.encode())],
+                         [(token_type, lineno) for token_type, _, lineno in expected])
+
+    def test_no_trigger_rule(self):
+        self.assertLess(len(self.native_cls().dfa.table.accepting), len(self.rule_cls().dfa.table.accepting))
+
+        class L(Lexer, linebreak='\r\n'):
+            WORD = r'\w+'
+
+        lexer = L(engine='auto')
+
+        self.assertIsNotNone(lexer._regexp_engine)
+        self.assertEqual([t.lineno for t in lexer.tokenize_all('a\r\nb\r\n\r\nc')], [1, 2, 4])
+        self.assertEqual(lexer.get_column(lexer.buffer.index('c')), 1)
+
+    def test_column(self):
+        lexer = self.native_cls()
+        lexer.tokenize_all(self.buffer)
+
+        self.assertEqual(lexer.get_column(5), 6)
+        self.assertEqual(lexer.get_column(self.buffer.index('more')), 3)
+
+    def test_line_rule_and_linebreak(self):
+        with self.assertRaises(LexerError):
+            class L(Lexer, line_rule='\n', linebreak='\n'):
+                WORD = r'\w+'
+
+
 class LexerTestRegexp(unittest.TestCase):
     def test_match_dot(self):
         class L(Lexer):
@@ -670,6 +755,1366 @@ class VowelCounter(unittest.TestCase):
         self.assertDictEqual(woard.params, {'vowels': 2})
 
 
+class LexerTestDFATable(unittest.TestCase):
+    """
+    Test that the table representation of the DFA agrees with its graph representation
+    """
+
+    def test_table_agrees_with_graph(self):
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            NUMBER = r'[0-9]+'
+            ANY = r'\U0010FFFF|[\U00000F00-\U000F0000]'
+            _ = r' '
+
+        table = L().dfa.table
+        dfa = L().dfa
+
+        for buffer in ('abc', '123', ' ', '\U0010FFFF', '\U00000F00', '\U000F0000', '\U000F0001', 'a1'):
+            dfa.reset_current_state()
+            state = table.start
+
+            for char in buffer:
+                node = dfa.push(char)
+                state = table.transition(state, ord(char))
+
+                self.assertEqual(node is None, state < 0)
+
+                if node is None:
+                    break
+
+            if state >= 0:
+                self.assertEqual(bool(table.accepting[state]), dfa.current_state.terminal_exists())
+
+    def test_unknown_character_class(self):
+        class L(Lexer):
+            A = r'a'
+
+        table = L().dfa.table
+
+        self.assertEqual(table.get_class(ord('b')), 0)
+        self.assertEqual(table.get_class(0x10FFFF), 0)
+        self.assertNotEqual(table.get_class(ord('a')), 0)
+
+
+class LexerTestTokenize(unittest.TestCase):
+    def test_tokenize_matches_lex(self):
+        def count_ignored(t):
+            t.params['ignored'] += 1
+
+        class L(Lexer, line_rule='\n', params={'ignored': 0}, terminal_actions=[(count_ignored, 'only_ignored')]):
+            WORD = r'[a-z]+'
+            NUMBER = r'[0-9]+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' '
+
+        buffer = 'foo 12 /* a\ncomment */\nbar 3'
+
+        expected = get_token_stream(L(), buffer)
+
+        lexer = L()
+        tokens = lexer.tokenize_all(buffer)
+
+        self.assertEqual([(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in tokens],
+                         [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in expected])
+        self.assertEqual(lexer.lineno, 3)
+        self.assertEqual(lexer.params['ignored'], 4)
+
+    def test_tokenize_is_a_generator(self):
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        lexer = L()
+        tokens = lexer.tokenize('foo bar')
+
+        self.assertEqual(next(tokens).value, 'foo')
+        lexer.read(' baz')
+        self.assertEqual([t.value for t in tokens], ['bar', 'baz'])
+
+    def test_long_ignored_sequence(self):
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        buffer = ' ' * 10000 + 'foo'
+
+        self.assertEqual([t.value for t in L().tokenize_all(buffer)], ['foo'])
+        self.assertEqual(get_token_stream_values(L(), buffer), ['foo'])
+
+    def test_tokenize_syntax_error(self):
+        class L(Lexer):
+            WORD = r'[a-z]+'
+
+        self.assertRaises(LexerError, L().tokenize_all, 'foo?')
+
+
+class LexerTestColumnar(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def store_length(t):
+            return len(t.buffer)
+
+        class L(Lexer, line_rule='\n'):
+            WORD = r'[a-z]+'
+            NUMBER = r'[0-9]+', store_length
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'foo 12\nbar 3 baz'
+
+    def test_columnar_matches_tokens(self):
+        expected = self.lexer_cls().tokenize_all(self.buffer)
+        tokens = self.lexer_cls().tokenize_all(self.buffer, columnar=True)
+
+        self.assertIsInstance(tokens, TokenArray)
+        self.assertEqual(len(tokens), len(expected))
+        self.assertEqual([(t.type, t.value, t.pos, t.end_pos, t.lineno, t.params) for t in tokens],
+                         [(t.type, t.value, t.pos, t.end_pos, t.lineno, t.params) for t in expected])
+
+    def test_columns(self):
+        tokens = self.lexer_cls().tokenize_columnar(self.buffer)
+
+        self.assertEqual(tokens.type_names, ['WORD', 'NUMBER'])
+        self.assertEqual(list(tokens.type_ids), [0, 1, 0, 1, 0])
+        self.assertEqual(list(tokens.pos), [0, 4, 7, 11, 13])
+        self.assertEqual(list(tokens.end_pos), [3, 6, 10, 12, 16])
+        self.assertEqual(list(tokens.lineno), [1, 1, 2, 2, 2])
+        self.assertEqual(tokens.params, {1: 16, 3: 16})
+
+    def test_indexing_and_slicing(self):
+        tokens = self.lexer_cls().tokenize_columnar(self.buffer)
+
+        self.assertEqual(tokens[-1].value, 'baz')
+        self.assertRaises(IndexError, tokens.__getitem__, 5)
+
+        sliced = tokens[1::2]
+
+        self.assertIsInstance(sliced, TokenArray)
+        self.assertEqual([t.value for t in sliced.to_tokens()], ['12', '3'])
+        self.assertEqual(sliced.params, {0: 16, 1: 16})
+
+
+class LexerTestLazy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer, line_rule='\n'):
+            WORD = r'[a-z]+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'foo bar\n  baz /* a\ncomment */ qux\nend'
+
+    def test_lazy_matches_eager(self):
+        expected = self.lexer_cls().tokenize_all(self.buffer)
+        tokens = self.lexer_cls(lazy=True).tokenize_all(self.buffer)
+
+        self.assertTrue(all(isinstance(t, LazyToken) for t in tokens))
+        self.assertEqual([(t.type, t.type_id, t.value, t.pos, t.end_pos, t.lineno) for t in tokens],
+                         [(t.type, t.type_id, t.value, t.pos, t.end_pos, t.lineno) for t in expected])
+
+    def test_lazy_column(self):
+        tokens = self.lexer_cls(lazy=True).tokenize_all(self.buffer)
+
+        self.assertEqual([t.column for t in tokens], [1, 5, 3, 7, 12, 1])
+
+    def test_lazy_value_not_sliced(self):
+        token = self.lexer_cls(lazy=True).tokenize_all('foo')[0]
+
+        self.assertIsNone(token._value)
+        self.assertEqual(token.value, 'foo')
+
+    def test_lazy_lex_after_read(self):
+        lexer = self.lexer_cls(lazy=True)
+        lexer.read('foo\n')
+        first = lexer.lex()
+        lexer.read('bar')
+        second = lexer.lex()
+
+        self.assertEqual((first.value, first.lineno), ('foo', 1))
+        self.assertEqual((second.value, second.lineno, second.column), ('bar', 2, 1))
+
+    def test_lazy_copy(self):
+        self.assertTrue(copy.copy(self.lexer_cls(lazy=True)).lazy)
+
+
+class LexerTestTokenTypeIds(unittest.TestCase):
+    def test_token_types(self):
+        def letter_counter(t):
+            pass
+
+        class L(Lexer, line_rule='\n'):
+            _ = r'[a-z]', letter_counter, 'trigger_on_contain'
+            WORD = r'[a-z]+'
+            NUMBER = r'[0-9]+', lambda t: 'param'
+            WORD = r'[A-Z]+'
+            _ = r' '
+
+        self.assertEqual(L.token_types, ('WORD', 'NUMBER'))
+
+        lexer = L()
+        self.assertEqual(lexer.token_types, ('WORD', 'NUMBER'))
+
+        tokens = lexer.tokenize_all('foo 12 BAR')
+        self.assertEqual([t.type_id for t in tokens], [0, 1, 0])
+        self.assertEqual([L.token_types[t.type_id] for t in tokens], [t.type for t in tokens])
+
+    def test_terminal_ids(self):
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        table = L().dfa.table
+        ids = {table.terminal_ids[state] for state in range(table.state_count) if table.accepting[state]}
+
+        self.assertEqual(ids, {0, -1})
+
+    def test_dynamic_types_in_columns(self):
+        def operator(t):
+            return 'PLUS' if t.buffer[t.init_pos] == '+' else 'TIMES'
+
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        rules = [(r'[a-z]+', 'WORD'), (r'[+*]', operator), (r' ', None)]
+        eager = L(_dfa=DFA(rules=rules)).tokenize_all('a + b * c')
+        columns = L(_dfa=DFA(rules=rules)).tokenize_columnar('a + b * c')
+
+        # Dynamic types are registered by the array, but the tokens it builds have no type_id as eager tokens
+        self.assertEqual(columns.type_names, ['WORD', 'PLUS', 'TIMES'])
+        self.assertEqual([t.type_id for t in columns], [t.type_id for t in eager])
+        self.assertEqual([t.type_id for t in eager], [0, None, 0, None, 0])
+
+
+class LexerTestStream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def letter_counter(t):
+            t.params['letters'] += 1
+
+        class L(Lexer, line_rule='\n', params={'letters': 0}):
+            _ = r'[a-z]', letter_counter, 'trigger_on_contain'
+            WORD = '[a-z\u00e9]+'
+            NUMBER = r'[0-9]+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'foo 12 /* a\ncomment */\nbar caf\u00e9 3'
+
+    def get_expected(self):
+        lexer = self.lexer_cls()
+        tokens = lexer.tokenize_all(self.buffer)
+
+        return [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in tokens], lexer.params
+
+    def assertStreamEqual(self, source, **kwargs):
+        expected, expected_params = self.get_expected()
+
+        lexer = self.lexer_cls()
+        tokens = [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in lexer.lex_stream(source, **kwargs)]
+
+        self.assertEqual(tokens, expected)
+        self.assertEqual(lexer.params, expected_params)
+        self.assertEqual(lexer.lineno, 3)
+
+    def test_stream_single_characters(self):
+        self.assertStreamEqual(iter(self.buffer))
+
+    def test_stream_file(self):
+        self.assertStreamEqual(io.StringIO(self.buffer), chunk_size=3)
+
+    def test_stream_bytes(self):
+        encoded = self.buffer.encode('utf-8')
+        self.assertStreamEqual(encoded[i:i + 1] for i in range(len(encoded)))
+
+    def test_stream_binary_file(self):
+        self.assertStreamEqual(io.BytesIO(self.buffer.encode('latin-1')), chunk_size=5, encoding='latin-1')
+
+    def test_stream_releases_buffer(self):
+        lexer = self.lexer_cls()
+
+        for _ in lexer.lex_stream(['foo bar '] * 1000, chunk_size=8):
+            self.assertLess(len(lexer.buffer), 20)
+
+    def test_stream_syntax_error(self):
+        lexer = self.lexer_cls()
+
+        with self.assertRaises(LexerSyntaxError) as context:
+            list(lexer.lex_stream(['foo b', 'ar ?'], chunk_size=8))
+
+        self.assertEqual(context.exception.pos, 8)
+
+    def alex_all(self, lexer, source, **kwargs):
+        async def collect():
+            return [(t.type, t.value, t.pos, t.end_pos, t.lineno) async for t in lexer.alex(source, **kwargs)]
+
+        return asyncio.run(collect())
+
+    def test_alex_async_iterator(self):
+        expected, expected_params = self.get_expected()
+        encoded = self.buffer.encode('utf-8')
+
+        async def chunks():
+            for i in range(0, len(encoded), 2):
+                await asyncio.sleep(0)
+                yield encoded[i:i + 2]
+
+        lexer = self.lexer_cls()
+
+        self.assertEqual(self.alex_all(lexer, chunks()), expected)
+        self.assertEqual(lexer.params, expected_params)
+        self.assertEqual(lexer.lineno, 3)
+
+    def test_alex_stream_reader(self):
+        expected, _ = self.get_expected()
+        lexer = self.lexer_cls()
+
+        async def run():
+            reader = asyncio.StreamReader()
+            tokens = []
+
+            async def feed():
+                for char in self.buffer:
+                    reader.feed_data(char.encode('utf-8'))
+                    await asyncio.sleep(0)
+
+                reader.feed_eof()
+
+            feeder = asyncio.ensure_future(feed())
+
+            async for t in lexer.alex(reader, chunk_size=4):
+                tokens.append((t.type, t.value, t.pos, t.end_pos, t.lineno))
+
+            await feeder
+
+            return tokens
+
+        self.assertEqual(asyncio.run(run()), expected)
+
+    def test_alex_syntax_error(self):
+        async def chunks():
+            yield 'foo b'
+            yield 'ar ?'
+
+        with self.assertRaises(LexerSyntaxError) as context:
+            self.alex_all(self.lexer_cls(), chunks())
+
+        self.assertEqual(context.exception.pos, 8)
+
+
+class LexerTestMappedFile(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer, line_rule='\n'):
+            WORD = '[a-z\u00e9\u20ac\U0001F600]+'
+            NUMBER = r'[0-9]+'
+            _ = r' '
+
+        cls.lexer_cls = L
+
+    def lex_file_content(self, content, encoding='utf-8'):
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(content.encode(encoding))
+
+        try:
+            return list(self.lexer_cls().lex_file(file.name, encoding=encoding))
+        finally:
+            os.remove(file.name)
+
+    def test_lex_file_utf8(self):
+        content = 'caf\u00e9 12\n\u20ac\U0001F600 a'
+        tokens = self.lex_file_content(content)
+
+        self.assertEqual([t.value for t in tokens], ['caf\u00e9', '12', '\u20ac\U0001F600', 'a'])
+        self.assertEqual([(t.pos, t.end_pos) for t in tokens], [(0, 5), (6, 8), (9, 16), (17, 18)])
+        self.assertEqual([t.lineno for t in tokens], [1, 1, 2, 2])
+
+    def test_lex_file_latin1(self):
+        tokens = self.lex_file_content('caf\u00e9 12', encoding='latin-1')
+
+        self.assertEqual([t.value for t in tokens], ['caf\u00e9', '12'])
+        self.assertEqual([(t.pos, t.end_pos) for t in tokens], [(0, 4), (5, 7)])
+
+    def test_lex_empty_file(self):
+        self.assertEqual(self.lex_file_content(''), [])
+
+    def test_lex_file_restores_buffer(self):
+        lexer = self.lexer_cls()
+        lexer.read('foo')
+
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(b'bar')
+
+        try:
+            self.assertEqual([t.value for t in lexer.lex_file(file.name)], ['bar'])
+        finally:
+            os.remove(file.name)
+
+        self.assertEqual([t.value for t in lexer], ['foo'])
+
+    def test_lex_file_unsupported_encoding(self):
+        self.assertRaises(LexerError, self.lex_file_content, 'foo', encoding='utf-16')
+
+    def test_lex_file_ascii(self):
+        self.assertEqual([t.value for t in self.lex_file_content('foo 12', encoding='ascii')], ['foo', '12'])
+
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write('foo caf\u00e9'.encode('latin-1'))
+
+        self.addCleanup(os.remove, file.name)
+
+        # Rejected before any token is yielded
+        with self.assertRaises(LexerError) as context:
+            next(self.lexer_cls().lex_file(file.name, encoding='ascii'))
+
+        self.assertIn('offset 7', str(context.exception))
+
+    def test_lex_file_closes_mapping(self):
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(b'foo bar baz')
+
+        self.addCleanup(os.remove, file.name)
+        tokens = self.lexer_cls().lex_file(file.name)
+        first = next(tokens)
+        mapped = first.mapped
+        tokens.close()
+
+        # The mapping is closed, the values of the tokens still referenced were decoded before
+        self.assertTrue(mapped.closed)
+        self.assertIsNone(first.mapped)
+        self.assertEqual(first.value, 'foo')
+
+
+class LexerTestBytes(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer, line_rule='\n'):
+            WORD = '[a-z\u00e9]+'
+            CEDILLA = '\u00e7'
+            SYMBOL = '\u20ac|\U0001F600'
+            _ = r' '
+            OTHER = r'.'
+
+        cls.lexer_cls = L
+
+    def assertBytesMatchStr(self, buffer, encoding='utf-8'):
+        expected = self.lexer_cls().tokenize_all(buffer)
+        tokens = list(self.lexer_cls().tokenize_bytes(buffer.encode(encoding), encoding=encoding))
+
+        self.assertEqual([(t.type, t.value.decode(encoding), t.lineno) for t in tokens],
+                         [(t.type, t.value, t.lineno) for t in expected])
+        self.assertEqual([(t.pos, t.end_pos) for t in tokens],
+                         [(len(buffer[:t.pos].encode(encoding)), len(buffer[:t.end_pos].encode(encoding)))
+                          for t in expected])
+
+    def test_utf8(self):
+        self.assertBytesMatchStr('caf\u00e9 \u20ac\U0001F600\nx\u00e7\u00e9\u00e7 \u0100\U0010FFFF')
+
+    def test_latin1(self):
+        self.assertBytesMatchStr('caf\u00e9 \u00e7\u00ff\nx', encoding='latin-1')
+
+    def test_bytes_like(self):
+        data = bytearray('caf\u00e9 x'.encode('utf-8'))
+
+        self.assertEqual([t.value for t in self.lexer_cls().tokenize_bytes(data)], [b'caf\xc3\xa9', b'x'])
+        self.assertEqual([t.value for t in self.lexer_cls().tokenize_bytes(memoryview(data))],
+                         [b'caf\xc3\xa9', b'x'])
+
+    def test_invalid_utf8(self):
+        for data in (b'\xed\xa0\x80', b'\xc0\x80', b'a\xc3'):
+            self.assertRaises(LexerError, list, self.lexer_cls().tokenize_bytes(data))
+
+    def test_byte_table_is_cached(self):
+        dfa = self.lexer_cls().dfa
+
+        self.assertIs(dfa.get_byte_table('utf-8'), dfa.get_byte_table('utf-8'))
+        self.assertRaises(LexerError, dfa.get_byte_table, 'utf-16')
+
+
+class LexerTestRegexpEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def skip_digit(t):
+            t.increment_pos()
+
+            return 'SKIP'
+
+        class L(Lexer):
+            IF = r'if'
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+(\.\d+)?'
+            STRING = r'"([^"\\]|\\_)*"'
+            SKIP = r'#', skip_digit
+            _ = r'[ \n]'
+
+        cls.lexer_cls = L
+
+    def test_engine_selection(self):
+        class WithLineRule(Lexer, line_rule='\n'):
+            WORD = r'[a-z]+'
+
+        self.assertIsNotNone(self.lexer_cls(engine='auto')._regexp_engine)
+        self.assertIsNone(self.lexer_cls(engine='dfa')._regexp_engine)
+        self.assertIsNone(WithLineRule(engine='auto')._regexp_engine)
+
+        # The DFA is the default, the backtracking of re is opted into
+        self.assertIsNone(self.lexer_cls()._regexp_engine)
+        self.assertEqual(self.lexer_cls.compile().engine, 'dfa')
+        self.assertRaises(LexerError, WithLineRule, engine='regexp')
+        self.assertRaises(LexerError, self.lexer_cls, engine='nfa')
+
+    def test_same_tokens_as_dfa(self):
+        samples = ['if iffy 12 1.5 "a\\"b" #1x', 'x 1. y', '', 'é', '"unterminated']
+
+        # Syntax errors are compared as well and count as one entry
+        self.assertEqual(self.lexer_cls().verify_engines(samples), 11)
+
+    def test_syntax_error_position(self):
+        buffer = 'abc 1.x'
+
+        for engine in ('regexp', 'dfa'):
+            lexer = self.lexer_cls(engine=engine)
+            tokens = [(t.type, t.value) for t in lexer.tokenize_all('if 12')]
+
+            self.assertEqual(tokens, [('IF', 'if'), ('NUMBER', '12')])
+
+            with self.assertRaises(LexerSyntaxError) as context:
+                self.lexer_cls(engine=engine).tokenize_all(buffer)
+
+            self.assertEqual(context.exception.pos, 6)
+
+    def test_longest_match(self):
+        class L(Lexer):
+            X = r'a|ab'
+            Y = r'ab|b'
+            Z = r'abcd'
+
+        self.assertEqual(L().verify_engines(['ab', 'abab', 'abcdb', 'abcx']), 6)
+
+    def test_verify_engines_reports_difference(self):
+        class L(Lexer):
+            IF = r'if'
+            WORD = r'[a-z]+'
+
+        # The DFA is built apart from the shared one since its engine is altered
+        lexer = L(_dfa=DFA(rules=L.__rules__))
+
+        # Without follow sets, the keyword is returned for the start of the word
+        lexer.dfa.get_regexp_engine().follows = (None, None, None)
+
+        self.assertRaises(LexerError, lexer.verify_engines, ['iffy'])
+
+
+class LexerTestGeneratedScanner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def skip_next(t):
+            t.increment_pos()
+
+        class L(Lexer, line_rule='\n'):
+            IF = r'if'
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+(\.\d+)?'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            ANY = r'~_'
+            _ = r' +'
+            _ = r'\$', skip_next, 'trigger_on_contain'
+
+        cls.lexer_cls = L
+
+    def setUp(self):
+        self.cache = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache.cleanup()
+
+    def test_same_tokens_as_dfa(self):
+        lexer = self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+        samples = ['if iffy 12 1.5\n/* a\n b */ x\n~\n~é', '~$ab', 'x$y z', '1.x', '\u20ac']
+
+        # Syntax errors are compared as well and count as one entry
+        self.assertEqual(lexer.verify_engines(samples, engine='generated'), 14)
+
+    def test_module_is_cached(self):
+        self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+        modules = os.listdir(self.cache.name)
+
+        self.assertEqual(len(modules), 1)
+        self.assertTrue(modules[0].endswith('.py'))
+
+        # The module is imported by a new DFA instead of being generated again
+        lexer = self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+
+        self.assertEqual(os.listdir(self.cache.name), modules)
+        self.assertEqual([t.type for t in lexer.tokenize('if x')], ['IF', 'WORD'])
+
+    def test_unwritable_cache_dir(self):
+        path = os.path.join(self.cache.name, 'file')
+
+        with open(path, 'w'):
+            pass
+
+        lexer = self.lexer_cls(engine='generated', cache_dir=os.path.join(path, 'cache'))
+
+        self.assertEqual([t.type for t in lexer.tokenize('if x')], ['IF', 'WORD'])
+
+    def test_cache_dir_is_private(self):
+        cache_dir = os.path.join(self.cache.name, 'cache')
+        self.lexer_cls(engine='generated', cache_dir=cache_dir)
+
+        self.assertEqual(os.stat(cache_dir).st_mode & 0o777, 0o700)
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "ownership is only checked on platforms with user ids")
+    def test_writable_module_not_imported(self):
+        self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+        path = os.path.join(self.cache.name, os.listdir(self.cache.name)[0])
+
+        # A module any user could have written is not imported, the scanner is generated again
+        with open(path, 'w') as file:
+            file.write('def match(buffer, pos, trigger, lineno):\n    raise AssertionError\n')
+        os.chmod(path, 0o666)
+
+        lexer = self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+
+        self.assertEqual([t.type for t in lexer.tokenize('if x')], ['IF', 'WORD'])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "ownership is only checked on platforms with user ids")
+    def test_shared_cache_dir_not_used(self):
+        os.chmod(self.cache.name, 0o777)
+        lexer = self.lexer_cls(engine='generated', cache_dir=self.cache.name)
+
+        self.assertEqual(os.listdir(self.cache.name), [])
+        self.assertEqual([t.type for t in lexer.tokenize('if x')], ['IF', 'WORD'])
+
+
+class LexerTestParallel(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_words(t):
+            t.params['words'] += 1
+
+        class L(Lexer, line_rule='\n', params={'words': 0}):
+            WORD = r'[a-z]+', count_words
+            NUMBER = r'\d+'
+            SEMICOLON = r';'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.text = ''.join('line %d with words;\n' % index for index in range(200))
+
+    def assertSameTokens(self, tokens, expected):
+        self.assertEqual([(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in tokens],
+                         [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in expected])
+
+    def test_same_tokens_as_sequential(self):
+        lexer = self.lexer_cls()
+        tokens = lexer.tokenize_parallel(self.text, workers=2)
+
+        self.assertSameTokens(tokens, self.lexer_cls().tokenize_all(self.text))
+        self.assertEqual(lexer.lineno, 201)
+
+    def test_sync_pattern(self):
+        text = self.text.replace('\n', ' ')
+
+        for workers in (1, 3):
+            tokens = self.lexer_cls().tokenize_parallel(text, workers=workers, sync=r';', columnar=True)
+
+            self.assertIsInstance(tokens, TokenArray)
+            self.assertSameTokens(tokens, self.lexer_cls().tokenize_all(text))
+
+    def test_params_policy(self):
+        lexer = self.lexer_cls()
+        lexer.tokenize_parallel(self.text, workers=2)
+
+        self.assertEqual(lexer.params, {'words': 0})
+
+        def merge_params(params, chunk_params):
+            params['words'] += chunk_params['words']
+
+        lexer.tokenize_parallel(self.text, workers=2, merge_params=merge_params)
+
+        self.assertEqual(lexer.params, {'words': 600})
+
+    def test_speculative(self):
+        class C(Lexer, line_rule='\n'):
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+(\.\d+)?'
+            STRING = r'"([^"\\]|\\_)*"'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            DIVIDE = r'/'
+            _ = r'[ \n]+'
+
+        text = 'a / 1.5 /* x "y\n z */ "s /* t\n" b\n' * 20
+
+        for workers in (1, 2):
+            self.assertSameTokens(C().tokenize_parallel(text, workers=workers, sync=None), C().tokenize_all(text))
+
+        with self.assertRaises(LexerSyntaxError) as context:
+            C().tokenize_parallel(text + '"a', workers=1, sync=None)
+
+        self.assertEqual(context.exception.pos, len(text) + 2)
+
+    def test_syntax_error_position(self):
+        text = self.text + 'line $'
+
+        with self.assertRaises(LexerSyntaxError) as context:
+            self.lexer_cls().tokenize_parallel(text, workers=1)
+
+        self.assertEqual((context.exception.lineno, context.exception.pos), (201, len(text) - 1))
+
+
+class LexerTestTokenizeMany(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_words(t):
+            t.params['words'] += 1
+
+        class L(Lexer, linebreak='\n', params={'words': 0}):
+            WORD = r'[a-z]+', count_words
+            NUMBER = r'\d+'
+            _ = r'[ \n]'
+
+        cls.lexer_cls = L
+        cls.documents = ['foo 12', 'bar\nbaz', '', '3 qux\n4']
+
+    def describe(self, tokens):
+        return [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in tokens]
+
+    def get_expected(self):
+        return [self.describe(self.lexer_cls().tokenize_all(document)) for document in self.documents]
+
+    def test_same_tokens_as_new_lexers(self):
+        lexer = self.lexer_cls()
+        lexer.read('foo ')
+        next(lexer)
+
+        results = lexer.tokenize_many(iter(self.documents))
+
+        self.assertEqual([self.describe(tokens) for tokens in results], self.get_expected())
+        self.assertEqual((lexer.buffer, lexer.pos, lexer.lineno, lexer.params), ('foo ', 3, 1, {'words': 1}))
+
+    def test_columnar_and_pool(self):
+        for workers in (None, 2):
+            results = self.lexer_cls().tokenize_many(self.documents, columnar=True, workers=workers, batch_size=3)
+
+            self.assertTrue(all(isinstance(tokens, TokenArray) for tokens in results))
+            self.assertEqual([self.describe(tokens) for tokens in results], self.get_expected())
+
+        results = self.lexer_cls().tokenize_many(self.documents, workers=2, batch_size=3)
+        self.assertEqual([self.describe(tokens) for tokens in results], self.get_expected())
+
+    def test_syntax_error(self):
+        for workers in (None, 2):
+            with self.assertRaises(LexerSyntaxError) as context:
+                self.lexer_cls().tokenize_many(['foo', 'bar', 'a\n?'], workers=workers, batch_size=2)
+
+            self.assertEqual((context.exception.document, context.exception.lineno, context.exception.pos), (2, 2, 2))
+
+
+class LexerTestRelex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_words(t):
+            t.params['words'] += 1
+
+        class L(Lexer, line_rule='\n', params={'words': 0}):
+            WORD = r'[a-z]+', count_words
+            NUMBER = r'\d+'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r'[ \n]+'
+
+        cls.lexer_cls = L
+        cls.text = ''.join('word %d\n' % index for index in range(50))
+
+    def assertRelexed(self, start, end, new_text):
+        lexer = self.lexer_cls()
+        tokens = lexer.tokenize_all(self.text, snapshots=True)
+        changed = lexer.relex(tokens, start, end, new_text)
+
+        expected_lexer = self.lexer_cls()
+        expected = expected_lexer.tokenize_all(self.text[:start] + new_text + self.text[end:])
+
+        self.assertEqual([(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in tokens],
+                         [(t.type, t.value, t.pos, t.end_pos, t.lineno) for t in expected])
+        self.assertEqual((lexer.lineno, lexer.params), (expected_lexer.lineno, expected_lexer.params))
+
+        return changed
+
+    def test_local_edit(self):
+        # 'word 3' becomes 'words 3', only that token is relexed
+        self.assertEqual(self.assertRelexed(25, 25, 's'), (6, 7, 7))
+
+    def test_edit_changing_lines(self):
+        self.assertEqual(self.assertRelexed(7, 7, '\n\n'), (2, 2, 2))
+        self.assertEqual(self.assertRelexed(7, 7, '1 2\n'), (2, 2, 4))
+
+    def test_edit_changing_params(self):
+        # Every following word sees a different count, thus the tokens never resynchronize
+        self.assertEqual(self.assertRelexed(0, 0, 'a '), (0, 100, 101))
+
+    def test_syntax_error_keeps_tokens(self):
+        lexer = self.lexer_cls()
+        tokens = lexer.tokenize_all(self.text, snapshots=True)
+        expected = [(t.type, t.pos) for t in tokens]
+
+        with self.assertRaises(LexerSyntaxError):
+            lexer.relex(tokens, 7, 7, '/*')
+
+        self.assertEqual([(t.type, t.pos) for t in tokens], expected)
+        self.assertEqual((lexer.buffer, lexer.lineno, lexer.params), (self.text, 51, {'words': 50}))
+
+    def test_requires_snapshots(self):
+        lexer = self.lexer_cls()
+        tokens = lexer.tokenize_all(self.text)
+
+        with self.assertRaises(LexerError):
+            lexer.relex(tokens, 20, 21, 'x')
+
+    def test_edit_at_start_keeps_initial_params(self):
+        lexer = self.lexer_cls()
+        lexer.params['words'] = 100
+        tokens = lexer.tokenize_all(self.text, snapshots=True)
+
+        # Relexing from the start of the buffer restores the params lexing started with, not those of the class
+        self.assertEqual(lexer.relex(tokens, 0, 4, 'text'), (0, 1, 1))
+        self.assertEqual(lexer.params, {'words': 150})
+        self.assertEqual(tokens[0].value, 'text')
+
+
+class LexerTestEmission(unittest.TestCase):
+    def test_terminal_kinds(self):
+        from compyl.__lexer.dfa_table import IGNORED_TERMINAL, STATIC_TERMINAL, CALLED_TERMINAL
+
+        class L(Lexer):
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+', lambda t: int(t.buffer[t.init_pos:t.pos])
+            _ = r' '
+
+        lexer = L()
+        table = lexer.dfa.table
+        kinds = {table.terminals[state].token_type: table.terminal_kinds[state]
+                 for state in range(table.state_count) if table.accepting[state]}
+
+        self.assertEqual(kinds, {'WORD': STATIC_TERMINAL, 'NUMBER': CALLED_TERMINAL, None: IGNORED_TERMINAL})
+        self.assertEqual([(t.type, t.params) for t in lexer.tokenize_all('ab 12')], [('WORD', None), ('NUMBER', 12)])
+
+    def test_terminal_actions_order(self):
+        def action(name):
+            def trigger(t):
+                t.params['calls'].append((name, t.init_pos))
+
+            return trigger
+
+        class L(Lexer, params={'calls': []}, terminal_actions=[
+            (action('tokens'), 'only_tokens'), action('always'), (action('ignored'), 'only_ignored')
+        ]):
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        lexer = L()
+        lexer.tokenize_all('a b')
+
+        self.assertEqual(lexer.params['calls'], [('tokens', 0), ('always', 0), ('always', 1), ('ignored', 1),
+                                                 ('tokens', 2), ('always', 2)])
+
+
+class LexerTestSelection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_numbers(t):
+            t.params['numbers'] += 1
+
+        class L(Lexer, line_rule='\n', params={'numbers': 0}):
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+', count_numbers
+            PLUS = r'\+'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'a + 1 +\nb 22'
+
+    def assertSelected(self, expected_types, **kwargs):
+        expected = [(t.type, t.value, t.pos, t.lineno) for t in self.lexer_cls().tokenize_all(self.buffer)
+                    if t.type in expected_types]
+
+        for columnar in (False, True):
+            lexer = self.lexer_cls()
+            tokens = lexer.tokenize_all(self.buffer, columnar=columnar, **kwargs)
+
+            self.assertEqual([(t.type, t.value, t.pos, t.lineno) for t in tokens], expected)
+            self.assertEqual((lexer.params, lexer.lineno), ({'numbers': 2}, 2))
+
+    def test_only(self):
+        self.assertSelected({'WORD'}, only=['WORD'])
+        self.assertSelected({'PLUS'}, only={'PLUS', 'MINUS'})
+
+        with self.assertRaises(LexerError):
+            self.lexer_cls().tokenize_all(self.buffer, only='WORD')
+
+    def test_exclude(self):
+        self.assertSelected({'WORD', 'PLUS'}, exclude={'NUMBER'})
+        self.assertSelected({'NUMBER'}, only={'NUMBER', 'PLUS'}, exclude=['PLUS'])
+
+    def test_select_states(self):
+        from compyl.__lexer.dfa_table import UNSELECTED_STATE, SELECTED_STATE, UNRESOLVED_STATE
+
+        def operator(t):
+            return 'PLUS' if t.buffer[t.init_pos] == '+' else 'TIMES'
+
+        table = DFA(rules=[(r'[a-z]+', 'WORD'), (r'\d+', 'NUMBER'), (r'[+*]', operator), (r' ', None)]).table
+        selection = table.select_states(lambda token_type: token_type == 'WORD')
+        selected = {table.terminals[state]: selection[state]
+                    for state in range(table.state_count) if table.accepting[state]}
+
+        self.assertEqual(selected, {'WORD': SELECTED_STATE, 'NUMBER': UNSELECTED_STATE, operator: UNRESOLVED_STATE,
+                                    None: UNSELECTED_STATE})
+
+
+class LexerTestCount(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_numbers(t):
+            t.params['numbers'] += 1
+
+        class L(Lexer, line_rule='\n', params={'numbers': 0}):
+            WORD = '[a-z\u00e9]+'
+            NUMBER = r'\d+', count_numbers
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.text = ''.join('caf\u00e9 %d ab\n' % index for index in range(30))
+
+    def assertCounts(self, counts, unit=1):
+        self.assertEqual(counts.counts, {'WORD': 60, 'NUMBER': 30})
+        self.assertEqual(counts.lengths, {'WORD': 30 * (3 + unit) + 60, 'NUMBER': 10 + 40})
+        self.assertEqual(counts.linebreaks, 30)
+        self.assertEqual(counts.total, 90)
+
+    def test_count_string(self):
+        lexer = self.lexer_cls()
+        counts = lexer.count(self.text, histograms=True)
+
+        self.assertCounts(counts)
+        self.assertEqual(counts.histograms['WORD'], {2: 30, 4: 30})
+        self.assertEqual(counts.histograms['NUMBER'], {1: 10, 2: 20})
+        self.assertEqual((lexer.params, lexer.lineno), ({'numbers': 30}, 31))
+
+    def test_count_bytes_and_stream(self):
+        encoded = self.text.encode('utf-8')
+
+        self.assertCounts(self.lexer_cls().count(encoded), unit=2)
+        self.assertCounts(self.lexer_cls().count(encoded[i:i + 3] for i in range(0, len(encoded), 3)))
+        self.assertIsNone(self.lexer_cls().count(io.StringIO(self.text), chunk_size=7).histograms)
+
+    def test_count_parallel(self):
+        lexer = self.lexer_cls()
+        counts = lexer.count(self.text, histograms=True, workers=2)
+
+        self.assertCounts(counts)
+        self.assertEqual(counts.histograms['NUMBER'], {1: 10, 2: 20})
+        self.assertEqual(lexer.lineno, 31)
+
+
+class LexerTestRecovery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer, linebreak='\n'):
+            WORD = r'[a-z]+'
+            STRING = r'"[a-z ]*"'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'ab ?? cd "ef\ngh ! ij'
+
+    def tokenize(self, recover, engine='auto', **kwargs):
+        tokens = self.lexer_cls(engine=engine).tokenize_all(self.buffer, recover=recover, **kwargs)
+        return [(t.type, t.value, t.pos, t.lineno) for t in tokens]
+
+    def test_recover_strategies(self):
+        for engine in ('auto', 'dfa'):
+            self.assertEqual(self.tokenize('char', engine), [
+                ('WORD', 'ab', 0, 1), ('ERROR', '?', 3, 1), ('ERROR', '?', 4, 1), ('WORD', 'cd', 6, 1),
+                ('ERROR', '"', 9, 1), ('WORD', 'ef', 10, 1), ('WORD', 'gh', 13, 2), ('ERROR', '!', 16, 2),
+                ('WORD', 'ij', 18, 2)
+            ])
+
+            self.assertEqual(self.tokenize('start', engine)[1:3], [('ERROR', '??', 3, 1), ('WORD', 'cd', 6, 1)])
+
+            self.assertEqual(self.tokenize(r'\n', engine), [
+                ('WORD', 'ab', 0, 1), ('ERROR', '?? cd "ef\n', 3, 1), ('WORD', 'gh', 13, 2), ('ERROR', '! ij', 16, 2)
+            ])
+
+    def test_error_list(self):
+        for columnar in (False, True):
+            errors = []
+            tokens = self.tokenize('start', errors=errors, columnar=columnar)
+
+            self.assertEqual([t[1] for t in tokens], ['ab', 'cd', 'ef', 'gh', 'ij'])
+            self.assertEqual([(t.type, t.value, t.pos, t.lineno) for t in errors],
+                             [('ERROR', '??', 3, 1), ('ERROR', '"', 9, 1), ('ERROR', '!', 16, 2)])
+
+    def test_max_errors(self):
+        self.assertEqual(len(self.tokenize('start', max_errors=3)), 8)
+
+        with self.assertRaises(LexerSyntaxError) as context:
+            self.tokenize('start', max_errors=2)
+
+        self.assertEqual(context.exception.pos, 16)
+
+        with self.assertRaises(LexerError):
+            self.tokenize(42)
+
+
+class LexerTestStats(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def mark_token(t):
+            t.params['marked'] += 1
+
+        class L(Lexer, line_rule='\n', params={'marked': 0}, terminal_actions=[(mark_token, 'only_tokens')]):
+            WORD = r'[a-z]+'
+            NUMBER = r'\d+', lambda t: int(t.buffer[t.init_pos:t.pos])
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'abc 12 de\n' * 3
+
+    def test_stats(self):
+        lexer = self.lexer_cls()
+        stats = lexer.enable_stats()
+        tokens = lexer.tokenize_all(self.buffer)
+
+        self.assertEqual(len(tokens), 9)
+        self.assertEqual((stats.matches, stats.tokens, stats.chars, stats.transitions), (18, 9, 30, 30))
+        self.assertEqual(stats.get_rule_stats(), [('\n', 3, 3), ('\n', 0, 0), ('[a-z]+', 6, 15), (r'\d+', 3, 6),
+                                                  (' ', 6, 6)])
+        self.assertEqual((stats.callback_calls, stats.action_calls, stats.contain_firings), (3, 9, 3))
+        self.assertGreater(stats.elapsed, 0)
+        self.assertEqual(lexer.lineno, 4)
+
+        stats.reset()
+        self.assertEqual((stats.matches, stats.rule_matches, stats.elapsed), (0, [0] * 5, 0))
+
+    def test_stats_with_shared_dfa(self):
+        def make_lexer_cls():
+            class L(Lexer, linebreak='\n'):
+                WORD = r'[a-z]+'
+                NUMBER = r'\d+'
+                _ = r' '
+
+            return L
+
+        first, second = make_lexer_cls()(), make_lexer_cls()()
+        self.assertIs(first.dfa, second.dfa)
+
+        # The terminals of the shared table are those of the first class, the rules are found by index nonetheless
+        stats = second.enable_stats()
+        second.tokenize_all('abc 12 de\n')
+
+        self.assertEqual([rule_stats[1:] for rule_stats in stats.get_rule_stats()], [(1, 1), (2, 5), (1, 2), (2, 2)])
+
+    def test_disable_stats(self):
+        lexer = self.lexer_cls()
+        stats = lexer.enable_stats()
+
+        self.assertIs(lexer.disable_stats(), stats)
+        self.assertIsNone(lexer.stats)
+
+        lexer.tokenize_all(self.buffer)
+
+        self.assertEqual(stats.matches, 0)
+        self.assertNotIn('_scan', vars(lexer))
+
+
+class LexerTestDFAIntrospection(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer):
+            IF = r'if'
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        cls.rules = L.__rules__
+        cls.dfa = DFA(rules=L.__rules__)
+
+    def test_report(self):
+        report = self.dfa.get_report()
+
+        self.assertEqual((report.state_count, report.accepting_count), (5, 4))
+        self.assertEqual(report.transition_count, sum(report.transitions_per_state))
+        self.assertEqual(report.minimal_states, report.state_count)
+        self.assertGreaterEqual(report.dfa_states, report.minimal_states)
+        self.assertGreater(report.nfa_nodes, report.dfa_states)
+        self.assertGreater(report.table_memory, 0)
+        self.assertEqual(list(report.phase_times), ['parse', 'nfa', 'subset', 'minimize', 'graph', 'table'])
+
+        # The regexp engine is only compiled for the lexers which use it
+        self.dfa.get_regexp_engine()
+        self.assertEqual(list(self.dfa.get_report().phase_times)[-1], 'regexp')
+
+        loaded = DFA.from_table(self.dfa.table, self.rules).get_report()
+        self.assertIsNone(loaded.phase_times)
+        self.assertEqual(loaded.transition_count, report.transition_count)
+
+    def test_export(self):
+        exported = json.loads(self.dfa.to_json())
+        start = exported['states'][exported['start']]
+
+        self.assertEqual(exported['token_types'], ['IF', 'WORD'])
+        self.assertEqual(len(exported['states']), 5)
+        self.assertEqual(sorted(interval for transition in start['transitions'] for interval in transition['intervals']),
+                         [[32, 32], [97, 104], [105, 105], [106, 122]])
+
+        dot = self.dfa.to_dot()
+
+        self.assertTrue(dot.startswith('digraph DFA {'))
+        self.assertIn('label="a-h j-z"', dot)
+        self.assertEqual(dot.count('doublecircle'), 4)
+
+        with self.assertRaises(LexerError):
+            DFA().to_dot()
+
+
+class LexerTestDFACache(unittest.TestCase):
+    @staticmethod
+    def make_lexer_cls(keyword):
+        class L(Lexer, line_rule='\n'):
+            KEYWORD = keyword
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        return L
+
+    def test_shared_by_instances(self):
+        L = self.make_lexer_cls('if')
+
+        self.assertIs(L().dfa, L().dfa)
+        self.assertIsNot(copy.deepcopy(L()).dfa, L().dfa)
+
+    def test_identical_rules_share_dfa(self):
+        self.assertIs(self.make_lexer_cls('while')().dfa, self.make_lexer_cls('while')().dfa)
+        self.assertIsNot(self.make_lexer_cls('while')().dfa, self.make_lexer_cls('for')().dfa)
+
+    def test_lru_eviction(self):
+        cache = DFACache(max_size=2)
+        rules = [self.make_lexer_cls(keyword).__rules__ for keyword in ('a', 'b', 'c')]
+
+        first = cache.get(rules[0])
+        second = cache.get(rules[1])
+        self.assertIs(cache.get(rules[0]), first)
+
+        # The second rule set is the least recently used
+        cache.get(rules[2])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get(rules[0]), first)
+        self.assertIsNot(cache.get(rules[1]), second)
+        self.assertLessEqual(len(dfa_cache), dfa_cache.max_size)
+
+
+class LexerTestArtifact(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        class L(Lexer, line_rule='\n'):
+            KEYWORD = r'if|else'
+            WORD = '[a-z\u00e0-\u00ff]+'
+            NUMBER = r'\d+(\.\d+)?', lambda t: 'float' if '.' in t.buffer[t.init_pos:t.pos] else 'int'
+            COMMENT = r'/\*_*\*/', 'non_greedy'
+            _ = r' '
+
+        cls.lexer_cls = L
+        cls.buffer = 'if x /* a\n b */ 1.5 else\n\u00e9t\u00e9 12\n'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.directory = directory.name
+        self.cache = DFACache(directory=self.directory)
+
+    def get_tokens(self, dfa, engine='auto'):
+        return [(t.type, t.value, t.pos, t.lineno, t.params)
+                for t in self.lexer_cls(_dfa=dfa, engine=engine).tokenize_all(self.buffer)]
+
+    def test_load_skips_build(self):
+        built = self.cache.build(self.lexer_cls.__rules__)
+        loaded = self.cache.build(self.lexer_cls.__rules__)
+
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        self.assertIsNone(loaded.start)
+        self.assertEqual(loaded.table.terminal_rules, built.table.terminal_rules)
+
+        for engine in ('dfa', 'generated'):
+            self.assertEqual(self.get_tokens(loaded, engine), self.get_tokens(built, engine))
+
+        # The graph is built on demand
+        loaded.reset_current_state()
+        self.assertIsNotNone(loaded.push('i'))
+
+    def test_regexp_engine_is_rebuilt(self):
+        class L(Lexer, linebreak='\n'):
+            KEYWORD = r'if'
+            WORD = r'[a-z]+'
+            _ = r' '
+
+        self.cache.build(L.__rules__)
+        loaded = self.cache.build(L.__rules__)
+
+        self.assertIsNotNone(loaded.get_regexp_engine())
+        self.assertEqual(L(_dfa=loaded).verify_engines(['if iffy\nfi', 'if1']), 5)
+
+    def test_corrupted_artifact_is_replaced(self):
+        self.cache.build(self.lexer_cls.__rules__)
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+
+        with open(path, 'r+b') as file:
+            file.truncate(100)
+
+        with self.assertRaises(LexerArtifactError):
+            read_artifact(path, self.lexer_cls.__rules__)
+
+        self.assertEqual(self.get_tokens(self.cache.build(self.lexer_cls.__rules__)),
+                         self.get_tokens(DFA(rules=self.lexer_cls.__rules__)))
+        self.assertIsNotNone(read_artifact(path, self.lexer_cls.__rules__))
+
+    def test_forged_artifact_is_rejected(self):
+        rules = self.lexer_cls.__rules__
+        table = DFA(rules=rules).table
+        data = dump_table(table, rules)
+
+        def forge(**changes):
+            magic, version, size = HEADER.unpack_from(data)
+            metadata = json.loads(data[HEADER.size:HEADER.size + size])
+            metadata.update(changes)
+
+            encoded = json.dumps(metadata).encode('utf-8')
+            encoded += b' ' * (-(HEADER.size + len(encoded)) % ALIGNMENT)
+
+            return HEADER.pack(magic, version, len(encoded)) + encoded + data[HEADER.size + size:]
+
+        self.assertIsNotNone(load_table(forge(), rules))
+
+        state_count = table.state_count
+
+        for changes in ({'start': state_count}, {'class_count': table.class_count + 1},
+                        {'terminals': [len(rules)] * state_count}, {'terminals': [-1] * state_count},
+                        {'terminals': [None] * (state_count - 1)}, {'special_actions': [[0]] * (state_count + 1)},
+                        {'terminal_rules': [len(rules)] * state_count}, {'token_types': [1]}):
+            with self.assertRaises(LexerArtifactError):
+                load_table(forge(**changes), rules)
+
+        # A transition to a state which does not exist
+        metadata_size = HEADER.unpack_from(data)[2]
+        metadata = json.loads(data[HEADER.size:HEADER.size + metadata_size])
+        offset = next(offset for name, _, offset, _ in metadata['arrays'] if name == 'transitions')
+        position = HEADER.size + metadata_size + offset
+        forged = data[:position] + struct.pack('=i', state_count) + data[position + 4:]
+
+        with self.assertRaises(LexerArtifactError):
+            load_table(forged, rules)
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "ownership is only checked on platforms with user ids")
+    def test_writable_artifact_not_read(self):
+        self.cache.build(self.lexer_cls.__rules__)
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        os.chmod(path, 0o666)
+
+        self.assertIsNotNone(self.cache.build(self.lexer_cls.__rules__).start)
+
+    def test_set_artifact_directory(self):
+        def make_lexer_cls():
+            class L(Lexer):
+                SET = r'artifact'
+                WORD = r'[a-z]+'
+                _ = r' '
+
+            return L
+
+        set_artifact_directory(self.directory)
+        self.addCleanup(set_artifact_directory, None)
+        self.addCleanup(dfa_cache.clear)
+
+        make_lexer_cls()()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        # As in another process, the DFA is loaded from its artifact instead of being built
+        dfa_cache.clear()
+        lexer = make_lexer_cls()()
+
+        self.assertIsNone(lexer.dfa.start)
+        self.assertEqual([t.type for t in lexer.tokenize('artifact x')], ['SET', 'WORD'])
+
+    def test_key_depends_on_patterns_and_tags(self):
+        rules = self.lexer_cls.__rules__
+        keys = {get_rules_key(rules), get_rules_key(rules[:-1]), get_rules_key(rules[:-1] + [(r'  ', None)]),
+                get_rules_key([rule[:2] for rule in rules])}
+
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(get_rules_key(rules), get_rules_key(list(rules)))
+
+
+class LexerTestCompiledLexer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        def count_words(t):
+            t.params['words'] += 1
+
+        class L(Lexer, linebreak='\n', params={'words': 0}):
+            WORD = r'[a-z]+', count_words
+            NUMBER = r'\d+'
+            _ = r' '
+
+        cls.lexer_cls = L
+
+    def test_frozen(self):
+        compiled = self.lexer_cls.compile()
+
+        self.assertIs(compiled.dfa, self.lexer_cls().dfa)
+
+        with self.assertRaises(AttributeError):
+            compiled.engine = 'dfa'
+
+        with self.assertRaises(LexerError):
+            self.lexer_cls.compile(engine='unknown')
+
+    def test_sessions(self):
+        cache = tempfile.TemporaryDirectory()
+        self.addCleanup(cache.cleanup)
+
+        compiled = self.lexer_cls.compile(engine='generated', cache_dir=cache.name)
+        first = compiled.session('ab 12\ncd')
+        second = compiled.session('ef', params={'words': 10})
+
+        self.assertEqual([t.type for t in first], ['WORD', 'NUMBER', 'WORD'])
+        self.assertEqual(second.tokenize_all(' gh')[-1].value, 'gh')
+        self.assertEqual((first.params, first.lineno), ({'words': 2}, 2))
+        self.assertEqual(second.params, {'words': 12})
+
+        second.pos = 0
+        self.assertEqual(len(second.tokenize_all()), 2)
+
+    def test_concurrent_sessions(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        compiled = self.lexer_cls.compile()
+        texts = [''.join('w%d %d\n' % (index, number) for number in range(200)).replace('w', 'x' * index)
+                 for index in range(1, 9)]
+
+        def lex(text):
+            session = compiled.session()
+            return [(t.type, t.value, t.lineno) for t in session.tokenize(text)], session.params
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lex, texts))
+
+        for text, result in zip(texts, results):
+            lexer = self.lexer_cls()
+            self.assertEqual(result, ([(t.type, t.value, t.lineno) for t in lexer.tokenize(text)], lexer.params))
+
+
 class IgnoredSequences(unittest.TestCase):
     def test_ignore_comments(self):
         class CommentLexer(Lexer, line_rule='\n'):
@@ -2,8 +2,15 @@ import unittest
 
 import copy
 from compyl.__parser.finite_automaton import Token
-from compyl import ParserBuildError, ParserSyntaxError, GrammarError
+from compyl import ParserBuildError, ParserSyntaxError, GrammarError, set_artifact_directory
 from compyl import Parser as P
+from compyl.__lexer.dfa_cache import dfa_cache
+
+
+def setUpModule():
+    # The lexers built by the tests do not store artifacts in the cache directory of the user
+    unittest.addModuleCleanup(set_artifact_directory, dfa_cache.directory)
+    set_artifact_directory(None)
 
 
 # =========================================================